@@ -0,0 +1,147 @@
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+import zlib
+from typing import Dict, Optional
+
+
+class BlockCache:
+    """Notion块的本地持久化缓存
+
+    以 (block_id, last_edited_time) 为键,保存页面信息及其内容子树
+    (子树中的子页面只保留块本身,由各自的缓存条目提供内容)。
+    总大小超过上限时按最近访问时间淘汰。
+    """
+
+    def __init__(self, cache_dir: str = ".notion_cache", max_bytes: int = 200 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.logger = logging.getLogger("BlockCache")
+        os.makedirs(cache_dir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(cache_dir, "blocks.sqlite"))
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS blocks (
+                block_id TEXT NOT NULL,
+                last_edited_time TEXT NOT NULL,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (block_id, last_edited_time)
+            )"""
+        )
+        self.conn.commit()
+
+    def get(self, block_id: str, last_edited_time: str) -> Optional[Dict]:
+        """读取指定版本,未命中返回None"""
+        row = self.conn.execute(
+            "SELECT data FROM blocks WHERE block_id = ? AND last_edited_time = ?",
+            (block_id, last_edited_time)
+        ).fetchone()
+        if row is None:
+            return None
+        self._touch(block_id, last_edited_time)
+        return json.loads(zlib.decompress(row[0]))
+
+    def get_latest(self, block_id: str) -> Optional[Dict]:
+        """读取最新版本,用于离线模式下没有时间戳的根页面"""
+        row = self.conn.execute(
+            "SELECT last_edited_time, data FROM blocks WHERE block_id = ? "
+            "ORDER BY last_edited_time DESC LIMIT 1",
+            (block_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._touch(block_id, row[0])
+        return json.loads(zlib.decompress(row[1]))
+
+    def put(self, block_id: str, last_edited_time: str, entry: Dict):
+        """写入一个版本,同一块的旧版本会被替换"""
+        data = zlib.compress(json.dumps(entry, ensure_ascii=False).encode('utf-8'))
+        with self.conn:
+            self.conn.execute("DELETE FROM blocks WHERE block_id = ?", (block_id,))
+            self.conn.execute(
+                "INSERT INTO blocks (block_id, last_edited_time, data, size, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (block_id, last_edited_time, data, len(data), time.time())
+            )
+
+    def evict(self) -> int:
+        """按最近访问时间淘汰,直到总大小不超过上限,返回删除条数"""
+        total = self.stats()['bytes']
+        removed = 0
+        if total <= self.max_bytes:
+            return removed
+
+        rows = self.conn.execute(
+            "SELECT block_id, last_edited_time, size FROM blocks ORDER BY accessed_at"
+        ).fetchall()
+        with self.conn:
+            for block_id, last_edited_time, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self.conn.execute(
+                    "DELETE FROM blocks WHERE block_id = ? AND last_edited_time = ?",
+                    (block_id, last_edited_time)
+                )
+                total -= size
+                removed += 1
+        self.logger.info(f"Evicted {removed} cache entries")
+        return removed
+
+    def stats(self) -> Dict:
+        count, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blocks").fetchone()
+        return {'entries': count, 'bytes': size, 'max_bytes': self.max_bytes}
+
+    def entries(self):
+        return self.conn.execute(
+            "SELECT block_id, last_edited_time, size, accessed_at FROM blocks ORDER BY accessed_at DESC"
+        ).fetchall()
+
+    def clear(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM blocks")
+        self.conn.execute("VACUUM")
+
+    def close(self):
+        self.conn.close()
+
+    def _touch(self, block_id: str, last_edited_time: str):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE blocks SET accessed_at = ? WHERE block_id = ? AND last_edited_time = ?",
+                (time.time(), block_id, last_edited_time)
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or clear the local Notion block cache')
+    parser.add_argument('--cache-dir', type=str, default='.notion_cache', help='Cache directory')
+    parser.add_argument('--max-mb', type=int, default=200, help='Size limit used by evict')
+    parser.add_argument('command', choices=['stats', 'list', 'evict', 'clear'])
+    args = parser.parse_args()
+
+    cache = BlockCache(args.cache_dir, max_bytes=args.max_mb * 1024 * 1024)
+    try:
+        if args.command == 'stats':
+            stats = cache.stats()
+            print(f"Entries: {stats['entries']}")
+            print(f"Size: {stats['bytes'] / 1024 / 1024:.2f} MB / {stats['max_bytes'] / 1024 / 1024:.0f} MB")
+        elif args.command == 'list':
+            for block_id, last_edited_time, size, accessed_at in cache.entries():
+                accessed = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(accessed_at))
+                print(f"{block_id}  {last_edited_time}  {size:>8}  {accessed}")
+        elif args.command == 'evict':
+            print(f"Evicted {cache.evict()} entries")
+        elif args.command == 'clear':
+            cache.clear()
+            print("Cache cleared")
+    finally:
+        cache.close()
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,2 @@
+# 根目录下的 test_*.py 是手动运行的连接检查脚本,导入时就会访问Notion,不作为测试收集
+collect_ignore = ['test_notion_connection.py', 'test_token_permissions.py']
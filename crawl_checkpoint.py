@@ -0,0 +1,63 @@
+import json
+import logging
+import os
+from typing import Dict, Optional
+
+
+class CrawlCheckpoint:
+    """抓取进度检查点
+
+    每抓完一个页面就向 jsonl 文件追加一行 (页面, 内容子树),并立即落盘。
+    抓取中断(进程被取消或请求重试后仍失败)后,下次抓取直接使用已完成的页面,
+    只请求尚未完成的部分。整次抓取成功后删除检查点。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}  # page_id -> (last_edited_time, entry)
+        self.file = None
+        self.logger = logging.getLogger("CrawlCheckpoint")
+        self._load()
+
+    def get(self, page_id: str, last_edited_time: str) -> Optional[Dict]:
+        """读取已完成的页面,时间戳不一致(页面又被编辑过)时返回None"""
+        stored = self.entries.get(page_id)
+        if stored is None or stored[0] != last_edited_time:
+            return None
+        return stored[1]
+
+    def add(self, page_id: str, last_edited_time: str, entry: Dict):
+        self.entries[page_id] = (last_edited_time, entry)
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self.file = open(self.path, 'a', encoding='utf-8')
+        record = {'id': page_id, 'last_edited_time': last_edited_time, 'entry': entry}
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def clear(self):
+        """抓取完成,删除检查点"""
+        self.close()
+        self.entries = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 中断时最后一行可能没有写完
+                    continue
+                self.entries[record['id']] = (record['last_edited_time'], record['entry'])
+        if self.entries:
+            self.logger.info(f"Resuming crawl with {len(self.entries)} completed pages from {self.path}")
@@ -0,0 +1,135 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+from notion_crawler import strip_child_pages
+
+
+class DebugDumper:
+    """后台写入调试快照
+
+    dump 只把页面放入队列,由后台线程序列化、gzip压缩后写入 debug_dir。
+    快照中的子页面只保留块本身,内容相同的快照按哈希只保存一份。
+    close 时等待队列写完,更新 index.jsonl 并按数量和天数清理旧快照。
+    """
+
+    def __init__(self, debug_dir: str = "notion_debug", max_files: int = 200, max_age_days: int = 14):
+        self.debug_dir = debug_dir
+        self.max_files = max(1, max_files)
+        self.max_age_days = max_age_days
+        self.queue = queue.Queue()
+        self.records = {}  # 快照文件名 -> 索引记录
+        self.logger = logging.getLogger("DebugDumper")
+        os.makedirs(debug_dir, exist_ok=True)
+        self.thread = threading.Thread(target=self._run, name="debug-dumper", daemon=True)
+        self.thread.start()
+
+    def dump(self, page_data: Dict, converted_content: str, file_path: str):
+        """登记一个页面的快照,立即返回"""
+        self.queue.put((time.time(), page_data, converted_content, file_path))
+
+    def close(self):
+        """写完所有快照,更新索引并清理"""
+        if not self.thread.is_alive():
+            return
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                self._write(*item)
+            except Exception as e:
+                self.logger.error(f"Failed to save debug info: {str(e)}")
+        try:
+            self._update_index()
+        except Exception as e:
+            self.logger.error(f"Failed to update debug index: {str(e)}")
+
+    def _write(self, dumped_at: float, page_data: Dict, converted_content: str, file_path: str):
+        page = page_data['page']
+        snapshot = {
+            'page_id': page['id'],
+            'target_file': file_path,
+            'notion_data': {'page': page, 'blocks': strip_child_pages(page_data.get('blocks', []))},
+            'converted_content': converted_content,
+        }
+        data = json.dumps(snapshot, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        filename = f"{hashlib.sha256(data).hexdigest()[:16]}.json.gz"
+        path = os.path.join(self.debug_dir, filename)
+
+        if os.path.exists(path):
+            # 内容未变,只刷新时间,避免被按天数清理
+            os.utime(path)
+        else:
+            # mtime固定为0,相同内容压缩后的字节也相同
+            self._atomic_write(path, gzip.compress(data, mtime=0))
+            self.logger.info(f"Debug info saved to {path}")
+
+        self.records[filename] = {
+            'time': dumped_at,
+            'page_id': page['id'],
+            'title': self._get_title(page),
+            'target_file': file_path,
+            'file': filename,
+        }
+
+    def _update_index(self):
+        """合并本次记录,按数量和天数保留快照,重写索引"""
+        index_path = os.path.join(self.debug_dir, "index.jsonl")
+        records = {record['file']: record for record in self._read_index(index_path)}
+        records.update(self.records)
+        self.records = {}
+
+        cutoff = time.time() - self.max_age_days * 86400
+        ordered = sorted(records.values(), key=lambda record: record['time'], reverse=True)
+        kept = [record for record in ordered[:self.max_files] if record['time'] >= cutoff]
+        kept_files = {record['file'] for record in kept}
+
+        removed = 0
+        for record in ordered:
+            if record['file'] not in kept_files:
+                try:
+                    os.remove(os.path.join(self.debug_dir, record['file']))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+
+        lines = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in kept)
+        self._atomic_write(index_path, lines.encode('utf-8'))
+        if removed:
+            self.logger.info(f"Removed {removed} old debug snapshots")
+
+    def _read_index(self, index_path: str) -> List[Dict]:
+        if not os.path.exists(index_path):
+            return []
+        records = []
+        with open(index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        return records
+
+    def _get_title(self, page: Dict) -> Optional[str]:
+        try:
+            return page['properties']['title']['title'][0]['plain_text']
+        except (KeyError, IndexError):
+            return None
+
+    def _atomic_write(self, path: str, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=self.debug_dir, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
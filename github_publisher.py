@@ -0,0 +1,198 @@
+import base64
+import hashlib
+import logging
+import threading
+from typing import Collection, Dict, List, Optional, Union
+
+from github import InputGitTreeElement
+
+from rate_limit import AdaptiveLimiter
+
+
+def git_blob_sha(content: Union[str, bytes]) -> str:
+    """计算内容作为git blob时的SHA,与远端tree中的SHA可直接比较"""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
+class RemoteTree:
+    """目标分支的文件快照
+
+    每次同步只获取一次分支的递归tree,保存为 path -> blob SHA 的索引,
+    文件是否存在、SHA是多少、内容是否相同都直接查询索引,不再逐个请求。
+    多个发布线程同时首次查询时,索引也只获取一次。
+    """
+
+    def __init__(self, repo, branch: str, limiter: AdaptiveLimiter = None):
+        self.repo = repo
+        self.branch = branch
+        self.limiter = limiter or AdaptiveLimiter('github', 10)
+        self.ref = None
+        self.commit = None
+        self.files = None  # path -> blob SHA
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger("RemoteTree")
+
+    def load(self):
+        """获取分支引用、最新提交及其完整文件列表"""
+        self.ref = self.limiter.call(self.repo.get_git_ref, f"heads/{self.branch}")
+        self.commit = self.limiter.call(self.repo.get_git_commit, self.ref.object.sha)
+        files = {}
+
+        tree = self.limiter.call(self.repo.get_git_tree, self.commit.tree.sha, recursive=True)
+        if tree.raw_data.get('truncated'):
+            # 仓库过大时递归列表会被截断,改为逐个目录获取
+            self.logger.warning("Remote tree listing is truncated, walking directories instead")
+            self._walk(self.commit.tree.sha, files)
+        else:
+            self._add_blobs(files, '', tree.tree)
+
+        # 索引完整后才对其他线程可见
+        self.files = files
+        self.logger.info(f"Loaded remote tree of {self.branch} with {len(self.files)} files")
+
+    def exists(self, path: str) -> bool:
+        return path in self._index()
+
+    def sha(self, path: str) -> Optional[str]:
+        return self._index().get(path)
+
+    def is_unchanged(self, path: str, content: Union[str, bytes]) -> bool:
+        """内容是否与远端文件完全相同"""
+        return self.sha(path) == git_blob_sha(content)
+
+    def paths(self, prefix: str = '') -> List[str]:
+        return [path for path in self._index() if path.startswith(prefix)]
+
+    def read(self, path: str) -> Optional[bytes]:
+        """按SHA读取文件内容,文件不存在时返回None"""
+        sha = self.sha(path)
+        if sha is None:
+            return None
+        blob = self.limiter.call(self.repo.get_git_blob, sha)
+        if blob.encoding == 'base64':
+            return base64.b64decode(blob.content)
+        return blob.content.encode('utf-8')
+
+    def advance(self, commit, staged: Dict[str, Union[str, bytes]], deleted: Collection[str] = ()):
+        """提交成功后就地更新快照,同一次运行中无需重新获取"""
+        self.commit = commit
+        for path, content in staged.items():
+            self.files[path] = git_blob_sha(content)
+        for path in deleted:
+            self.files.pop(path, None)
+
+    def _index(self) -> Dict[str, str]:
+        if self.files is None:
+            with self.lock:
+                if self.files is None:
+                    self.load()
+        return self.files
+
+    def _walk(self, tree_sha: str, files: Dict[str, str]):
+        stack = [('', tree_sha)]
+        while stack:
+            prefix, sha = stack.pop()
+            tree = self.limiter.call(self.repo.get_git_tree, sha)
+            for element in tree.tree:
+                if element.type == 'tree':
+                    stack.append((f"{prefix}{element.path}/", element.sha))
+            self._add_blobs(files, prefix, tree.tree)
+
+    @staticmethod
+    def _add_blobs(files: Dict[str, str], prefix: str, elements):
+        for element in elements:
+            if element.type == 'blob':
+                files[f"{prefix}{element.path}"] = element.sha
+
+
+class GitHubBatchPublisher:
+    """通过Git Data API批量发布文件
+
+    一次同步中的所有改动先暂存在内存中,最后只创建一个tree和一个commit,
+    并移动一次分支引用。文本文件直接内联进tree,只有二进制文件需要单独创建blob。
+    暂存时在本地计算blob SHA,与远端快照中完全相同的文件不会被提交。
+    所有API请求经过共享的 github 限流器。
+    """
+
+    def __init__(self, repo, branch: str, limiter: AdaptiveLimiter = None):
+        self.repo = repo
+        self.branch = branch
+        self.limiter = limiter or AdaptiveLimiter('github', 10)
+        self.remote = RemoteTree(repo, branch, self.limiter)
+        self.staged = {}  # path -> str | bytes
+        self.deleted = set()
+        self.logger = logging.getLogger("GitHubBatchPublisher")
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.staged or self.deleted)
+
+    def stage(self, path: str, content: Union[str, bytes]) -> bool:
+        """暂存一个文件,同一路径以最后一次为准
+
+        内容与远端完全一致时不暂存,返回False。
+        """
+        self.deleted.discard(path)
+        if self.remote.is_unchanged(path, content):
+            self.staged.pop(path, None)
+            return False
+        self.staged[path] = content
+        return True
+
+    def delete(self, path: str) -> bool:
+        """暂存删除一个文件;文件不存在或本次已暂存了新内容时不删除,返回False"""
+        if path in self.staged or not self.remote.exists(path):
+            return False
+        self.deleted.add(path)
+        return True
+
+    def is_staged(self, path: str) -> bool:
+        return path in self.staged
+
+    def exists(self, path: str) -> bool:
+        """文件是否已存在于目标分支"""
+        return self.remote.exists(path)
+
+    def read(self, path: str) -> Optional[bytes]:
+        """读取目标分支上的文件内容,文件不存在时返回None"""
+        return self.remote.read(path)
+
+    def changes(self) -> List[Dict]:
+        """本次暂存的改动列表,用于生成同步日志"""
+        changes = [
+            {'path': path, 'action': 'update' if self.exists(path) else 'create'}
+            for path in self.staged
+        ]
+        return changes + [{'path': path, 'action': 'delete'} for path in sorted(self.deleted)]
+
+    def commit(self, message: str) -> Optional[str]:
+        """把暂存的改动提交为一个commit,返回commit sha;没有改动时返回None"""
+        if not self.has_changes:
+            self.logger.info("Nothing to publish")
+            return None
+
+        base_commit = self.remote.commit
+        elements = []
+        for path, content in self.staged.items():
+            if isinstance(content, bytes):
+                blob = self.limiter.call(self.repo.create_git_blob,
+                                         base64.b64encode(content).decode('ascii'), 'base64')
+                elements.append(InputGitTreeElement(path, '100644', 'blob', sha=blob.sha))
+            else:
+                elements.append(InputGitTreeElement(path, '100644', 'blob', content=content))
+        # sha为null的条目表示删除
+        for path in sorted(self.deleted):
+            elements.append(InputGitTreeElement(path, '100644', 'blob', sha=None))
+
+        tree = self.limiter.call(self.repo.create_git_tree, elements, base_commit.tree)
+        commit = self.limiter.call(self.repo.create_git_commit, message, tree, [base_commit])
+        self.limiter.call(self.remote.ref.edit, commit.sha)
+        self.logger.info(f"Published {len(self.staged)} files and deleted {len(self.deleted)} "
+                         f"on {self.branch} in commit {commit.sha[:7]}")
+
+        self.remote.advance(commit, self.staged, self.deleted)
+        self.staged = {}
+        self.deleted = set()
+        return commit.sha
@@ -0,0 +1,65 @@
+import logging
+
+import httpx
+import requests
+from github import Github
+from requests.adapters import HTTPAdapter
+
+try:
+    import h2  # noqa: F401  httpx的HTTP/2支持依赖h2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class HttpTransport:
+    """Notion、GitHub和图片下载共用的连接池配置
+
+    每个服务只建立一个长连接池,请求之间复用TLS连接,不再每次握手。
+    pool_size 应不小于并发线程数,否则线程会排队等待空闲连接。
+    """
+
+    def __init__(self, pool_size: int = 10, keepalive_expiry: float = 30.0, http2: bool = False,
+                 timeout: float = 30.0):
+        self.pool_size = max(1, pool_size)
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.logger = logging.getLogger("HttpTransport")
+        self.http2 = http2 and HTTP2_AVAILABLE
+        if http2 and not HTTP2_AVAILABLE:
+            self.logger.warning("h2 is not installed, falling back to HTTP/1.1")
+        self._clients = []
+
+    def notion_client(self) -> httpx.Client:
+        """供 notion_client.Client(client=...) 使用的httpx客户端
+
+        base_url、超时和认证头由notion_client设置。
+        """
+        client = httpx.Client(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+                keepalive_expiry=self.keepalive_expiry
+            )
+        )
+        self._clients.append(client)
+        return client
+
+    def github(self, token: str) -> Github:
+        # 重试由共享限流器负责,关闭PyGithub自带的重试
+        return Github(token, retry=None, pool_size=self.pool_size, timeout=int(self.timeout))
+
+    def session(self) -> requests.Session:
+        """带连接池的requests会话,用于下载图片"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        self._clients.append(session)
+        return session
+
+    def close(self):
+        for client in self._clients:
+            client.close()
+        self._clients = []
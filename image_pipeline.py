@@ -0,0 +1,406 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import requests
+
+from pipeline import process_pool
+from rate_limit import AdaptiveLimiter
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # 图片转码是可选功能
+    Image = None
+
+# 文件头 -> 扩展名
+IMAGE_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+]
+IMAGE_EXTENSIONS = ['jpg', 'jpeg', 'png', 'gif', 'webp', 'svg']
+# 转码格式 -> (Pillow格式名, 扩展名)
+TRANSCODE_FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+# 动图和矢量图转码会丢失内容,保持原样
+KEEP_ORIGINAL_EXTENSIONS = ('gif', 'svg')
+# 暂存的图片按内容哈希前16位命名
+_IMAGE_NAME = re.compile(r'/([0-9a-f]{16})\.[A-Za-z0-9]+')
+
+
+def detect_extension(data: bytes, url: str) -> str:
+    """根据文件内容判断图片格式,无法判断时参考URL后缀"""
+    for signature, ext in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return ext
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    ext = url.split('?')[0].rsplit('.', 1)[-1].lower()
+    return ext if ext in IMAGE_EXTENSIONS else 'png'
+
+
+def transcode_image(data: bytes, image_format: str, max_dimension: int, widths: Sequence[int],
+                    quality: int) -> List[Tuple[int, int, str, bytes]]:
+    """重新编码图片并生成多个宽度的版本
+
+    返回 [(宽, 高, 扩展名, 内容)],第一项是限制最大边长后的主图,其余为更窄的版本。
+    在进程池中执行,只依赖参数。
+    """
+    pil_format, ext = TRANSCODE_FORMATS[image_format]
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        if pil_format == 'JPEG' and has_alpha:
+            # JPEG不支持透明,铺在白色背景上
+            rgba = image.convert('RGBA')
+            image = Image.new('RGB', rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel('A'))
+        else:
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        variants = [image]
+        for width in sorted(set(widths), reverse=True):
+            if width < image.width:
+                height = max(1, round(image.height * width / image.width))
+                variants.append(image.resize((width, height), Image.LANCZOS))
+
+        outputs = []
+        for variant in variants:
+            buffer = io.BytesIO()
+            if pil_format == 'JPEG':
+                variant.save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+            else:
+                variant.save(buffer, 'WEBP', quality=quality, method=6)
+            outputs.append((variant.width, variant.height, ext, buffer.getvalue()))
+    return outputs
+
+
+def rewrite_urls(content: str, url_map: Dict[str, str]) -> str:
+    """一次扫描替换正文中的所有图片URL"""
+    if not url_map:
+        return content
+    # 长的URL优先,避免前缀相同的URL被截断替换
+    pattern = re.compile('|'.join(re.escape(url) for url in sorted(url_map, key=len, reverse=True)))
+    return pattern.sub(lambda m: url_map[m.group(0)], content)
+
+
+class ImageCache:
+    """按图片块缓存图片内容
+
+    以 (block_id, last_edited_time) 为键记录图片的内容哈希,内容本身按哈希存放,
+    图片块未变化时后续同步直接读取本地文件,不再访问已过期的签名URL。
+    转码结果以 (原图哈希, 转码参数) 为键保存,同一张图不会重复转码。
+    """
+
+    def __init__(self, cache_dir: str):
+        self.objects_dir = os.path.join(cache_dir, "images", "objects")
+        self.index_dir = os.path.join(cache_dir, "images", "index")
+        self.variants_dir = os.path.join(cache_dir, "images", "variants")
+        for directory in (self.objects_dir, self.index_dir, self.variants_dir):
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, block_id: str, last_edited_time: str) -> Optional[Tuple[bytes, str]]:
+        index_path = self._index_path(block_id, last_edited_time)
+        try:
+            with open(index_path, 'r') as f:
+                digest, ext = f.read().split()
+            with open(os.path.join(self.objects_dir, digest), 'rb') as f:
+                return f.read(), ext
+        except (OSError, ValueError):
+            return None
+
+    def put(self, block_id: str, last_edited_time: str, data: bytes, ext: str):
+        digest = hashlib.sha256(data).hexdigest()
+        object_path = os.path.join(self.objects_dir, digest)
+        if not os.path.exists(object_path):
+            self._atomic_write(object_path, data)
+        self._atomic_write(self._index_path(block_id, last_edited_time), f"{digest} {ext}".encode())
+
+    def get_variants(self, source_digest: str, settings: str) -> Optional[List[Tuple[int, int, str, bytes]]]:
+        """读取某张原图在指定转码参数下的结果"""
+        try:
+            with open(os.path.join(self.variants_dir, f"{source_digest}_{settings}"), 'r') as f:
+                lines = f.read().splitlines()
+            variants = []
+            for line in lines:
+                width, height, ext, digest = line.split()
+                with open(os.path.join(self.objects_dir, digest), 'rb') as f:
+                    variants.append((int(width), int(height), ext, f.read()))
+            return variants or None
+        except (OSError, ValueError):
+            return None
+
+    def put_variants(self, source_digest: str, settings: str, variants: List[Tuple[int, int, str, bytes]]):
+        lines = []
+        for width, height, ext, data in variants:
+            digest = hashlib.sha256(data).hexdigest()
+            object_path = os.path.join(self.objects_dir, digest)
+            if not os.path.exists(object_path):
+                self._atomic_write(object_path, data)
+            lines.append(f"{width} {height} {ext} {digest}")
+        self._atomic_write(os.path.join(self.variants_dir, f"{source_digest}_{settings}"),
+                           '\n'.join(lines).encode())
+
+    def _index_path(self, block_id: str, last_edited_time: str) -> str:
+        return os.path.join(self.index_dir, f"{block_id}_{re.sub(r'[^0-9A-Za-z]', '', last_edited_time)}")
+
+    def _atomic_write(self, path: str, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+class ImagePipeline:
+    """并发下载图片并按内容哈希命名
+
+    抓取过程中每遇到一个图片块就立即在后台下载(prefetch),避免签名URL在
+    转换和发布之前过期;URL已过期时通过 resolve_url 重新获取图片块。
+    下载结果写入 ImageCache,图片块未变化时后续同步不再发起HTTP请求。
+    相同内容的图片无论出现在哪篇文章、哪次同步,都只保存为同一个文件,
+    已存在于目标仓库的文件不会重复上传。
+
+    image_format 为 webp/jpeg 时(需要安装Pillow),下载后在进程池中转码、
+    限制最大边长并生成 widths 中更窄的版本,正文中的 <img> 会补上 srcset 和尺寸。
+
+    抓取线程调用 prefetch,发布线程逐篇调用 process,线程池和进程池在首次使用时创建,
+    整次同步共用,close 时关闭。
+    """
+
+    def __init__(self, images_path: str, url_prefix: str, max_workers: int = 4,
+                 cache: ImageCache = None, resolve_url: Callable[[str], str] = None,
+                 image_format: str = 'original', max_dimension: int = 1920, widths: Sequence[int] = (),
+                 quality: int = 80, process_workers: int = 2, limiter: AdaptiveLimiter = None,
+                 session: requests.Session = None):
+        self.images_path = images_path.rstrip('/')
+        self.url_prefix = url_prefix.rstrip('/')
+        self.max_workers = max(1, max_workers)
+        self.cache = cache
+        self.resolve_url = resolve_url
+        self.image_format = image_format
+        self.max_dimension = max_dimension
+        self.widths = sorted(set(widths))
+        self.quality = quality
+        self.process_workers = max(1, process_workers)
+        self.limiter = limiter or AdaptiveLimiter('images', 20)
+        # 复用连接,避免每张图片都重新建立TLS连接
+        self.session = session or requests.Session()
+        self.futures = {}  # block_id -> Future
+        self.executor = None
+        self.process_executor = None
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger("ImagePipeline")
+
+        if image_format != 'original' and image_format not in TRANSCODE_FORMATS:
+            raise ValueError(f"Unknown image_format: {image_format}")
+        if image_format != 'original' and Image is None:
+            self.logger.warning("Pillow is not installed, images will be published as downloaded")
+            self.image_format = 'original'
+
+    @property
+    def transcoding(self) -> bool:
+        return self.image_format != 'original'
+
+    def prefetch(self, block: Dict):
+        """抓取时的回调: 发现图片块后立即开始下载"""
+        if block.get('type') != 'image' or block['id'] in self.futures:
+            return
+        info = image_info(block)
+        if info is None:
+            return
+        if self.cache and self.cache.get(info['block_id'], info['last_edited_time']):
+            return
+        self.futures[block['id']] = self._submit(info)
+
+    def process(self, images: List[Dict], publisher) -> Dict[str, str]:
+        """取得图片内容并暂存,返回正文的替换表
+
+        原URL -> 博客内路径;转码的图片还有 `src="原URL"` -> 带srcset和尺寸的属性。
+        失败的图片不在替换表中,保留原链接。
+        """
+        unique = list({img['url']: img for img in images}.values())
+        if not unique:
+            return {}
+
+        futures = []
+        for img in unique:
+            future = self.futures.pop(img.get('block_id'), None) or self._submit(img)
+            futures.append((img['url'], future))
+
+        fetched = {}
+        for url, future in futures:
+            result = future.result()
+            if result is not None:
+                fetched[url] = result
+        transcoded = self._transcode(fetched) if self.transcoding else {}
+
+        url_map = {}
+        for url, (data, ext) in fetched.items():
+            if url in transcoded:
+                url_map.update(self._save_variants(publisher, url, transcoded[url]))
+            else:
+                url_map[url] = self._save(publisher, data, ext)
+
+        self.logger.info(f"Processed {len(fetched)}/{len(unique)} images, {len(transcoded)} transcoded")
+        return url_map
+
+    def close(self):
+        with self.lock:
+            executors = (self.executor, self.process_executor)
+            self.executor = self.process_executor = None
+        for executor in executors:
+            if executor:
+                executor.shutdown(wait=True)
+
+    def _submit(self, info: Dict) -> Future:
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            executor = self.executor
+        return executor.submit(self._fetch, info)
+
+    def _processes(self) -> ProcessPoolExecutor:
+        # 逐篇转码时不能每次都重新启动进程
+        with self.lock:
+            if self.process_executor is None:
+                self.process_executor = process_pool(max_workers=self.process_workers)
+            return self.process_executor
+
+    def _fetch(self, info: Dict) -> Optional[Tuple[bytes, str]]:
+        """缓存 -> 原URL -> 重新获取的URL"""
+        block_id = info.get('block_id')
+        last_edited_time = info.get('last_edited_time')
+        if self.cache and block_id and last_edited_time:
+            cached = self.cache.get(block_id, last_edited_time)
+            if cached:
+                return cached
+
+        url = info['url']
+        try:
+            if is_expired(info.get('expiry_time')) and block_id and self.resolve_url:
+                url = self.resolve_url(block_id)
+            try:
+                data = self._download(url)
+            except requests.HTTPError as e:
+                # 签名URL过期时S3返回400/403,重新获取一次
+                if e.response is None or e.response.status_code not in (400, 403) \
+                        or not (block_id and self.resolve_url):
+                    raise
+                self.logger.info(f"Image URL expired for block {block_id}, resolving again")
+                data = self._download(self.resolve_url(block_id))
+        except Exception as e:
+            self.logger.error(f"Error downloading image: {str(e)}")
+            return None
+
+        ext = detect_extension(data, url)
+        if self.cache and block_id and last_edited_time:
+            self.cache.put(block_id, last_edited_time, data, ext)
+        return data, ext
+
+    def _transcode(self, fetched: Dict[str, Tuple[bytes, str]]) -> Dict[str, List[Tuple[int, int, str, bytes]]]:
+        """转码所有图片,返回 原URL -> 各版本;相同内容只转码一次,失败的保持原样"""
+        settings = hashlib.sha256(
+            f"{self.image_format}:{self.max_dimension}:{self.widths}:{self.quality}".encode()
+        ).hexdigest()[:12]
+        sources = {}  # 原图哈希 -> (内容, [URL])
+        for url, (data, ext) in fetched.items():
+            if ext not in KEEP_ORIGINAL_EXTENSIONS:
+                sources.setdefault(hashlib.sha256(data).hexdigest(), (data, []))[1].append(url)
+
+        transcoded = {}
+        pending = {}
+        for digest, (data, urls) in sources.items():
+            variants = self.cache.get_variants(digest, settings) if self.cache else None
+            if variants:
+                transcoded.update((url, variants) for url in urls)
+            else:
+                pending[digest] = (data, urls)
+        if not pending:
+            return transcoded
+
+        executor = self._processes()
+        futures = {
+            digest: executor.submit(transcode_image, data, self.image_format, self.max_dimension,
+                                    self.widths, self.quality)
+            for digest, (data, _) in pending.items()
+        }
+        for digest, future in futures.items():
+            try:
+                variants = future.result()
+            except Exception as e:
+                self.logger.error(f"Error transcoding image: {str(e)}")
+                continue
+            if self.cache:
+                self.cache.put_variants(digest, settings, variants)
+            transcoded.update((url, variants) for url in pending[digest][1])
+        return transcoded
+
+    def _save_variants(self, publisher, url: str, variants: List[Tuple[int, int, str, bytes]]) -> Dict[str, str]:
+        """暂存转码后的各个版本,返回该图片的替换项"""
+        saved = [(self._save(publisher, data, ext), width, height) for width, height, ext, data in variants]
+        src, width, height = saved[0]
+        srcset = ', '.join(f"{path} {w}w" for path, w, _ in sorted(saved, key=lambda item: item[1]))
+        return {
+            url: src,
+            f'src="{url}"': (f'src="{src}" srcset="{srcset}" sizes="(max-width: {width}px) 100vw, {width}px" '
+                             f'width="{width}" height="{height}"'),
+        }
+
+    def _download(self, url: str) -> bytes:
+        return self.limiter.call(self._get, url)
+
+    def _get(self, url: str) -> bytes:
+        response = self.session.get(url, timeout=30)
+        response.raise_for_status()
+        self.limiter.observe(response.headers)
+        return response.content
+
+    def _save(self, publisher, data: bytes, ext: str) -> str:
+        """按内容哈希暂存图片,返回博客内路径"""
+        image_filename = f"{hashlib.sha256(data).hexdigest()[:16]}.{ext}"
+        image_path = f"{self.images_path}/{image_filename}"
+
+        if publisher.exists(image_path) or publisher.is_staged(image_path):
+            self.logger.info(f"Image already exists: {image_path}")
+        else:
+            publisher.stage(image_path, data)
+            self.logger.info(f"Staged image: {image_path}")
+
+        return f"{self.url_prefix}/{image_filename}"
+
+
+def image_hashes(url_map: Dict[str, str]) -> List[str]:
+    """替换表引用的图片文件(包括srcset中的各个版本)的内容哈希"""
+    return sorted({digest for value in url_map.values() for digest in _IMAGE_NAME.findall(value)})
+
+
+def image_info(block: Dict) -> Optional[Dict]:
+    """从图片块中取出下载所需的信息"""
+    image = block.get('image', {})
+    source = image.get(image.get('type', 'file'))
+    if not source or not source.get('url'):
+        return None
+    return {
+        'url': source['url'],
+        'expiry_time': source.get('expiry_time'),
+        'block_id': block.get('id'),
+        'last_edited_time': block.get('last_edited_time'),
+    }
+
+
+def is_expired(expiry_time: Optional[str]) -> bool:
+    if not expiry_time:
+        return False
+    expiry = datetime.fromisoformat(expiry_time.replace('Z', '+00:00'))
+    return expiry <= datetime.now(timezone.utc)
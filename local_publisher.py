@@ -0,0 +1,112 @@
+import logging
+import os
+import subprocess
+import tempfile
+from typing import Dict, List, Optional, Union
+
+
+class LocalRepoPublisher:
+    """把文件直接写入本地git工作副本
+
+    接口与 GitHubBatchPublisher 一致: 先暂存,commit 时统一写盘。
+    每个文件先写临时文件再原子替换,可选地在工作副本中创建一个本地提交。
+    """
+
+    def __init__(self, repo_path: str, git_commit: bool = False):
+        self.repo_path = repo_path
+        self.git_commit = git_commit
+        self.staged = {}  # path -> str | bytes
+        self.deleted = set()
+        self.logger = logging.getLogger("LocalRepoPublisher")
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.staged or self.deleted)
+
+    def stage(self, path: str, content: Union[str, bytes]) -> bool:
+        """暂存一个文件,与磁盘上的内容相同时不暂存并返回False"""
+        self.deleted.discard(path)
+        data = content.encode('utf-8') if isinstance(content, str) else content
+        if self.read(path) == data:
+            self.staged.pop(path, None)
+            return False
+        self.staged[path] = data
+        return True
+
+    def delete(self, path: str) -> bool:
+        """暂存删除一个文件;文件不存在或本次已暂存了新内容时不删除,返回False"""
+        if path in self.staged or not self.exists(path):
+            return False
+        self.deleted.add(path)
+        return True
+
+    def is_staged(self, path: str) -> bool:
+        return path in self.staged
+
+    def exists(self, path: str) -> bool:
+        return os.path.isfile(self._full_path(path))
+
+    def read(self, path: str) -> Optional[bytes]:
+        full_path = self._full_path(path)
+        if not os.path.isfile(full_path):
+            return None
+        with open(full_path, 'rb') as f:
+            return f.read()
+
+    def changes(self) -> List[Dict]:
+        changes = [
+            {'path': path, 'action': 'update' if self.exists(path) else 'create'}
+            for path in self.staged
+        ]
+        return changes + [{'path': path, 'action': 'delete'} for path in sorted(self.deleted)]
+
+    def commit(self, message: str) -> Optional[str]:
+        """写入所有暂存文件并删除暂存删除的文件;开启 git_commit 时创建本地提交并返回其SHA"""
+        if not self.has_changes:
+            self.logger.info("Nothing to publish")
+            return None
+
+        for path, data in self.staged.items():
+            self._atomic_write(self._full_path(path), data)
+        for path in self.deleted:
+            full_path = self._full_path(path)
+            if os.path.isfile(full_path):
+                os.remove(full_path)
+        self.logger.info(f"Wrote {len(self.staged)} files and deleted {len(self.deleted)} in {self.repo_path}")
+
+        sha = None
+        if self.git_commit:
+            # 已删除的路径同样由 git add 暂存删除
+            self._git('add', '--', *self.staged.keys(), *self.deleted)
+            self._git('commit', '-m', message)
+            sha = self._git('rev-parse', 'HEAD').strip()
+            self.logger.info(f"Created local commit {sha[:7]}")
+
+        self.staged = {}
+        self.deleted = set()
+        return sha
+
+    def _full_path(self, path: str) -> str:
+        return os.path.join(self.repo_path, *path.split('/'))
+
+    def _atomic_write(self, full_path: str, data: bytes):
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, full_path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def _git(self, *args: str) -> str:
+        result = subprocess.run(
+            ['git', '-C', self.repo_path, *args],
+            check=True, capture_output=True, text=True
+        )
+        return result.stdout
@@ -1,94 +1,33 @@
 import argparse
-import json
+import hashlib
 import logging
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from typing import Dict, List, Tuple
+from zoneinfo import ZoneInfo
 
 import yaml
-from github import Github
 from notion_client import Client as NotionClient
-from retrying import retry
-
-
-class NotionDebugger:
-    """Notion调试类,记录API的原始返回内容"""
-
-    def __init__(self, debug_dir: str = "notion_debug"):
-        self.debug_dir = debug_dir
-        self._init_debug_dir()
-
-    def _init_debug_dir(self):
-        """初始化debug目录"""
-        os.makedirs(self.debug_dir, exist_ok=True)
-        # 创建README说明文件
-        readme_path = os.path.join(self.debug_dir, "README.md")
-        if not os.path.exists(readme_path):
-            with open(readme_path, "w", encoding="utf-8") as f:
-                f.write("# Notion Debug Files\n\n")
-                f.write("本目录包含Notion API的原始返回数据,用于调试同步问题。\n\n")
-                f.write("## 文件说明\n\n")
-                f.write("- `index.md`: 索引文件,记录所有debug文件的信息\n")
-                f.write("- `*.json`: 具体页面的API返回数据\n\n")
-
-    def save_debug_info(self, page_data: Dict, converted_content: str, file_path: str):
-        """保存debug信息"""
-        try:
-            # 获取页面信息
-            page = page_data['page']
-            page_id = page['id']
-            page_title = page['properties']['title']['title'][0]['plain_text']
-
-            # 生成文件名
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            safe_title = "".join(x for x in page_title if x.isalnum() or x in "- _")[:50]
-            debug_filename = f"{safe_title}_{timestamp}.json"
-            debug_path = os.path.join(self.debug_dir, debug_filename)
-
-            # 准备debug信息
-            debug_info = {
-                "timestamp": timestamp,
-                "page_id": page_id,
-                "page_title": page_title,
-                "target_file": file_path,
-                "notion_data": page_data,
-                "converted_content": converted_content
-            }
-
-            # 保存debug信息
-            with open(debug_path, "w", encoding="utf-8") as f:
-                json.dump(debug_info, f, ensure_ascii=False, indent=2)
-
-            # 更新索引
-            index_path = os.path.join(self.debug_dir, "index.md")
-            index_entry = f"| {timestamp} | {page_title} | {page_id} | {file_path} | {debug_filename} |\n"
-
-            if not os.path.exists(index_path):
-                with open(index_path, "w", encoding="utf-8") as f:
-                    f.write("# Debug Files Index\n\n")
-                    f.write("| 时间 | 页面标题 | 页面ID | 目标文件 | Debug文件 |\n")
-                    f.write("|------|----------|--------|----------|------------|\n")
-
-            with open(index_path, "a", encoding="utf-8") as f:
-                f.write(index_entry)
-
-            return debug_path
 
-        except Exception as e:
-            print(f"Error saving debug info: {str(e)}")
-            return None
+from block_cache import BlockCache
+from crawl_checkpoint import CrawlCheckpoint
+from debug_dump import DebugDumper
+from http_transport import HttpTransport
+from github_publisher import GitHubBatchPublisher, git_blob_sha
+from markdown_renderer import NOTES, MarkdownRenderer
+from notion_crawler import NotionCrawler
+from pipeline import Pipeline, Stage, process_pool
+from rate_limit import RateLimits
+from state_store import DEFAULT_REPO_STATE_PATH, SyncStateStore, create_state_backend
+
 
 class Config:
     """配置管理类"""
 
     def __init__(self, config_path: str = None):
         self.config = self._load_config(config_path)
-        self.debugger = NotionDebugger(self.debug_dir)
-
-    @property
-    def debug_dir(self) -> str:
-        return self.config.get('debug_dir', 'notion_debug')
 
     def _load_config(self, config_path: str = None) -> Dict:
         config = {}
@@ -99,7 +38,9 @@ class Config:
             "GH_TOKEN": "github_token",
             "GITHUB_TOKEN": "github_token",
             "NOTION_PAGE_ID": "notion_page_id",
-            "GITHUB_REPO": "github_repo"
+            "GITHUB_REPO": "github_repo",
+            "GITHUB_BRANCH": "github_branch",
+            "SYNC_STATE_BACKEND": "state_backend"
         }
 
         for env_key, config_key in env_mappings.items():
@@ -123,6 +64,33 @@ class Config:
         # 3. 设置默认值
         config.setdefault('sync_interval', 30)
         config.setdefault('base_path', 'notion_sync')
+        config.setdefault('sync_log_max_entries', 30)
+        config.setdefault('deterministic_render', True)
+        config.setdefault('timezone', 'Asia/Shanghai')
+        config.setdefault('crawl_workers', 4)
+        config.setdefault('notion_rate_limit', 3)
+        config.setdefault('github_rate_limit', 10)
+        config.setdefault('rate_limit_max_retries', 5)
+        config.setdefault('http_pool_size', 10)
+        config.setdefault('http2', False)
+        config.setdefault('notion_page_size', 100)
+        config.setdefault('incremental_crawl', True)
+        config.setdefault('crawl_checkpoint', True)
+        config.setdefault('crawl_subtree_retries', 2)
+        config.setdefault('pipeline_convert_workers', 2)
+        config.setdefault('pipeline_publish_workers', 1)
+        config.setdefault('pipeline_queue_size', 8)
+        config.setdefault('render_workers', 0)
+        config.setdefault('state_db', 'sync_state.sqlite')
+        config.setdefault('state_backend', 'local')
+        config.setdefault('state_repo_path', DEFAULT_REPO_STATE_PATH)
+        config.setdefault('block_cache', True)
+        config.setdefault('cache_dir', '.notion_cache')
+        config.setdefault('cache_max_mb', 200)
+        config.setdefault('debug', False)
+        config.setdefault('debug_dir', 'notion_debug')
+        config.setdefault('debug_max_files', 200)
+        config.setdefault('debug_max_age_days', 14)
 
         # 4. 验证必要的配置项
         required_keys = ["notion_token", "github_token", "notion_page_id"]
@@ -148,6 +116,24 @@ class Config:
     def github_repo(self) -> str:
         return self.config['github_repo']
 
+    @property
+    def github_branch(self) -> str:
+        """目标分支,未配置时使用仓库默认分支"""
+        return self.config.get('github_branch')
+
+    @property
+    def deterministic_render(self) -> bool:
+        return bool(self.config.get('deterministic_render', True))
+
+    @property
+    def timezone(self) -> str:
+        """页面更新时间使用的时区,与运行机器的本地时区无关"""
+        return self.config.get('timezone') or 'Asia/Shanghai'
+
+    @property
+    def sync_log_max_entries(self) -> int:
+        return max(1, int(self.config.get('sync_log_max_entries', 30)))
+
     @property
     def sync_interval(self) -> int:
         return self.config.get('sync_interval', 30)
@@ -156,132 +142,146 @@ class Config:
     def base_path(self) -> str:
         return self.config.get('base_path', 'notion_sync')
 
+    @property
+    def crawl_workers(self) -> int:
+        return int(self.config.get('crawl_workers', 4))
 
-class ContentConvert:
-    """内容格式转换器"""
+    @property
+    def notion_rate_limit(self) -> float:
+        return float(self.config.get('notion_rate_limit', 3))
 
-    def __init__(self):
-        # 用于跟踪列表的缩进级别
-        self.list_states = []  # 用栈来跟踪列表状态
-        self.current_numbered_list = 0  # 当前有序列表的计数
-        self.in_numbered_list = False  # 是否在有序列表中
-        self.list_indent_level = 0
-        self.numbered_list_counter = 0  # 添加序号计数器
-        self.table_data = {}  # 用于缓存表格数据
-        self.processed_pages = set()  # 用于追踪已处理的页面
-        self.page_map = {}  # 保存页面ID到文件路径的映射
-        self.config = Config()
+    @property
+    def github_rate_limit(self) -> float:
+        return float(self.config.get('github_rate_limit', 10))
 
-        self.logger = SyncLogger()
+    @property
+    def rate_limit_max_retries(self) -> int:
+        return int(self.config.get('rate_limit_max_retries', 5))
 
-    def convert_workspace(self, root_page: Dict, base_path: str) -> List[Tuple[str, str]]:
-        """转换整个工作区"""
-        self.processed_pages.clear()
-        self.page_map.clear()
+    @property
+    def http_pool_size(self) -> int:
+        return int(self.config.get('http_pool_size', 10))
 
-        # 创建根目录
-        os.makedirs(base_path, exist_ok=True)
+    @property
+    def http2(self) -> bool:
+        return bool(self.config.get('http2', False))
 
-        return self._process_page_recursively(root_page, base_path, [])
+    @property
+    def notion_page_size(self) -> int:
+        return int(self.config.get('notion_page_size', 100))
 
-    def save_notion_debug_info(self, notion_data: Dict, file_path: str) -> None:
-        """
-        保存Notion API的原始返回数据用于debug
+    @property
+    def incremental_crawl(self) -> bool:
+        return bool(self.config.get('incremental_crawl', True))
 
-        Args:
-            notion_data: Notion API返回的原始数据
-            file_path: 转换后要保存的文件路径
-        """
-        try:
-            # 创建debug目录
-            debug_dir = "notion_debug"
-            os.makedirs(debug_dir, exist_ok=True)
+    @property
+    def crawl_checkpoint(self) -> bool:
+        return bool(self.config.get('crawl_checkpoint', True))
 
-            # 生成debug文件名
-            page_id = notion_data['page']['id']
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            debug_filename = f"{page_id}_{timestamp}.json"
-            debug_filepath = os.path.join(debug_dir, debug_filename)
+    @property
+    def crawl_subtree_retries(self) -> int:
+        return int(self.config.get('crawl_subtree_retries', 2))
 
-            # 准备debug信息
-            debug_info = {
-                "timestamp": timestamp,
-                "page_id": page_id,
-                "target_file": file_path,  # 最终要同步到GitHub的文件路径
-                "notion_data": notion_data  # 完整的API返回数据
-            }
+    @property
+    def pipeline_convert_workers(self) -> int:
+        return int(self.config.get('pipeline_convert_workers', 2))
 
-            # 保存为JSON文件
-            with open(debug_filepath, 'w', encoding='utf-8') as f:
-                json.dump(debug_info, f, ensure_ascii=False, indent=2)
+    @property
+    def pipeline_publish_workers(self) -> int:
+        return int(self.config.get('pipeline_publish_workers', 1))
 
-            # 创建索引文件
-            index_path = os.path.join(debug_dir, "index.md")
-            index_line = f"- {timestamp} | {page_id} | {file_path} | {debug_filename}\n"
+    @property
+    def pipeline_queue_size(self) -> int:
+        return int(self.config.get('pipeline_queue_size', 8))
 
-            with open(index_path, 'a', encoding='utf-8') as f:
-                f.write(index_line)
+    @property
+    def render_workers(self) -> int:
+        return int(self.config.get('render_workers', 0))
 
-            self.logger.info(f"Debug info saved to {debug_filepath}")
+    @property
+    def state_db(self) -> str:
+        return self.config.get('state_db', 'sync_state.sqlite')
 
-        except Exception as e:
-            self.logger.error(f"Failed to save debug info: {str(e)}")
+    @property
+    def state_backend(self) -> str:
+        return self.config.get('state_backend', 'local')
 
-    def _process_page_recursively(self, page_data: Dict, base_path: str, path_components: List[str]) -> List[
-        Tuple[str, str]]:
-        """递归处理页面及其子页面"""
-        try:
-            page = page_data['page']
-            page_id = page['id']
-            last_edited_time = page.get('last_edited_time')
+    @property
+    def state_repo_path(self) -> str:
+        return self.config.get('state_repo_path', DEFAULT_REPO_STATE_PATH)
 
-            if page_id in self.processed_pages:
-                return []
+    @property
+    def block_cache(self) -> bool:
+        return bool(self.config.get('block_cache', True))
 
-            self.processed_pages.add(page_id)
+    @property
+    def cache_dir(self) -> str:
+        return self.config.get('cache_dir', '.notion_cache')
 
-            # 获取标题并处理文件名
-            title = page['properties']['title']['title'][0]['plain_text']
-            file_name = self._sanitize_filename(title) + '.md'
+    @property
+    def cache_max_mb(self) -> int:
+        return int(self.config.get('cache_max_mb', 200))
+
+    @property
+    def debug(self) -> bool:
+        return bool(self.config.get('debug', False))
+
+    @property
+    def debug_dir(self) -> str:
+        return self.config.get('debug_dir', 'notion_debug')
 
-            # 构建相对路径
-            current_path = os.path.join(base_path, *path_components)
-            os.makedirs(current_path, exist_ok=True)
-            file_path = os.path.join(current_path, file_name)
+    @property
+    def debug_max_files(self) -> int:
+        return int(self.config.get('debug_max_files', 200))
+
+    @property
+    def debug_max_age_days(self) -> int:
+        return int(self.config.get('debug_max_age_days', 14))
+
+
+class ContentConvert:
+    """内容格式转换器
+
+    页面内容的渲染只取决于页面数据(见 render_note),传入 render_pool 时在渲染进程中执行,
+    输出与在当前线程中渲染完全相同。
+    """
+
+    def __init__(self, deterministic: bool = True, debugger: DebugDumper = None,
+                 render_pool: ProcessPoolExecutor = None, timezone: str = 'Asia/Shanghai'):
+        self.renderer = MarkdownRenderer(NOTES)
+        # 确定性渲染: 更新时间取页面的last_edited_time,内容未变时输出完全相同
+        self.deterministic = deterministic
+        # 更新时间按固定时区显示,不同机器上的输出相同
+        self.timezone = timezone
+        self.tzinfo = ZoneInfo(timezone)
+        # 调试快照由后台线程写入,未开启时为None
+        self.debugger = debugger
+        self.render_pool = render_pool
+
+        self.logger = SyncLogger()
+
+    def convert_page(self, page_data: Dict, base_path: str,
+                     path_components: List[str] = ()) -> Tuple[str, str, str, str]:
+        """转换单个页面,返回 (文件路径, 内容, page_id, last_edited_time)"""
+        page = page_data['page']
 
-            self.save_notion_debug_info(page_data, file_path)
+        # 获取标题并处理文件名
+        title = page['properties']['title']['title'][0]['plain_text']
+        file_name = self._sanitize_filename(title) + '.md'
 
-            # 转换内容
+        # 构建相对路径
+        current_path = os.path.join(base_path, *path_components)
+        os.makedirs(current_path, exist_ok=True)
+        file_path = os.path.join(current_path, file_name)
+
+        # 转换内容
+        if self.render_pool:
+            content = self.render_pool.submit(render_note, page_data, self.deterministic, self.timezone).result()
+        else:
             content = self._convert_page_content(page_data)
-            debug_path = self.config.debugger.save_debug_info(
-                page_data,
-                content,
-                file_path
-            )
-            if debug_path:
-                self.logger.info(f"Debug info saved to {debug_path}")
-            results = [(file_path, content, page_id, last_edited_time)]
-
-            # 处理子页面
-            if 'blocks' in page_data:
-                blocks = page_data['blocks']
-                for block in blocks:
-                    if block['type'] == 'child_page':
-                        child_page = {
-                            'page': block['page_info'],
-                            'blocks': block.get('children', {}).get('results', [])
-                        }
-                        child_results = self._process_page_recursively(
-                            child_page,
-                            base_path,
-                            path_components + [os.path.dirname(file_name)]
-                        )
-                        results.extend(child_results)
-
-            return results
-        except Exception as e:
-            print(f"Error processing page: {str(e)}")
-            return []
+        if self.debugger:
+            self.debugger.dump(page_data, content, file_path)
+        return file_path, content, page['id'], page.get('last_edited_time')
 
     def _generate_file_name(self, page_data: Dict) -> str:
         """生成文件名
@@ -301,8 +301,6 @@ class ContentConvert:
         return filename.strip()
 
     def _convert_page_content(self, page_data: Dict) -> str:
-        # 重置计数器
-        self.numbered_list_counter = 0
         """转换页面内容为 Markdown 格式"""
         try:
             # 从page获取标题
@@ -311,7 +309,7 @@ class ContentConvert:
 
             markdown_lines = [
                 f"# {title}",
-                f"\n_Last updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}_\n",
+                f"\n_Last updated: {self._format_updated_time(page)}_\n",
                 "---\n"
             ]
 
@@ -321,207 +319,20 @@ class ContentConvert:
                 if isinstance(blocks, dict) and 'results' in blocks:
                     blocks = blocks['results']
 
-                for block in blocks:
-                    block_content = self._convert_block(block)
-                    if block_content:
-                        markdown_lines.append(block_content)
+                markdown_lines.append(self.renderer.render(blocks))
 
             return '\n'.join(filter(None, markdown_lines))
 
         except Exception as e:
             return ""
 
-    def _convert_block(self, block: Dict) -> str:
-        """转换单个块为 Markdown"""
-        try:
-            block_type = block['type']
-            block_data = block[block_type]
-
-            if block_type == 'bulleted_list_item':
-                # 处理基本列表项
-                indent = "    " * len(self.list_states)  # 使用4个空格作为基本缩进
-                text = self._convert_rich_text(block_data['rich_text'])
-                result = f"{indent}- {text}\n"
-
-                if block.get('has_children') and 'children' in block:
-                    self.list_states.append('bulleted')
-                    for child in block['children']['results']:
-                        child_content = self._convert_block(child)
-                        if child_content:
-                            result += child_content
-                    self.list_states.pop()
-
-                return result
-            elif block_type == 'numbered_list_item':
-                if not self.in_numbered_list:
-                    self.current_numbered_list = 0
-                    self.list_states = []
-
-                self.in_numbered_list = True
-                self.current_numbered_list += 1
-                indent = "    " * len(self.list_states)
-                text = self._convert_rich_text(block_data['rich_text'])
-                result = f"{indent}{self.current_numbered_list}. {text}\n"
-
-                # 处理子项
-                if block.get('has_children') and 'children' in block:
-                    self.list_states.append('numbered')
-                    for child in block['children']['results']:
-                        # 增加了对paragraph类型的处理
-                        if child['type'] == 'paragraph':
-                            # 段落文本要缩进,但不加序号
-                            child_text = self._convert_rich_text(child['paragraph']['rich_text'])
-                            if child_text:
-                                result += f"{indent}    {child_text}\n"
-                        else:
-                            child_content = self._convert_block(child)
-                            if child_content:
-                                result += child_content
-                    self.list_states.pop()
-
-                return result
-            elif block_type == 'code':
-                result = ''
-                # 处理代码块
-                text = self._convert_rich_text(block_data['rich_text'])
-                language = block_data.get('language', '')
-                if text:
-                    result = f"```{language}\n{text}\n```\n\n"
-                    return result
-            elif block_type == 'image':
-                image_data = block_data
-                url = image_data['file']['url']
-                caption = ""
-                if image_data.get('caption'):
-                    caption = self._convert_rich_text(image_data['caption'])
-
-                # 如果有caption就用caption作为alt文本,否则用"image"
-                alt_text = caption if caption else "image"
-                return f"![{alt_text}]({url})\n\n"
-
-            # 不是列表项,清除列表状态
-            self.in_numbered_list = False
-            self.list_states = []
-
-            if block_type == 'paragraph':
-                # 先处理段落本身
-                text = self._convert_rich_text(block_data.get('rich_text', []))
-                result = ''
-
-                if text:
-                    result = f"{text}\n\n"
-
-                if block.get('has_children') and 'children' in block:
-                    child_results = []
-                    for child in block['children']['results']:
-                        child_content = self._convert_block(child)
-                        if child_content:
-                            child_results.append(child_content)
-
-                    if child_results:
-                        result += "\n".join(child_results)
-
-                    if not result.endswith('\n\n'):
-                        result += '\n\n'
-
-                return result
-            elif block_type == 'heading_1':
-                # 处理一级标题
-                if 'rich_text' in block_data:
-                    text = self._convert_rich_text(block_data.get('rich_text', []))
-                    content = f"# {text}\n\n"
-
-                    # 处理子内容
-                    if block.get('has_children') and 'children' in block:
-                        for child in block['children']['results']:
-                            child_content = self._convert_block(child)
-                            if child_content:
-                                content += child_content
-                    return content
-
-            elif block_type == 'heading_2':
-                # 处理二级标题
-                if 'rich_text' in block_data:
-                    text = self._convert_rich_text(block_data.get('rich_text', []))
-                    content = f"# {text}\n\n"
-
-                    # 处理子内容
-                    if block.get('has_children') and 'children' in block:
-                        for child in block['children']['results']:
-                            child_content = self._convert_block(child)
-                            if child_content:
-                                content += child_content
-                    return content
-
-            elif block_type == 'heading_3':
-                # 处理三级标题
-                if 'rich_text' in block_data:
-                    text = self._convert_rich_text(block_data.get('rich_text', []))
-                    content = f"# {text}\n\n"
-
-                    # 处理子内容
-                    if block.get('has_children') and 'children' in block:
-                        for child in block['children']['results']:
-                            child_content = self._convert_block(child)
-                            if child_content:
-                                content += child_content
-                    return content
-
-            elif block_type == 'code':
-                # 处理代码块
-                text = self._convert_rich_text(block_data['rich_text'])
-                language = block_data.get('language', '')
-                if text:
-                    result = f"```{language}\n{text}\n```\n\n"
-                    return result
-
-            elif block_type == 'quote':
-                # 处理引用
-                text = self._convert_rich_text(block_data['rich_text'])
-                return f"> {text}\n\n"
-
-            elif block_type == 'table':
-                table_data = block.get('table', {})
-                children = block.get('children', {}).get('results', [])
-                return self._handle_table(table_data, block['id'], children)
-
-            return ""
-
-        except Exception as e:
-            return ""
-
-    def _convert_paragraph(self, paragraph: Dict) -> str:
-        """转换段落内容"""
-        text = self._convert_rich_text(paragraph.get('rich_text', []))
-        return f"{text}\n" if text else ''
-
-    def _convert_rich_text(self, rich_text: List[Dict]) -> str:
-        """转换富文本内容"""
-        if not rich_text:
-            return ""
-
-        text_parts = []
-        for text in rich_text:
-            content = text.get('plain_text', '')
-            annotations = text.get('annotations', {})
-
-            # 处理文本格式
-            if annotations.get('bold'):
-                content = f"**{content}**"
-            if annotations.get('italic'):
-                content = f"*{content}*"
-            if annotations.get('strikethrough'):
-                content = f"~~{content}~~"
-            if annotations.get('code'):
-                content = f"`{content}`"
-
-            # 处理链接
-            if text.get('href'):
-                content = f"[{content}]({text['href']})"
-
-            text_parts.append(content)
-
-        return ''.join(text_parts)
+    def _format_updated_time(self, page: Dict) -> str:
+        """页面更新时间,确定性模式下使用Notion的last_edited_time"""
+        last_edited_time = page.get('last_edited_time')
+        if self.deterministic and last_edited_time:
+            edited = datetime.fromisoformat(last_edited_time.replace('Z', '+00:00'))
+            return edited.astimezone(self.tzinfo).strftime('%Y-%m-%d %H:%M:%S')
+        return datetime.now(self.tzinfo).strftime('%Y-%m-%d %H:%M:%S')
 
     def _get_page_title(self, page_data: Dict) -> str:
         """获取页面标题"""
@@ -530,51 +341,19 @@ class ContentConvert:
         except (KeyError, IndexError):
             return "Untitled"
 
-    def _handle_table(self, data: Dict, block_id: str, children: List[Dict]) -> str:
-        if not children:
-            return ""
-
-        # 获取表格行数据
-        rows = []
-        header_row = None
-
-        for row in children:
-            if row['type'] != 'table_row':
-                continue
 
-            # 处理每个单元格
-            cells = []
-            for cell in row['table_row']['cells']:
-                cell_text = self._convert_rich_text(cell)
-                # 转义|字符
-                cell_text = cell_text.replace('|', '\\|') if cell_text else ''
-                cells.append(cell_text.strip())
-
-            if not header_row:
-                header_row = cells
-            else:
-                rows.append(cells)
-
-        if not header_row:
-            return ""
+# 渲染进程中的转换器,每个进程创建一次
+_process_converter = None
 
-        # 构建Markdown表格
-        table = []
 
-        # 表头
-        table.append('| ' + ' | '.join(header_row) + ' |')
+def render_note(page_data: Dict, deterministic: bool = True, timezone: str = 'Asia/Shanghai') -> str:
+    """渲染一个页面的Markdown,在渲染进程中执行"""
+    global _process_converter
+    if (_process_converter is None or _process_converter.deterministic != deterministic
+            or _process_converter.timezone != timezone):
+        _process_converter = ContentConvert(deterministic=deterministic, timezone=timezone)
+    return _process_converter._convert_page_content(page_data)
 
-        # 分隔行
-        table.append('| ' + ' | '.join(['---'] * len(header_row)) + ' |')
-
-        # 数据行
-        for row in rows:
-            # 确保列数对齐
-            while len(row) < len(header_row):
-                row.append('')
-            table.append('| ' + ' | '.join(row) + ' |')
-
-        return '\n'.join(table) + '\n\n'
 
 class SyncLogger:
     """同步日志管理器"""
@@ -603,49 +382,76 @@ class SyncLogger:
 class NotionGitSync:
     """Notion和GitHub同步工具"""
 
-    def __init__(self, config_path: str = None):
+    def __init__(self, config_path: str = None, offline: bool = False, debug: bool = False,
+                 render_workers: int = None):
         self.config = Config(config_path)
         self.logger = SyncLogger()
+        self.offline = offline
+        # 渲染进程数,0 表示在转换线程中渲染
+        self.render_workers = self.config.render_workers if render_workers is None else render_workers
+        self.render_pool = None
+
+        # 各服务共享的限流器,限流和临时错误在这里逐个请求重试
+        self.limits = RateLimits({
+            'notion': self.config.notion_rate_limit,
+            'github': self.config.github_rate_limit,
+        }, max_retries=self.config.rate_limit_max_retries)
+
+        # 初始化客户端,共用连接池配置,请求之间复用连接
+        self.transport = HttpTransport(pool_size=self.config.http_pool_size, http2=self.config.http2)
+        self.notion = NotionClient(auth=self.config.notion_token, client=self.transport.notion_client())
+        self.github = self.transport.github(self.config.github_token)
+
+        # 块缓存,离线模式必须启用
+        self.cache = None
+        if self.config.block_cache or offline:
+            self.cache = BlockCache(self.config.cache_dir, max_bytes=self.config.cache_max_mb * 1024 * 1024)
+
+        # 抓取检查点,中断后下次运行从已完成的页面继续
+        checkpoint = None
+        if self.config.crawl_checkpoint and not offline:
+            checkpoint = CrawlCheckpoint(os.path.join(self.config.cache_dir, "crawl_checkpoint.jsonl"))
+
+        # 离线重建需要输出所有页面,不做增量判断
+        incremental = self.config.incremental_crawl and not offline
+        self.crawler = NotionCrawler(
+            self.notion,
+            max_workers=self.config.crawl_workers,
+            page_size=self.config.notion_page_size,
+            is_unchanged=self._is_unchanged if incremental else None,
+            cache=self.cache,
+            offline=offline,
+            limiter=self.limits.get('notion'),
+            checkpoint=checkpoint,
+            subtree_retries=self.config.crawl_subtree_retries
+        )
 
-        # 初始化Notion Api客户端
-        self.notion = NotionClient(auth=self.config.notion_token)
-        self.github = Github(self.config.github_token)
-
-        self.converter = ContentConvert()
+        # 调试快照默认关闭,可通过配置 debug 或 --debug 开启
+        self.debugger = None
+        if debug or self.config.debug:
+            self.debugger = DebugDumper(self.config.debug_dir,
+                                        max_files=self.config.debug_max_files,
+                                        max_age_days=self.config.debug_max_age_days)
 
-        self.sync_status_file = "sync_status.json"
-        self.last_sync_times = self._load_sync_status()
+        # 同步状态在 sync 开始时打开,保存在仓库中时需要先创建发布器
+        self.state_backend = create_state_backend(self.config.state_backend, self.config.state_db,
+                                                  cache_dir=self.config.cache_dir,
+                                                  repo_path=self.config.state_repo_path)
+        self.state = None
+        self.publisher = None
 
         self.logger.info("NotionGitSync initialized")
 
-    def _load_sync_status(self) -> dict:
-        """加载上次同步状态"""
-        try:
-            if os.path.exists(self.sync_status_file):
-                with open(self.sync_status_file, 'r') as f:
-                    return json.load(f)
-            return {}
-        except Exception as e:
-            self.logger.error(f"Error loading sync status: {str(e)}")
-            return {}
-
-    def _save_sync_status(self):
-        """保存同步状态"""
-        try:
-            with open(self.sync_status_file, 'w') as f:
-                json.dump(self.last_sync_times, f)
-        except Exception as e:
-            self.logger.error(f"Error saving sync status: {str(e)}")
-
     def _needs_update(self, page_id: str, last_edited_time: str) -> bool:
         """检查页面是否需要更新"""
         # 如果是首次同步,需要更新
-        if page_id not in self.last_sync_times:
+        synced_time = self.state.last_edited_time(page_id)
+        if not synced_time:
             return True
 
         # 比较时间戳
         try:
-            last_sync = datetime.fromisoformat(self.last_sync_times[page_id].replace('Z', '+00:00'))
+            last_sync = datetime.fromisoformat(synced_time.replace('Z', '+00:00'))
             current_edit = datetime.fromisoformat(last_edited_time.replace('Z', '+00:00'))
             return current_edit > last_sync
         except Exception as e:
@@ -653,151 +459,219 @@ class NotionGitSync:
             # 发生错误时保守处理,执行更新
             return True
 
-    @retry(stop_max_attempt_number=3, wait_fixed=2000)
-    def get_notion_content(self):
-        """递归获取 Notion 内容"""
-        try:
-            self.logger.info(f"Fetching content from Notion page {self.config.notion_page_id}")
-            # 获取根页面
-            root_page = self.notion.pages.retrieve(self.config.notion_page_id)
-
-            # 获取块信息
-            blocks = self.notion.blocks.children.list(self.config.notion_page_id)
-
-            # 递归获取所有内容
-            content = {
-                'page': root_page,
-                'blocks': self._get_all_blocks(self.config.notion_page_id)
-            }
-
-            return content
-        except Exception as e:
-            self.logger.error(f"Error getting Notion content: {str(e)}")
-            raise
-
-    def _get_all_blocks(self, block_id: str) -> List[Dict]:
-        blocks = []
-        try:
-            # 获取当前页面的所有块
-            response = self.notion.blocks.children.list(block_id)
-            blocks = response['results']
-
-            # 递归获取所有有子项的块的内容
-            for block in blocks:
-                if block.get('has_children', False):  # 检查是否有子项
-                    # 获取子块
-                    child_id = block['id']
-                    child_blocks = self._get_all_blocks(child_id)
-                    # 保存子块
-                    block['children'] = {
-                        'results': child_blocks
-                    }
-
-                    # 如果是child_page类型,还需要获取页面信息
-                    if block['type'] == 'child_page':
-                        child_page = self.notion.pages.retrieve(child_id)
-                        block['page_info'] = child_page
-
-            return blocks
-
-        except Exception as e:
-            self.logger.error(f"Error getting blocks for {block_id}: {str(e)}")
-            return blocks
+    def _is_unchanged(self, page_id: str, last_edited_time: str) -> bool:
+        """抓取时判断子页面是否可以跳过"""
+        return not self._needs_update(page_id, last_edited_time)
 
     def update_github(self, file_path: str, content: str, page_id: str, last_edited_time: str):
+        """暂存一个文件,在本次同步结束时与其他改动一起提交"""
         # 检查是否需要更新
         if not self._needs_update(page_id, last_edited_time):
             self.logger.info(f"Content not changed for {file_path}, skipping update")
             return
 
+        # 标准化路径
+        file_path = file_path.replace(os.sep, '/')
+        if not file_path.startswith('notion_sync/'):
+            file_path = f"notion_sync/{file_path}"
+
+        if self.publisher.stage(file_path, content):
+            self.logger.info(f"Staged file {file_path}")
+        else:
+            self.logger.info(f"Content identical to remote for {file_path}, skipping upload")
+        self.state.stage(page_id, last_edited_time,
+                         content_hash=hashlib.sha256(content.encode('utf-8')).hexdigest(),
+                         remote_path=file_path, blob_sha=git_blob_sha(content),
+                         parent_id=self.crawler.parents.get(page_id))
+
+    def _convert_stage(self, base_path: str):
+        """转换线程的处理函数,每个线程使用自己的转换器"""
+        converter = ContentConvert(deterministic=self.config.deterministic_render, debugger=self.debugger,
+                                   render_pool=self.render_pool, timezone=self.config.timezone)
+
+        def convert(page_data: Dict):
+            try:
+                return converter.convert_page(page_data, base_path)
+            except Exception as e:
+                self.logger.error(f"Error processing page: {str(e)}")
+                return None
+        return convert
+
+    def _publish_stage(self):
+        """发布线程的处理函数: 离线模式写入本地目录,否则暂存到本次提交"""
+        def publish(converted: Tuple[str, str, str, str]):
+            if self.offline:
+                file_path, content = converted[:2]
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    f.write(content)
+                self.logger.info(f"Wrote {file_path}")
+            else:
+                self.update_github(*converted)
+        return publish
+
+    def _prune_stale_files(self):
+        """删除改名、移动或已删除(取消分享)的页面留下的旧文件
+
+        旧路径来自状态中的 page_id -> 路径索引,不需要列出仓库;只有上级页面本次完整列出时,
+        没有遇到的页面才算已删除(见 SyncStateStore.prune)。
+        """
+        for path in self.state.prune(self.crawler.seen_pages, self.crawler.listed_pages):
+            if self.publisher.delete(path):
+                self.logger.info(f"Staged deletion of {path}")
+
+    def _publish(self):
+        """把本次同步的所有改动和同步日志合并成一个提交"""
+        self._prune_stale_files()
+        if not self.publisher.has_changes:
+            self.logger.info("No changes to publish")
+            self._commit_sync_status()
+            if self.publisher.has_changes:
+                # 页面内容都与远端一致,只有仓库中的状态文件需要更新
+                self.publisher.commit("Update Notion sync state")
+            return
+
         try:
-            repo = self.github.get_repo(self.config.github_repo)
+            changes = self.publisher.changes()
+            self._update_sync_log(changes)
 
-            # 标准化路径
-            file_path = file_path.replace(os.sep, '/')
-            if not file_path.startswith('notion_sync/'):
-                file_path = f"notion_sync/{file_path}"
+            # 状态保存在仓库中时与改动放进同一个提交,否则提交成功后再更新
+            in_repo = self.state_backend.in_repo
+            if in_repo:
+                self._commit_sync_status()
 
-            # 更新或创建文件
-            try:
-                file = repo.get_contents(file_path)
-                repo.update_file(
-                    file_path,
-                    f"Update from Notion {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
-                    content,
-                    file.sha
-                )
-                self.logger.info(f"Updated file {file_path}")
-                self._update_sync_log(repo, "update", file_path)
-            except:
-                repo.create_file(
-                    file_path,
-                    f"Create from Notion {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
-                    content
-                )
-                self.logger.info(f"Created file {file_path}")
-                self._update_sync_log(repo, "create", file_path)
-
-            # 更新同步状态
-            self.last_sync_times[page_id] = last_edited_time
-            self._save_sync_status()
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            self.publisher.commit(f"Sync from Notion {now}: {len(changes)} files")
+
+            if not in_repo:
+                self._commit_sync_status()
 
         except Exception as e:
             self.logger.error(f"Error updating Github: {str(e)}")
             raise
 
-    def _update_sync_log(self, repo, action: str, file_path: str):
-        """更新同步日志"""
+    def _open_state(self):
+        """从状态后端打开同步状态,首次运行时导入旧的 sync_status.json"""
+        if self.state:
+            self.state.close()
+        self.state = SyncStateStore(self.state_backend.load(self.publisher), legacy_path="sync_status.json")
+
+    def _commit_sync_status(self):
+        """记录本次已发布(或与远端一致)的页面,在一个事务中写入并交给状态后端保存"""
+        if self.state.commit():
+            self.state_backend.save(self.state, self.publisher)
+
+    def _update_sync_log(self, changes: List[Dict]):
+        """为本次同步写一条汇总日志并暂存
+
+        README只保留最近 sync_log_max_entries 条记录,
+        更早的记录按月份移入 notion_sync/sync_logs/ 下的归档文件。
+        """
         readme_path = "notion_sync/README.md"
         now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-        try:
-            # 尝试读取现有的 README
-            readme = repo.get_contents(readme_path)
-            current_content = readme.decoded_content.decode()
-        except:
-            # 如果不存在，创建新的
-            current_content = "# Notion Sync Log\n\n"
-
-        # 添加新的同步记录
-        new_log = f"- {now}: {action} `{file_path}`\n"
-        updated_content = current_content + new_log
-
-        # 更新或创建 README
-        if 'readme' in locals():
-            repo.update_file(
-                readme_path,
-                f"Update sync log {now}",
-                updated_content,
-                readme.sha
-            )
-        else:
-            repo.create_file(
-                readme_path,
-                f"Create sync log",
-                updated_content
-            )
+        current = self.publisher.read(readme_path)
+        # 如果不存在，创建新的
+        current_content = current.decode() if current is not None else "# Notion Sync Log\n\n"
+        header, entries = self._split_log_entries(current_content)
+
+        # 本次同步的汇总记录
+        counts = {}
+        for change in changes:
+            counts[change['action']] = counts.get(change['action'], 0) + 1
+        summary = ', '.join(f"{count} {action}" for action, count in sorted(counts.items()))
+        entry = f"- {now}: sync {len(changes)} files ({summary})\n"
+        max_files = 50
+        for change in changes[:max_files]:
+            entry += f"  - {change['action']} `{change['path']}`\n"
+        if len(changes) > max_files:
+            entry += f"  - ... and {len(changes) - max_files} more\n"
+        entries.append(entry)
+
+        max_entries = self.config.sync_log_max_entries
+        archived, entries = entries[:-max_entries], entries[-max_entries:]
+        self.publisher.stage(readme_path, header + ''.join(entries))
+
+        if archived:
+            self._archive_log_entries(archived)
+
+    def _archive_log_entries(self, entries: List[str]):
+        """把移出README的记录追加到按月份划分的归档文件"""
+        by_month = {}
+        for entry in entries:
+            # 记录格式: "- YYYY-MM-DD HH:MM:SS: ..."
+            month = entry[2:9] if entry[2:9].count('-') == 1 else 'unknown'
+            by_month.setdefault(month, []).append(entry)
+
+        for month, month_entries in by_month.items():
+            archive_path = f"notion_sync/sync_logs/{month}.md"
+            current = self.publisher.read(archive_path)
+            content = current.decode() if current is not None else f"# Notion Sync Log {month}\n\n"
+            self.publisher.stage(archive_path, content + ''.join(month_entries))
+
+    def _split_log_entries(self, content: str) -> Tuple[str, List[str]]:
+        """把日志拆分为标题部分和记录列表,每条记录包含其缩进的明细行"""
+        header_lines = []
+        entries = []
+        for line in content.splitlines(keepends=True):
+            if line.startswith('- '):
+                entries.append(line)
+            elif entries and line.startswith('  '):
+                entries[-1] += line
+            elif not entries:
+                header_lines.append(line)
+        return ''.join(header_lines), entries
 
     def sync(self) -> None:
         """执行同步操作"""
         try:
-            # 获取Notion内容
-            notion_content = self.get_notion_content()
+            # 暂存所有改动,最后一次性提交到GitHub
+            if not self.offline:
+                github_limiter = self.limits.get('github')
+                repo = github_limiter.call(self.github.get_repo, self.config.github_repo)
+                self.publisher = GitHubBatchPublisher(repo, self.config.github_branch or repo.default_branch,
+                                                      limiter=github_limiter)
+            self._open_state()
+
+            base_path = self.config.base_path
+            os.makedirs(base_path, exist_ok=True)
+
+            # 转换线程把页面交给渲染进程,线程数不少于进程数才能用满所有进程
+            convert_workers = self.config.pipeline_convert_workers
+            if self.render_workers > 0:
+                self.render_pool = process_pool(max_workers=self.render_workers)
+                convert_workers = max(convert_workers, self.render_workers)
+
+            # 页面的子树抓取完就转换,转换完就暂存,三者同时进行
+            pipeline = Pipeline([
+                Stage('convert', lambda: self._convert_stage(base_path), workers=convert_workers),
+                Stage('publish', self._publish_stage, workers=self.config.pipeline_publish_workers),
+            ], queue_size=self.config.pipeline_queue_size)
+
+            self.logger.info(f"Fetching content from Notion page {self.config.notion_page_id}")
+            # 并发获取所有内容,未变化的子页面只记录不抓取
+            notion_content = pipeline.run(lambda emit: self.crawler.crawl_page(
+                self.config.notion_page_id, on_page=lambda page_data, ancestors: emit(page_data)))
             if not notion_content:
                 self.logger.warning("No content fetched from Notion")
                 return
 
-            # 转换内容
-            base_path = self.config.base_path
-            files = self.converter.convert_workspace(notion_content, base_path)
-            # 更新到GitHub
-            for file_path, content, page_id, last_edited_time in files:
-                self.update_github(file_path, content, page_id, last_edited_time)
+            # 离线模式只写入本地目录
+            if self.offline:
+                self.logger.info("Offline rebuild completed")
+                return
+
+            self._publish()
 
             self.logger.info("Sync completed successfully")
 
         except Exception as e:
             self.logger.error(f"Sync failed: {str(e)}")
+        finally:
+            if self.render_pool:
+                self.render_pool.shutdown(wait=True)
+                self.render_pool = None
+            if self.debugger:
+                self.debugger.close()
 
     def run(self) -> None:
         """执行单次同步"""
@@ -808,16 +682,33 @@ class NotionGitSync:
             self.logger.error(f"Sync failed: {str(e)}")
             raise  # 重新抛出异常，让GitHub Actions知道任务失败
 
+    def close(self) -> None:
+        """关闭连接池和状态数据库"""
+        self.transport.close()
+        if self.state:
+            self.state.close()
+        self.state_backend.close()
+
 
 def main():
     # 添加命令行参数解析
     parser = argparse.ArgumentParser(description='Notion to GitHub sync tool')
     parser.add_argument('--config', type=str, help='Path to config file')
+    parser.add_argument('--offline', action='store_true',
+                        help='Rebuild files from the local block cache without calling Notion or GitHub')
+    parser.add_argument('--debug', action='store_true',
+                        help='Save compressed snapshots of the Notion data of each converted page')
+    parser.add_argument('--render-workers', type=int, metavar='N',
+                        help='Render pages in N worker processes (default: config render_workers, 0 = in-process)')
     args = parser.parse_args()
 
     try:
-        syncer = NotionGitSync(config_path=args.config)
-        syncer.run()  # 单次执行同步
+        syncer = NotionGitSync(config_path=args.config, offline=args.offline, debug=args.debug,
+                               render_workers=args.render_workers)
+        try:
+            syncer.run()  # 单次执行同步
+        finally:
+            syncer.close()
     except Exception as e:
         print(f"Error: {str(e)}")
         sys.exit(1)
@@ -0,0 +1,346 @@
+import logging
+from typing import Callable, Dict, List, Optional
+
+from image_pipeline import image_info
+from tree_walk import SKIP, walk
+
+
+# 注解按此顺序从内到外包裹文本,行内代码在最外层
+_ANNOTATIONS = (('bold', '**'), ('italic', '*'), ('strikethrough', '~~'), ('code', '`'))
+
+# (注解位, 标记),按从外到内的打开顺序排列
+_MARKERS = tuple((1 << bit, marker) for bit, (_, marker) in reversed(list(enumerate(_ANNOTATIONS))))
+_MARKER = dict(_MARKERS)
+
+
+def _annotation_mask(annotations: Optional[Dict]) -> int:
+    if not annotations:
+        return 0
+    return ((1 if annotations.get('bold') else 0)
+            | (2 if annotations.get('italic') else 0)
+            | (4 if annotations.get('strikethrough') else 0)
+            | (8 if annotations.get('code') else 0))
+
+
+class Dialect:
+    """目标Markdown方言: 列表缩进、标题级别偏移和块后的空行"""
+
+    def __init__(self, name: str, list_indent: int, heading_offset: int, block_end: str):
+        self.name = name
+        self.list_indent = list_indent
+        self.heading_offset = heading_offset
+        self.block_end = block_end
+
+
+# GitHub笔记仓库: 页面标题占用一级标题,块之间空两行
+NOTES = Dialect('notes', list_indent=4, heading_offset=0, block_end='\n\n')
+# Hexo文章: 标题在Front Matter中,正文标题从二级开始
+HEXO = Dialect('hexo', list_indent=2, heading_offset=1, block_end='\n')
+
+
+class MarkdownRenderer:
+    """表驱动的Notion块渲染器
+
+    每种块类型在分发表中注册一个处理函数,所有处理函数写入同一个输出缓冲区,
+    渲染结束时只拼接一次。块树用显式栈遍历,嵌套再深也不会递归。
+    处理函数接收 (block, depth),写入块本身的内容,返回子块的缩进层级,
+    返回None时不渲染子块;需要在子块之后输出内容的块类型另外注册结束函数。
+    没有注册的块类型(如子页面)不输出内容。
+    """
+
+    def __init__(self, dialect: Dialect):
+        self.dialect = dialect
+        self.out = []
+        # 每组同级块的状态: 缩进层级、编号列表序号、是否已有输出
+        self.levels = []
+        self.logger = logging.getLogger("MarkdownRenderer")
+        self.handlers = {
+            'paragraph': self._paragraph,
+            'heading_1': self._heading,
+            'heading_2': self._heading,
+            'heading_3': self._heading,
+            'bulleted_list_item': self._bulleted_list_item,
+            'numbered_list_item': self._numbered_list_item,
+            'to_do': self._to_do,
+            'toggle': self._toggle,
+            # 引用和标注在子块渲染完后整体加前缀
+            'quote': self._quoted,
+            'callout': self._quoted,
+            'code': self._code,
+            'equation': self._equation,
+            'divider': self._divider,
+            'bookmark': self._bookmark,
+            'image': self._image,
+            'table': self._table,
+            # 只包含其他块的容器,直接展开
+            'column_list': self._container,
+            'column': self._container,
+            'synced_block': self._container,
+        }
+        self.closers = {
+            'toggle': self._close_toggle,
+            'quote': self._close_quote,
+            'callout': self._close_callout,
+        }
+
+    def register(self, block_type: str, handler: Callable[[Dict, int], Optional[int]],
+                 closer: Callable[[Dict, int, int], None] = None):
+        """注册或替换某种块的处理函数
+
+        closer(block, depth, start) 在子块渲染完后调用,start 是该块输出在缓冲区中的起始位置。
+        """
+        self.handlers[block_type] = handler
+        if closer:
+            self.closers[block_type] = closer
+        else:
+            self.closers.pop(block_type, None)
+
+    def render(self, blocks: List[Dict]) -> str:
+        self.out = []
+        self.levels = [self._level(0)]
+        walk(blocks, self._children, self._enter, self._leave)
+        text = ''.join(self.out)
+        self.out = []
+        self.levels = []
+        return text
+
+    def write(self, text: str):
+        if text:
+            self.out.append(text)
+
+    def write_block(self, text: str, depth: int):
+        """写入一个非列表块,嵌套在列表中时每行缩进,之后按方言空行"""
+        pad = self._pad(depth)
+        if pad:
+            text = '\n'.join(pad + line if line else line for line in text.split('\n'))
+        self.write(text + self._block_end(depth))
+
+    def rich_text(self, rich_text: List[Dict]) -> str:
+        """转换富文本
+
+        没有格式、链接和公式时直接拼接文本。否则标记按栈嵌套,相邻片段之间只输出
+        两者注解掩码的差异,重叠的注解和公式前后不会输出 `****`;链接变化时关闭所有注解,
+        链接内的文本重新打开各自的注解。
+        """
+        if not rich_text:
+            return ""
+        if len(rich_text) == 1:
+            text = rich_text[0]
+            if not text.get('href') and text.get('type') != 'equation' \
+                    and not _annotation_mask(text.get('annotations')):
+                return text.get('plain_text', '')
+
+        parts = []
+        opened = []  # 已打开的注解位,从外到内
+        open_href = None
+        for text in rich_text:
+            # 与 _annotation_mask 相同,内联以省去每个片段一次函数调用
+            annotations = text.get('annotations')
+            mask = ((1 if annotations.get('bold') else 0)
+                    | (2 if annotations.get('italic') else 0)
+                    | (4 if annotations.get('strikethrough') else 0)
+                    | (8 if annotations.get('code') else 0)) if annotations else 0
+            href = text.get('href')
+            # 链接不变时保留从最外层开始仍然需要的注解,其余的关闭
+            keep = 0
+            if href == open_href:
+                while keep < len(opened) and mask & opened[keep]:
+                    keep += 1
+            while len(opened) > keep:
+                parts.append(_MARKER[opened.pop()])
+            if href != open_href:
+                if open_href:
+                    parts.append(f"]({open_href})")
+                if href:
+                    parts.append('[')
+                open_href = href
+            for bit, marker in _MARKERS:
+                if mask & bit and bit not in opened:
+                    opened.append(bit)
+                    parts.append(marker)
+            if text.get('type') == 'equation':
+                parts.append(f"${text.get('plain_text', '')}$")
+            else:
+                parts.append(text.get('plain_text', ''))
+        while opened:
+            parts.append(_MARKER[opened.pop()])
+        if open_href:
+            parts.append(f"]({open_href})")
+        return ''.join(parts)
+
+    def _level(self, depth: int) -> Dict:
+        # 顶层块之间空一行,列表内的块紧挨着
+        return {'depth': depth, 'number': 0, 'wrote': False, 'separator': '\n' if depth == 0 else ''}
+
+    def _enter(self, block: Dict, _):
+        level = self.levels[-1]
+        level['number'] = level['number'] + 1 if block.get('type') == 'numbered_list_item' else 0
+        handler = self.handlers.get(block.get('type'))
+        if handler is None:
+            return SKIP
+
+        start = len(self.out)
+        if level['wrote'] and level['separator']:
+            self.out.append(level['separator'])
+        frame = {'level': level, 'start': start, 'mark': len(self.out)}
+        try:
+            child_depth = handler(block, level['depth'])
+        except Exception as e:
+            self._fail(block, frame, e)
+            return SKIP
+
+        if child_depth is None or not self._children(block):
+            self._leave(block, None, frame)
+            return SKIP
+        frame['child_level'] = self._level(child_depth)
+        self.levels.append(frame['child_level'])
+        return frame
+
+    def _leave(self, block: Dict, _, frame: Dict):
+        if 'child_level' in frame:
+            self.levels.pop()
+        closer = self.closers.get(block['type'])
+        if closer:
+            try:
+                closer(block, frame['level']['depth'], frame['mark'])
+            except Exception as e:
+                self._fail(block, frame, e)
+                return
+        if len(self.out) > frame['mark']:
+            frame['level']['wrote'] = True
+        else:
+            # 没有输出的块不占空行
+            del self.out[frame['start']:]
+
+    def _fail(self, block: Dict, frame: Dict, error: Exception):
+        # 丢弃这个块已经写入的部分
+        del self.out[frame['start']:]
+        self.logger.error(f"Error converting block {block.get('id')}: {str(error)}")
+
+    def _pad(self, depth: int) -> str:
+        return ' ' * (self.dialect.list_indent * depth)
+
+    def _block_end(self, depth: int) -> str:
+        return self.dialect.block_end if depth == 0 else '\n'
+
+    def _children(self, block: Dict) -> List[Dict]:
+        return block.get('children', {}).get('results', [])
+
+    def _take(self, start: int) -> str:
+        """取出缓冲区中 start 之后的内容,用于需要整体加前缀的子块"""
+        text = ''.join(self.out[start:])
+        del self.out[start:]
+        return text
+
+    def _paragraph(self, block: Dict, depth: int) -> int:
+        text = self.rich_text(block['paragraph'].get('rich_text', []))
+        if text:
+            self.write_block(text, depth)
+        return depth
+
+    def _heading(self, block: Dict, depth: int) -> int:
+        block_type = block['type']
+        text = self.rich_text(block[block_type].get('rich_text', []))
+        if text:
+            level = min(6, int(block_type[-1]) + self.dialect.heading_offset)
+            self.write_block(f"{'#' * level} {text}", depth)
+        # 可折叠标题的子块
+        return depth
+
+    def _list_item(self, block: Dict, depth: int, marker: str) -> int:
+        text = self.rich_text(block[block['type']].get('rich_text', []))
+        self.write(f"{self._pad(depth)}{marker} {text}\n")
+        return depth + 1
+
+    def _bulleted_list_item(self, block: Dict, depth: int) -> int:
+        return self._list_item(block, depth, '-')
+
+    def _numbered_list_item(self, block: Dict, depth: int) -> int:
+        return self._list_item(block, depth, f"{self.levels[-1]['number']}.")
+
+    def _to_do(self, block: Dict, depth: int) -> int:
+        return self._list_item(block, depth, '- [x]' if block['to_do'].get('checked') else '- [ ]')
+
+    def _toggle(self, block: Dict, depth: int) -> int:
+        text = self.rich_text(block['toggle'].get('rich_text', []))
+        pad = self._pad(depth)
+        self.write(f"{pad}<details>\n{pad}<summary>{text}</summary>\n\n")
+        return depth
+
+    def _close_toggle(self, block: Dict, depth: int, start: int):
+        self.write(f"\n{self._pad(depth)}</details>" + self._block_end(depth))
+
+    def _quoted(self, block: Dict, depth: int) -> int:
+        # 子块先按顶层渲染,加前缀时再统一缩进
+        return 0
+
+    def _close_quote(self, block: Dict, depth: int, start: int):
+        self._blockquote(self.rich_text(block['quote'].get('rich_text', [])), depth, start)
+
+    def _close_callout(self, block: Dict, depth: int, start: int):
+        data = block['callout']
+        text = self.rich_text(data.get('rich_text', []))
+        icon = data.get('icon') or {}
+        if icon.get('type') == 'emoji':
+            text = f"{icon['emoji']} {text}"
+        self._blockquote(text, depth, start)
+
+    def _blockquote(self, text: str, depth: int, start: int):
+        """把块文本和已经渲染的子块整体加上引用前缀"""
+        inner = self._take(start).strip('\n')
+        body = '\n\n'.join(part for part in (text, inner) if part)
+        if body:
+            self.write_block('\n'.join(f"> {line}" if line else '>' for line in body.split('\n')), depth)
+
+    def _code(self, block: Dict, depth: int):
+        data = block['code']
+        text = self.rich_text(data.get('rich_text', []))
+        if text:
+            self.write_block(f"```{data.get('language', '')}\n{text}\n```", depth)
+
+    def _equation(self, block: Dict, depth: int):
+        expression = block['equation'].get('expression', '')
+        if expression:
+            self.write_block(f"$$\n{expression}\n$$", depth)
+
+    def _divider(self, block: Dict, depth: int):
+        self.write_block('---', depth)
+
+    def _bookmark(self, block: Dict, depth: int):
+        data = block['bookmark']
+        url = data.get('url')
+        if url:
+            caption = self.rich_text(data.get('caption', []))
+            self.write_block(f"[{caption or url}]({url})", depth)
+
+    def _image(self, block: Dict, depth: int):
+        info = image_info(block)
+        if info is None:
+            return
+        caption = self.rich_text(block['image'].get('caption', []))
+        # 如果有caption就用caption作为alt文本,否则用"image"
+        self.write_block(f"![{caption or 'image'}]({info['url']})", depth)
+
+    def _table(self, block: Dict, depth: int):
+        rows = []
+        for row in self._children(block):
+            if row['type'] != 'table_row':
+                continue
+            # 转义|字符
+            rows.append([self.rich_text(cell).replace('|', '\\|').strip() for cell in row['table_row']['cells']])
+        if not rows:
+            return
+
+        header_row = rows[0]
+        table = [
+            '| ' + ' | '.join(header_row) + ' |',
+            '| ' + ' | '.join(['---'] * len(header_row)) + ' |',
+        ]
+        for row in rows[1:]:
+            # 确保列数对齐
+            row = row + [''] * (len(header_row) - len(row))
+            table.append('| ' + ' | '.join(row) + ' |')
+        self.write_block('\n'.join(table), depth)
+
+    def _container(self, block: Dict, depth: int) -> int:
+        return depth
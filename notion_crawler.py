@@ -0,0 +1,380 @@
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from block_cache import BlockCache
+from crawl_checkpoint import CrawlCheckpoint
+from rate_limit import AdaptiveLimiter
+from tree_walk import SKIP, iter_tree, walk
+
+
+def strip_child_pages(blocks: List[Dict]) -> List[Dict]:
+    """复制块列表,子页面只保留块本身(其内容有独立的缓存条目)"""
+    stripped = []
+    targets = [stripped]  # 当前块的副本要加入的列表
+
+    def enter(block: Dict, _):
+        if block['type'] == 'child_page':
+            targets[-1].append({k: v for k, v in block.items() if k not in ('children', 'page_info', 'unchanged')})
+            return SKIP
+        if 'children' not in block:
+            targets[-1].append(block)
+            return SKIP
+        results = []
+        targets[-1].append({**block, 'children': {'results': results}})
+        targets.append(results)
+
+    walk(blocks, _block_children, enter, lambda block, depth, state: targets.pop())
+    return stripped
+
+
+def page_title(block: Dict) -> str:
+    """页面块的标题,子页面块取得页面信息之前使用块中的标题"""
+    try:
+        return block['page_info']['properties']['title']['title'][0]['plain_text']
+    except (KeyError, IndexError):
+        return block.get('child_page', {}).get('title') or 'Untitled'
+
+
+def _block_children(block: Dict) -> List[Dict]:
+    return block.get('children', {}).get('results', [])
+
+
+def _page_content_children(block: Dict) -> List[Dict]:
+    # 不进入子页面
+    return [] if block['type'] == 'child_page' else _block_children(block)
+
+
+class CrawlError(Exception):
+    """抓取中有请求在重试后仍然失败,结果不完整"""
+
+    def __init__(self, errors: List[Exception]):
+        super().__init__(f"{len(errors)} Notion requests failed, first error: {errors[0]}")
+        self.errors = errors
+
+
+class NotionCrawler:
+    """并发抓取Notion块树
+
+    使用固定大小的线程池按层展开块树,所有请求共用一个限流器,
+    限流和临时错误由限流器逐个请求重试。重试后仍失败的请求只让所在页面(子树)
+    重新抓取,最多 subtree_retries 轮;仍然失败时整次抓取抛出 CrawlError,
+    不会返回缺少内容的页面。
+    子块列表按 `start_cursor`/`has_more` 分页读取,每一页到达后立即展开其中的子块。
+    返回的结构与原先递归抓取一致: 有子项的块带 `children.results`,
+    子页面块额外带 `page_info`。
+
+    传入 is_unchanged(page_id, last_edited_time) 时启用增量抓取: 未变化的子页面
+    不再获取页面信息,也不回调其内容块,只列出子块(包括容器块中嵌套的)以发现
+    其下的子页面,并标记 `unchanged`。所有遇到的页面都记录在 `seen_pages` 中,子块(包括容器块中嵌套的)
+    全部列出或从缓存读出的页面记录在 `listed_pages` 中。
+
+    传入 cache 时,页面内容按 (page_id, last_edited_time) 读写块缓存;
+    offline 模式下只使用缓存,不发出任何请求。传入 checkpoint 时,每个完成的页面
+    同时写入检查点,中断后的下一次抓取从检查点继续,抓取成功后检查点被删除。
+
+    传入 on_block 时,需要内容的页面中每个普通块到达(或从缓存读出)后立即回调,
+    例如在抓取过程中就开始下载图片。回调在调度线程中执行,应尽快返回。
+
+    crawl_page 传入 on_page 时,每个需要内容的页面抓取完成(或从缓存读出)后立即回调
+    on_page(page_data, ancestors): page_data 是该页面的 {'page', 'blocks', 'unchanged'},
+    子页面只保留块本身;ancestors 是从根页面开始的上级页面标题。每个页面只回调一次,
+    交出的页面内容不再保留在返回的树中。
+    """
+
+    def __init__(self, notion, max_workers: int = 4, rate_limit: float = 3.0, page_size: int = 100,
+                 is_unchanged: Callable[[str, str], bool] = None, cache: BlockCache = None,
+                 offline: bool = False, on_block: Callable[[Dict], None] = None,
+                 limiter: AdaptiveLimiter = None, checkpoint: CrawlCheckpoint = None,
+                 subtree_retries: int = 2):
+        self.notion = notion
+        self.max_workers = max(1, max_workers)
+        # Notion单页最多返回100条
+        self.page_size = min(max(1, page_size), 100)
+        self.limiter = limiter or AdaptiveLimiter('notion', rate_limit)
+        self.is_unchanged = is_unchanged
+        self.cache = cache
+        self.checkpoint = checkpoint
+        self.subtree_retries = max(0, subtree_retries)
+        self.offline = offline
+        self.on_block = on_block
+        self.seen_pages = {}  # page_id -> last_edited_time
+        self.unchanged_pages = set()
+        self.listed_pages = set()  # 本次完整列出了子块的页面
+        self.on_page = None
+        self.emitted = set()
+        self.parents = {}  # 子页面id -> 上级页面id
+        self.titles = {}   # 页面id -> 标题
+        self.logger = logging.getLogger("NotionCrawler")
+
+    def crawl_page(self, page_id: str,
+                   on_page: Callable[[Dict, List[str]], None] = None) -> Dict:
+        """从根页面开始抓取,返回转换器使用的 {'page', 'blocks', 'unchanged'} 结构"""
+        if self.offline:
+            cached = self.cache.get_latest(page_id) if self.cache else None
+            if cached is None:
+                raise ValueError(f"Page {page_id} is not in the block cache")
+            page = cached['page']
+        else:
+            page = self._retrieve_page(page_id)
+
+        self.seen_pages = {page['id']: page.get('last_edited_time')}
+        self.unchanged_pages = set()
+        self.listed_pages = set()
+        self.on_page = on_page
+        self.emitted = set()
+        self.parents = {}
+        self.titles = {}
+        unchanged = bool(self.is_unchanged and page.get('last_edited_time')
+                         and self.is_unchanged(page['id'], page['last_edited_time']))
+        if unchanged:
+            self.unchanged_pages.add(page['id'])
+
+        root = {
+            'id': page['id'],
+            'type': 'root',
+            'has_children': True,
+            'last_edited_time': page.get('last_edited_time'),
+            'page_info': page
+        }
+        try:
+            self._crawl_into([root], shallow=unchanged)
+        finally:
+            self.on_page = None
+        if self.checkpoint:
+            self.checkpoint.clear()
+        if self.cache:
+            self.cache.evict()
+
+        self.logger.info(f"Crawled {len(self.seen_pages)} pages, {len(self.unchanged_pages)} unchanged")
+        return {'page': page, 'blocks': root.get('children', {}).get('results', []), 'unchanged': unchanged}
+
+    def _crawl_into(self, blocks: List[Dict], shallow: bool = False):
+        """并发展开给定块的子树,结果直接写回块中,失败的子树单独重试"""
+        # (块, 是否只展开子页面, 是否为重新获取子页面信息)
+        units = [(block, shallow, False) for block in blocks]
+        for attempt in range(self.subtree_retries + 1):
+            units, errors = self._crawl_round(units)
+            if not units:
+                return
+            if attempt < self.subtree_retries:
+                self.logger.warning(f"Retrying {len(units)} failed subtrees "
+                                    f"({attempt + 1}/{self.subtree_retries})")
+        raise CrawlError(errors)
+
+    def _crawl_round(self, units: List[Tuple[Dict, bool, bool]]) -> Tuple[List[Tuple[Dict, bool, bool]], List[Exception]]:
+        """展开一轮,返回需要重试的子树和错误
+
+        每个页面(根或子页面)对应一个抓取上下文,记录该页面尚未完成的请求数。
+        页面内容全部到达后写入块缓存和检查点。命中缓存的页面不再抓取内容,但编辑子页面
+        不会更新父页面的时间戳,所以缓存中的子页面块需要重新获取一次页面信息。
+        某个请求失败时,所在页面整体放入重试列表,其余请求的结果不再展开。
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # future -> (所属页面上下文, 任务类型, 所属块)
+            pending = {}
+            errors = []
+            failed = {}  # id(块) -> 重试单元
+
+            def submit(ctx: Dict, kind: str, block: Dict, fn, *args):
+                ctx['outstanding'] += 1
+                pending[executor.submit(fn, *args)] = (ctx, kind, block)
+
+            def list_children(ctx: Dict, block: Dict):
+                block['children'] = {'results': []}
+                submit(ctx, 'children', block, self._list_children_page, block['id'], None)
+
+            def open_page(block: Dict, shallow: bool):
+                ctx = {'block': block, 'shallow': shallow, 'outstanding': 0, 'failed': False}
+                self.titles[block['id']] = page_title(block)
+                self.seen_pages.setdefault(block['id'], block.get('last_edited_time'))
+                if self._load_cached(block):
+                    if self.on_block and not shallow:
+                        for cached in self._iter_tree(block['children']['results']):
+                            self.on_block(cached)
+                    self.listed_pages.add(block['id'])
+                    children = list(self._iter_child_pages(block['children']['results']))
+                    if not shallow:
+                        self._emit_page(block, strip_child_pages(block['children']['results']))
+                    for child in children:
+                        self.parents[child['id']] = block['id']
+                        if self.offline:
+                            expand(ctx, child)
+                        else:
+                            refresh = {'block': None, 'shallow': False, 'outstanding': 0, 'failed': True}
+                            submit(refresh, 'refresh', child, self._retrieve_page, child['id'])
+                    return
+
+                if self.offline:
+                    self.logger.warning(f"Page {block['id']} is not in the block cache, skipping")
+                    return
+                if block['type'] == 'child_page' and not shallow and 'page_info' not in block:
+                    submit(ctx, 'page', block, self._retrieve_page, block['id'])
+                if block.get('has_children', False):
+                    list_children(ctx, block)
+                finish(ctx)
+
+            def expand(ctx: Dict, block: Dict):
+                if block['type'] == 'child_page':
+                    if ctx['block'] is not None:
+                        self.parents[block['id']] = ctx['block']['id']
+                    open_page(block, self._mark_if_unchanged(block))
+                    return
+                if block['type'] == 'root':
+                    open_page(block, ctx['shallow'])
+                    return
+                # 未变化页面中的普通块不需要内容,但折叠块、分栏、同步块等容器中
+                # 可能嵌套子页面,仍要展开
+                if self.on_block and not ctx['shallow']:
+                    self.on_block(block)
+                if block.get('has_children', False):
+                    list_children(ctx, block)
+
+            def finish(ctx: Dict):
+                if ctx['outstanding'] == 0 and not ctx['failed']:
+                    self.listed_pages.add(ctx['block']['id'])
+                if ctx['outstanding'] == 0 and not ctx['failed'] and not ctx['shallow']:
+                    block = ctx['block']
+                    if self.cache or self.checkpoint or self.on_page:
+                        blocks = strip_child_pages(block.get('children', {}).get('results', []))
+                        self._store_cached(block, blocks)
+                        self._emit_page(block, blocks)
+
+            # 单独展开的普通块不属于任何完整页面,不写缓存
+            for block, shallow, refresh in units:
+                detached = {'block': None, 'shallow': shallow, 'outstanding': 0, 'failed': True}
+                if refresh:
+                    submit(detached, 'refresh', block, self._retrieve_page, block['id'])
+                else:
+                    # 重试时丢弃上一轮不完整的内容
+                    block.pop('children', None)
+                    expand(detached, block)
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    ctx, kind, block = pending.pop(future)
+                    ctx['outstanding'] -= 1
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        ctx['failed'] = True
+                        errors.append(e)
+                        self.logger.error(f"Error getting blocks for {block['id']}: {str(e)}")
+                        if kind == 'refresh':
+                            failed[id(block)] = (block, False, True)
+                        elif ctx['block'] is not None:
+                            failed[id(ctx['block'])] = (ctx['block'], ctx['shallow'], False)
+                        else:
+                            failed[id(block)] = (block, ctx['shallow'], False)
+                        continue
+
+                    if ctx['block'] is not None and ctx['failed']:
+                        # 所在页面会整体重试
+                        continue
+
+                    if kind == 'page':
+                        block['page_info'] = result
+                        self.seen_pages[block['id']] = result.get('last_edited_time')
+                    elif kind == 'refresh':
+                        block['page_info'] = result
+                        block['last_edited_time'] = result.get('last_edited_time')
+                        expand(ctx, block)
+                    else:
+                        # 先提交下一页,与子块展开并行
+                        if result.get('has_more'):
+                            submit(ctx, 'children', block, self._list_children_page, block['id'], result['next_cursor'])
+
+                        block['children']['results'].extend(result['results'])
+                        for child in result['results']:
+                            expand(ctx, child)
+
+                    finish(ctx)
+
+            return list(failed.values()), errors
+
+    def _load_cached(self, block: Dict) -> bool:
+        """用检查点或缓存填充页面块,命中返回True"""
+        last_edited_time = block.get('last_edited_time')
+        if not last_edited_time:
+            return False
+        entry = None
+        if self.offline:
+            entry = self.cache.get_latest(block['id']) if self.cache else None
+        else:
+            if self.checkpoint:
+                entry = self.checkpoint.get(block['id'], last_edited_time)
+            if entry is None and self.cache:
+                entry = self.cache.get(block['id'], last_edited_time)
+        if entry is None:
+            return False
+
+        block['page_info'] = entry['page']
+        block['children'] = {'results': entry['blocks']}
+        self.seen_pages[block['id']] = entry['page'].get('last_edited_time')
+        return True
+
+    def _store_cached(self, block: Dict, blocks: List[Dict]):
+        last_edited_time = block.get('last_edited_time')
+        if not (self.cache or self.checkpoint) or not last_edited_time or 'page_info' not in block:
+            return
+        entry = {'page': block['page_info'], 'blocks': blocks}
+        if self.checkpoint:
+            self.checkpoint.add(block['id'], last_edited_time, entry)
+        if self.cache:
+            try:
+                self.cache.put(block['id'], last_edited_time, entry)
+            except Exception as e:
+                self.logger.error(f"Error writing block cache for {block['id']}: {str(e)}")
+
+    def _emit_page(self, block: Dict, blocks: List[Dict]):
+        """把完成的页面交给 on_page,之后树中不再保留其内容"""
+        if not self.on_page or block['id'] in self.emitted or 'page_info' not in block:
+            return
+        self.emitted.add(block['id'])
+        ancestors = []
+        parent = self.parents.get(block['id'])
+        while parent is not None and len(ancestors) < len(self.titles):
+            ancestors.append(self.titles.get(parent, 'Untitled'))
+            parent = self.parents.get(parent)
+        self.on_page({'page': block['page_info'], 'blocks': blocks, 'unchanged': False}, ancestors[::-1])
+        # 子页面块仍在上级页面的树中,只去掉已交出的内容
+        block['children'] = {'results': []}
+
+    def _iter_tree(self, blocks: List[Dict]) -> Iterator[Dict]:
+        """遍历块树中的普通块,不进入子页面"""
+        return (block for block in iter_tree(blocks, _page_content_children) if block['type'] != 'child_page')
+
+    def _iter_child_pages(self, blocks: List[Dict]) -> Iterator[Dict]:
+        """找出块树中的所有子页面块"""
+        return (block for block in iter_tree(blocks, _page_content_children) if block['type'] == 'child_page')
+
+    def _mark_if_unchanged(self, block: Dict) -> bool:
+        """子页面未变化时用块信息生成page_info并标记,返回是否未变化"""
+        last_edited_time = block.get('last_edited_time')
+        if not self.is_unchanged or not last_edited_time:
+            return False
+        if not self.is_unchanged(block['id'], last_edited_time):
+            return False
+
+        block['unchanged'] = True
+        block.setdefault('page_info', {
+            'id': block['id'],
+            'created_time': block.get('created_time', last_edited_time),
+            'last_edited_time': last_edited_time,
+            'properties': {
+                'title': {'title': [{'plain_text': block['child_page'].get('title', 'Untitled')}]}
+            }
+        })
+        self.seen_pages[block['id']] = last_edited_time
+        self.unchanged_pages.add(block['id'])
+        return True
+
+    def _list_children_page(self, block_id: str, cursor: Optional[str]) -> Dict:
+        kwargs = {'page_size': self.page_size}
+        if cursor:
+            kwargs['start_cursor'] = cursor
+        return self.limiter.call(self.notion.blocks.children.list, block_id, **kwargs)
+
+    def _retrieve_page(self, page_id: str) -> Dict:
+        return self.limiter.call(self.notion.pages.retrieve, page_id)
@@ -1,28 +1,41 @@
 import argparse
-import json
+import hashlib
+import html
 import logging
 import os
 import re
 import sys
 from datetime import datetime
 from typing import Dict, List, Tuple, Optional
-import requests
 import yaml
-from github import Github
 from notion_client import Client as NotionClient
-from retrying import retry
+
+from block_cache import BlockCache
+from crawl_checkpoint import CrawlCheckpoint
+from github_publisher import GitHubBatchPublisher, git_blob_sha
+from http_transport import HttpTransport
+from image_pipeline import ImageCache, ImagePipeline, image_hashes, image_info, rewrite_urls
+from local_publisher import LocalRepoPublisher
+from markdown_renderer import HEXO, MarkdownRenderer
+from notion_crawler import NotionCrawler
+from pipeline import Pipeline, Stage, process_pool
+from rate_limit import RateLimits
+from state_store import DEFAULT_REPO_STATE_PATH, SyncStateStore, create_state_backend
+from tag_engine import TagEngine
 
 
 class HexoContentConvert:
     """Hexo格式内容转换器"""
     
-    def __init__(self, hexo_config: dict):
+    def __init__(self, hexo_config: dict, responsive_images: bool = False):
         self.hexo_config = hexo_config
-        self.list_states = []
-        self.current_numbered_list = 0
-        self.in_numbered_list = False
-        self.numbered_list_counter = 0
-        self.processed_pages = set()
+        self.responsive_images = responsive_images
+        self.tag_engine = TagEngine.from_config(hexo_config)
+        self.tags_from_body = bool(hexo_config.get('tags_from_body', False))
+        self.page_title = None
+        self.renderer = MarkdownRenderer(HEXO)
+        # 图片需要登记到 pending_images,替换默认的图片处理
+        self.renderer.register('image', self._render_image)
         self.logger = logging.getLogger("HexoConvert")
         
     def convert_to_hexo_post(self, page_data: Dict, categories: List[str] = None) -> Tuple[str, str, List[Dict]]:
@@ -48,18 +61,19 @@ class HexoContentConvert:
         safe_title = self._sanitize_filename(title)
         filename = f"{date_str}-{safe_title}.md"
         
-        # 构建Front Matter
-        front_matter = self._build_front_matter(title, created_time, categories)
-        
         # 转换内容（传递标题用于图片处理）
         content = self._convert_page_content(page_data, include_title=False, page_title=title)
         
+        # 构建Front Matter
+        front_matter = self._build_front_matter(title, created_time, categories, content)
+        
         # 组合最终内容
         full_content = f"{front_matter}\n{content}"
         
         return filename, full_content, self.pending_images
     
-    def _build_front_matter(self, title: str, created_time: str, categories: List[str] = None) -> str:
+    def _build_front_matter(self, title: str, created_time: str, categories: List[str] = None,
+                            content: str = None) -> str:
         """构建Hexo的Front Matter"""
         # 格式化日期
         date = datetime.fromisoformat(created_time.replace('Z', '+00:00'))
@@ -73,8 +87,8 @@ date: {date_str}"""
         if categories and len(categories) > 0:
             front_matter += f"\ncategories: {categories[0]}"
         
-        # 根据标题推测标签
-        tags = self._extract_tags_from_title(title)
+        # 根据标题(和正文)推测标签
+        tags = self.tag_engine.extract(title, content if self.tags_from_body else None)
         if tags:
             front_matter += "\ntags:"
             for tag in tags:
@@ -83,50 +97,6 @@ date: {date_str}"""
         front_matter += "\n---"
         return front_matter
     
-    def _extract_tags_from_title(self, title: str) -> List[str]:
-        """从标题中提取可能的标签"""
-        tags = []
-        
-        # 技术关键词映射
-        tech_keywords = {
-            'spring': ['Spring', 'Java'],
-            'react': ['React', 'Frontend'],
-            'vue': ['Vue', 'Frontend'],
-            'docker': ['Docker', 'DevOps'],
-            'kubernetes': ['Kubernetes', 'K8s', 'DevOps'],
-            'python': ['Python'],
-            'java': ['Java'],
-            'javascript': ['JavaScript', 'JS'],
-            'typescript': ['TypeScript', 'TS'],
-            'golang': ['Go', 'Golang'],
-            'rust': ['Rust'],
-            'mysql': ['MySQL', 'Database'],
-            'redis': ['Redis', 'Cache'],
-            'kafka': ['Kafka', 'MessageQueue'],
-            'rabbitmq': ['RabbitMQ', 'MessageQueue'],
-            'elasticsearch': ['Elasticsearch', 'Search'],
-            'mongodb': ['MongoDB', 'NoSQL'],
-            'git': ['Git', 'Version Control'],
-            'linux': ['Linux', 'OS'],
-            'aws': ['AWS', 'Cloud'],
-            'azure': ['Azure', 'Cloud'],
-            'langchain': ['LangChain', 'AI'],
-            'ai': ['AI', 'Artificial Intelligence'],
-            'ml': ['Machine Learning', 'ML'],
-            'rag': ['RAG', 'AI'],
-            'llm': ['LLM', 'AI'],
-        }
-        
-        # 转换为小写进行匹配
-        title_lower = title.lower()
-        
-        for keyword, tag_list in tech_keywords.items():
-            if keyword in title_lower:
-                tags.extend(tag_list)
-        
-        # 去重
-        return list(set(tags))
-    
     def _get_page_title(self, page: Dict) -> str:
         """获取页面标题"""
         try:
@@ -151,9 +121,7 @@ date: {date_str}"""
     
     def _convert_page_content(self, page_data: Dict, include_title: bool = True, page_title: str = None) -> str:
         """转换页面内容为Markdown"""
-        # 重置计数器
-        self.numbered_list_counter = 0
-        
+        self.page_title = page_title
         markdown_lines = []
         
         if include_title:
@@ -167,141 +135,25 @@ date: {date_str}"""
             if isinstance(blocks, dict) and 'results' in blocks:
                 blocks = blocks['results']
             
-            for block in blocks:
-                # 跳过子页面块（这些会被单独处理）
-                if block['type'] == 'child_page':
-                    continue
-                    
-                block_content = self._convert_block(block, page_title=page_title)
-                if block_content:
-                    markdown_lines.append(block_content)
+            # 子页面块没有注册处理函数,会被单独处理
+            markdown_lines.append(self.renderer.render(blocks))
         
         return '\n'.join(filter(None, markdown_lines))
     
-    def _convert_block(self, block: Dict, page_title: str = None) -> str:
-        """转换单个块为Markdown"""
-        try:
-            block_type = block['type']
-            block_data = block.get(block_type, {})
-            
-            # 处理各种块类型
-            if block_type == 'paragraph':
-                text = self._convert_rich_text(block_data.get('rich_text', []))
-                return f"{text}\n" if text else ''
-                
-            elif block_type == 'heading_1':
-                text = self._convert_rich_text(block_data.get('rich_text', []))
-                return f"## {text}\n" if text else ''
-                
-            elif block_type == 'heading_2':
-                text = self._convert_rich_text(block_data.get('rich_text', []))
-                return f"### {text}\n" if text else ''
-                
-            elif block_type == 'heading_3':
-                text = self._convert_rich_text(block_data.get('rich_text', []))
-                return f"#### {text}\n" if text else ''
-                
-            elif block_type == 'bulleted_list_item':
-                indent = "  " * len(self.list_states)
-                text = self._convert_rich_text(block_data.get('rich_text', []))
-                result = f"{indent}- {text}\n"
-                
-                if block.get('has_children') and 'children' in block:
-                    self.list_states.append('bulleted')
-                    for child in block['children']['results']:
-                        child_content = self._convert_block(child, page_title)
-                        if child_content:
-                            result += child_content
-                    if self.list_states:  # 检查列表是否为空
-                        self.list_states.pop()
-                
-                return result
-                
-            elif block_type == 'numbered_list_item':
-                if not self.in_numbered_list:
-                    self.current_numbered_list = 0
-                    self.list_states = []
-                
-                self.in_numbered_list = True
-                self.current_numbered_list += 1
-                indent = "  " * len(self.list_states)
-                text = self._convert_rich_text(block_data.get('rich_text', []))
-                result = f"{indent}{self.current_numbered_list}. {text}\n"
-                
-                if block.get('has_children') and 'children' in block:
-                    self.list_states.append('numbered')
-                    for child in block['children']['results']:
-                        child_content = self._convert_block(child, page_title)
-                        if child_content:
-                            result += child_content
-                    if self.list_states:  # 检查列表是否为空
-                        self.list_states.pop()
-                
-                return result
-                
-            elif block_type == 'code':
-                text = self._convert_rich_text(block_data.get('rich_text', []))
-                language = block_data.get('language', '')
-                return f"```{language}\n{text}\n```\n" if text else ''
-                
-            elif block_type == 'quote':
-                text = self._convert_rich_text(block_data.get('rich_text', []))
-                return f"> {text}\n" if text else ''
-                
-            elif block_type == 'image':
-                return self._handle_image(block_data, page_title)
-                
-            elif block_type == 'table':
-                table_data = block.get('table', {})
-                children = block.get('children', {}).get('results', [])
-                return self._handle_table(table_data, block['id'], children)
-            
-            # 重置列表状态
-            if block_type not in ['bulleted_list_item', 'numbered_list_item']:
-                self.in_numbered_list = False
-                self.list_states = []
-            
-            return ""
-            
-        except Exception as e:
-            self.logger.error(f"Error converting block: {str(e)}")
-            return ""
-    
-    def _convert_rich_text(self, rich_text: List[Dict]) -> str:
-        """转换富文本"""
-        if not rich_text:
-            return ""
-        
-        text_parts = []
-        for text in rich_text:
-            content = text.get('plain_text', '')
-            annotations = text.get('annotations', {})
-            
-            # 处理文本格式
-            if annotations.get('bold'):
-                content = f"**{content}**"
-            if annotations.get('italic'):
-                content = f"*{content}*"
-            if annotations.get('strikethrough'):
-                content = f"~~{content}~~"
-            if annotations.get('code'):
-                content = f"`{content}`"
-            
-            # 处理链接
-            if text.get('href'):
-                content = f"[{content}]({text['href']})"
-            
-            text_parts.append(content)
-        
-        return ''.join(text_parts)
-    
-    def _handle_image(self, image_data: Dict, page_title: str = None) -> str:
+    def _render_image(self, block: Dict, depth: int):
+        markup = self._handle_image(block, self.page_title)
+        if markup:
+            self.renderer.write_block(markup, depth)
+
+    def _handle_image(self, block: Dict, page_title: str = None) -> str:
         """处理图片"""
         try:
-            url = image_data['file']['url']
+            image_data = block['image']
+            info = image_info(block)
+            url = info['url']
             caption = ""
             if image_data.get('caption'):
-                caption = self._convert_rich_text(image_data['caption'])
+                caption = self.renderer.rich_text(image_data['caption'])
             
             alt_text = caption if caption else "image"
             
@@ -310,74 +162,106 @@ date: {date_str}"""
                 self.pending_images = []
             
             self.pending_images.append({
-                'url': url,
+                **info,
                 'page_title': page_title or 'untitled',
                 'alt_text': alt_text
             })
             
             # 返回占位符，后续会替换为实际路径
-            return f"![{alt_text}]({url})\n"
+            if self.responsive_images:
+                # srcset和尺寸在图片转码后补到 src 属性之后
+                return f'<img src="{url}" alt="{html.escape(alt_text)}" loading="lazy" decoding="async">'
+            return f"![{alt_text}]({url})"
             
         except Exception as e:
             self.logger.error(f"Error handling image: {str(e)}")
             return ""
     
-    def _handle_table(self, table_data: Dict, block_id: str, children: List[Dict]) -> str:
-        """处理表格"""
-        if not children:
-            return ""
-        
-        rows = []
-        header_row = None
-        
-        for row in children:
-            if row['type'] != 'table_row':
-                continue
-            
-            cells = []
-            for cell in row['table_row']['cells']:
-                cell_text = self._convert_rich_text(cell)
-                cell_text = cell_text.replace('|', '\\|') if cell_text else ''
-                cells.append(cell_text.strip())
-            
-            if not header_row:
-                header_row = cells
-            else:
-                rows.append(cells)
-        
-        if not header_row:
-            return ""
-        
-        # 构建Markdown表格
-        table = []
-        table.append('| ' + ' | '.join(header_row) + ' |')
-        table.append('| ' + ' | '.join(['---'] * len(header_row)) + ' |')
-        
-        for row in rows:
-            while len(row) < len(header_row):
-                row.append('')
-            table.append('| ' + ' | '.join(row) + ' |')
-        
-        return '\n'.join(table) + '\n'
+# 渲染进程中的转换器,每个进程创建一次
+_process_converter = None
+
+
+def render_post(hexo_config: dict, responsive_images: bool, page_data: Dict,
+                categories: List[str] = None) -> Tuple[str, str, List[Dict]]:
+    """在渲染进程中转换一篇文章,结果与 HexoContentConvert.convert_to_hexo_post 相同"""
+    global _process_converter
+    converter = _process_converter
+    if converter is None or (converter.hexo_config, converter.responsive_images) != (hexo_config, responsive_images):
+        converter = _process_converter = HexoContentConvert(hexo_config, responsive_images=responsive_images)
+    return converter.convert_to_hexo_post(page_data, categories)
 
 
 class NotionToHexoSync:
     """Notion到Hexo博客同步工具"""
     
-    def __init__(self, config_path: str = None):
+    def __init__(self, config_path: str = None, offline: bool = False, render_workers: int = None):
         self.config = self._load_config(config_path)
         self.logger = self._setup_logger()
+        self.offline = offline
+        # 渲染进程数,0 表示在转换线程中渲染
+        self.render_workers = int(self.config['render_workers'] if render_workers is None else render_workers)
+        self.render_pool = None
+        
+        # 各服务共享的限流器,限流和临时错误在这里逐个请求重试
+        self.limits = RateLimits({
+            'notion': float(self.config['notion_rate_limit']),
+            'github': float(self.config['github_rate_limit']),
+            'images': float(self.config['image_rate_limit']),
+        }, max_retries=int(self.config['rate_limit_max_retries']))
+        
+        # 初始化客户端,共用连接池配置,请求之间复用连接
+        self.transport = HttpTransport(pool_size=int(self.config['http_pool_size']), http2=bool(self.config['http2']))
+        self.notion = NotionClient(auth=self.config['notion_token'], client=self.transport.notion_client())
+        self.github = self.transport.github(self.config['github_token']) if self.config.get('github_token') else None
+        
+        # 块缓存,离线模式必须启用
+        self.cache = None
+        if self.config['block_cache'] or offline:
+            self.cache = BlockCache(self.config['cache_dir'],
+                                    max_bytes=int(self.config['cache_max_mb']) * 1024 * 1024)
+        
+        # 图片在抓取过程中即开始下载,签名URL过期时重新获取图片块
+        self.image_pipeline = ImagePipeline(
+            self.config['hexo_images_path'],
+            self.config['hexo_images_url'],
+            max_workers=int(self.config['image_workers']),
+            cache=ImageCache(self.config['cache_dir']) if self.config['block_cache'] else None,
+            resolve_url=self._resolve_image_url,
+            image_format=self.config['image_format'],
+            max_dimension=int(self.config['image_max_dimension']),
+            widths=[int(width) for width in self.config['image_widths']],
+            quality=int(self.config['image_quality']),
+            process_workers=int(self.config['image_process_workers']),
+            limiter=self.limits.get('images'),
+            session=self.transport.session()
+        )
         
-        # 初始化客户端
-        self.notion = NotionClient(auth=self.config['notion_token'])
-        self.github = Github(self.config['github_token'])
-        
-        # 初始化转换器
-        self.converter = HexoContentConvert(self.config.get('hexo', {}))
+        # 抓取检查点,中断后下次运行从已完成的页面继续
+        checkpoint = None
+        if self.config['crawl_checkpoint'] and not offline:
+            checkpoint = CrawlCheckpoint(os.path.join(self.config['cache_dir'], "hexo_crawl_checkpoint.jsonl"))
+        
+        # 离线重建需要输出所有页面,不做增量判断
+        incremental = self.config['incremental_crawl'] and not offline
+        self.crawler = NotionCrawler(
+            self.notion,
+            max_workers=int(self.config['crawl_workers']),
+            page_size=int(self.config['notion_page_size']),
+            is_unchanged=self._is_unchanged if incremental else None,
+            cache=self.cache,
+            offline=offline,
+            on_block=None if offline else self.image_pipeline.prefetch,
+            limiter=self.limits.get('notion'),
+            checkpoint=checkpoint,
+            subtree_retries=int(self.config['crawl_subtree_retries'])
+        )
         
-        # 同步状态
-        self.sync_status_file = "hexo_sync_status.json"
-        self.last_sync_times = self._load_sync_status()
+        # 同步状态在 sync 开始时打开,保存在仓库中时需要先创建发布器
+        self.state_backend = create_state_backend(self.config['state_backend'], self.config['state_db'],
+                                                  cache_dir=self.config['cache_dir'],
+                                                  repo_path=self.config['state_repo_path'])
+        self.state = None
+        self.publisher = None
         
         self.logger.info("NotionToHexoSync initialized")
     
@@ -392,7 +276,11 @@ class NotionToHexoSync:
             "NOTION_PAGE_ID": "notion_page_id",
             "HEXO_REPO": "hexo_repo",
             "HEXO_SOURCE_BRANCH": "hexo_source_branch",
-            "BLOG_REPO": "blog_repo"
+            "BLOG_REPO": "blog_repo",
+            "HEXO_PUBLISH_BACKEND": "hexo_publish_backend",
+            "HEXO_LOCAL_PATH": "hexo_local_path",
+            "HEXO_LOCAL_COMMIT": "hexo_local_commit",
+            "SYNC_STATE_BACKEND": "state_backend"
         }
         
         # 从环境变量读取
@@ -417,9 +305,50 @@ class NotionToHexoSync:
         config.setdefault('hexo_source_branch', 'master')
         config.setdefault('hexo_posts_path', 'source/_posts')
         config.setdefault('hexo_images_path', 'source/medias/featureimages/blog')
-        
-        # 验证必需配置
-        required_keys = ["notion_token", "github_token", "notion_page_id", "hexo_repo"]
+        # 图片在博客中的访问路径,默认去掉 source/ 前缀
+        images_path = config['hexo_images_path'].strip('/')
+        config.setdefault('hexo_images_url', '/' + (images_path[len('source/'):] if images_path.startswith('source/') else images_path))
+        config.setdefault('image_workers', 4)
+        config.setdefault('image_format', 'original')
+        config.setdefault('image_max_dimension', 1920)
+        config.setdefault('image_widths', [480, 960])
+        config.setdefault('image_quality', 80)
+        config.setdefault('image_process_workers', 2)
+        config.setdefault('hexo_publish_backend', 'github')
+        config.setdefault('hexo_local_path', '../blog')
+        config.setdefault('hexo_local_commit', False)
+        # 环境变量中的布尔值是字符串
+        if isinstance(config['hexo_local_commit'], str):
+            config['hexo_local_commit'] = config['hexo_local_commit'].lower() in ('1', 'true', 'yes')
+        config.setdefault('crawl_workers', 4)
+        config.setdefault('notion_rate_limit', 3)
+        config.setdefault('github_rate_limit', 10)
+        config.setdefault('image_rate_limit', 20)
+        config.setdefault('rate_limit_max_retries', 5)
+        config.setdefault('http_pool_size', 10)
+        config.setdefault('http2', False)
+        config.setdefault('notion_page_size', 100)
+        config.setdefault('incremental_crawl', True)
+        config.setdefault('crawl_checkpoint', True)
+        config.setdefault('crawl_subtree_retries', 2)
+        config.setdefault('pipeline_convert_workers', 2)
+        config.setdefault('pipeline_publish_workers', 1)
+        config.setdefault('pipeline_queue_size', 8)
+        config.setdefault('render_workers', 0)
+        config.setdefault('state_db', 'hexo_sync_state.sqlite')
+        config.setdefault('state_backend', 'local')
+        config.setdefault('state_repo_path', DEFAULT_REPO_STATE_PATH)
+        config.setdefault('block_cache', True)
+        config.setdefault('cache_dir', '.notion_cache')
+        config.setdefault('cache_max_mb', 200)
+        
+        if config['hexo_publish_backend'] not in ('github', 'local'):
+            raise ValueError(f"Unknown hexo_publish_backend: {config['hexo_publish_backend']}")
+        
+        # 验证必需配置(本地发布不需要GitHub)
+        required_keys = ["notion_token", "notion_page_id"]
+        if config['hexo_publish_backend'] == 'github':
+            required_keys += ["github_token", "hexo_repo"]
         missing_keys = [key for key in required_keys if not config.get(key)]
         if missing_keys:
             raise ValueError(f"Missing required configuration: {', '.join(missing_keys)}")
@@ -438,247 +367,226 @@ class NotionToHexoSync:
         )
         return logging.getLogger("NotionToHexoSync")
     
-    def _load_sync_status(self) -> dict:
-        """加载同步状态"""
-        try:
-            if os.path.exists(self.sync_status_file):
-                with open(self.sync_status_file, 'r') as f:
-                    return json.load(f)
-            return {}
-        except Exception as e:
-            self.logger.error(f"Error loading sync status: {str(e)}")
-            return {}
-    
-    def _save_sync_status(self):
-        """保存同步状态"""
-        try:
-            with open(self.sync_status_file, 'w') as f:
-                json.dump(self.last_sync_times, f)
-        except Exception as e:
-            self.logger.error(f"Error saving sync status: {str(e)}")
-    
     def _needs_update(self, page_id: str, last_edited_time: str) -> bool:
         """检查是否需要更新"""
-        if page_id not in self.last_sync_times:
+        synced_time = self.state.last_edited_time(page_id)
+        if not synced_time:
             return True
         
         try:
-            last_sync = datetime.fromisoformat(self.last_sync_times[page_id].replace('Z', '+00:00'))
+            last_sync = datetime.fromisoformat(synced_time.replace('Z', '+00:00'))
             current_edit = datetime.fromisoformat(last_edited_time.replace('Z', '+00:00'))
             return current_edit > last_sync
         except Exception as e:
             self.logger.error(f"Error comparing timestamps: {str(e)}")
             return True
     
-    @retry(stop_max_attempt_number=3, wait_fixed=2000)
-    def _get_notion_content(self) -> Dict:
-        """获取Notion内容"""
-        try:
-            self.logger.info(f"Fetching content from Notion page {self.config['notion_page_id']}")
-            
-            # 获取根页面
-            root_page = self.notion.pages.retrieve(self.config['notion_page_id'])
-            
-            # 获取所有内容
-            content = {
-                'page': root_page,
-                'blocks': self._get_all_blocks(self.config['notion_page_id'])
-            }
-            
-            return content
-        except Exception as e:
-            self.logger.error(f"Error getting Notion content: {str(e)}")
-            raise
+    def _is_unchanged(self, page_id: str, last_edited_time: str) -> bool:
+        """抓取时判断子页面是否可以跳过"""
+        return not self._needs_update(page_id, last_edited_time)
     
-    def _get_all_blocks(self, block_id: str) -> List[Dict]:
-        """递归获取所有块"""
-        blocks = []
-        try:
-            response = self.notion.blocks.children.list(block_id)
-            blocks = response['results']
-            
-            for block in blocks:
-                if block.get('has_children', False):
-                    child_id = block['id']
-                    child_blocks = self._get_all_blocks(child_id)
-                    block['children'] = {
-                        'results': child_blocks
-                    }
-                    
-                    if block['type'] == 'child_page':
-                        child_page = self.notion.pages.retrieve(child_id)
-                        block['page_info'] = child_page
-            
-            return blocks
-            
-        except Exception as e:
-            self.logger.error(f"Error getting blocks for {block_id}: {str(e)}")
-            return blocks
+    def _new_converter(self) -> HexoContentConvert:
+        """创建转换器,转换线程各用一个"""
+        return HexoContentConvert(self.config.get('hexo') or {},
+                                  responsive_images=self.image_pipeline.transcoding)
     
-    def _process_pages_recursively(self, page_data: Dict, categories: List[str] = None) -> List[Tuple[str, str, str, str, List[Dict]]]:
-        """
-        递归处理页面
-        返回: [(文件名, 内容, page_id, last_edited_time, 图片列表), ...]
+    def _convert_stage(self):
+        """转换线程的处理函数,上级页面标题作为分类
+        返回: (文件名, 内容, page_id, last_edited_time, 图片列表)
         """
-        results = []
+        converter = None if self.render_pool else self._new_converter()
         
-        try:
+        def convert(item: Tuple[Dict, List[str]]):
+            page_data, categories = item
             page = page_data['page']
-            page_id = page['id']
-            last_edited_time = page.get('last_edited_time')
-            
-            # 获取标题作为分类
-            title = self.converter._get_page_title(page)
-            current_categories = categories.copy() if categories else []
-            
-            # 转换当前页面
-            filename, content, images = self.converter.convert_to_hexo_post(page_data, current_categories)
-            results.append((filename, content, page_id, last_edited_time, images))
-            
-            # 将当前页面标题添加到分类路径
-            current_categories.append(title)
-            
-            # 处理子页面
-            if 'blocks' in page_data:
-                blocks = page_data['blocks']
-                for block in blocks:
-                    if block['type'] == 'child_page':
-                        child_page_data = {
-                            'page': block['page_info'],
-                            'blocks': block.get('children', {}).get('results', [])
-                        }
-                        child_results = self._process_pages_recursively(child_page_data, current_categories)
-                        results.extend(child_results)
-            
-            return results
-            
-        except Exception as e:
-            self.logger.error(f"Error processing page: {str(e)}")
-            return results
+            try:
+                if self.render_pool:
+                    filename, content, images = self.render_pool.submit(
+                        render_post, self.config.get('hexo') or {}, self.image_pipeline.transcoding,
+                        page_data, categories).result()
+                else:
+                    filename, content, images = converter.convert_to_hexo_post(page_data, categories)
+            except Exception as e:
+                self.logger.error(f"Error processing page: {str(e)}")
+                return None
+            return filename, content, page['id'], page.get('last_edited_time'), images
+        return convert
+    
+    def _publish_stage(self):
+        """发布线程的处理函数: 离线模式写入本地目录,否则下载图片并暂存文章"""
+        def publish(post: Tuple[str, str, str, str, List[Dict]]):
+            filename, content, page_id, last_edited_time, images = post
+            # 离线模式图片保留原链接
+            if self.offline:
+                file_path = os.path.join(self.config['hexo_posts_path'], filename)
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    f.write(content)
+                self.logger.info(f"Wrote {file_path}")
+                return
+            if not self._needs_update(page_id, last_edited_time):
+                self.logger.info(f"Content not changed for {filename}, skipping update")
+                return
+            # 抓取时已开始下载的图片直接取结果,其余的并发下载
+            image_urls = self.image_pipeline.process(images, self.publisher)
+            self._update_hexo_repo(filename, content, page_id, last_edited_time, image_urls)
+        return publish
+    
+    def _resolve_image_url(self, block_id: str) -> str:
+        """重新获取图片块,得到新的签名URL"""
+        block = self.limits.get('notion').call(self.notion.blocks.retrieve, block_id)
+        return image_info(block)['url']
     
-    def _update_hexo_repo(self, filename: str, content: str, page_id: str, last_edited_time: str, images: List[Dict]):
-        """更新Hexo仓库"""
-        if not self._needs_update(page_id, last_edited_time):
-            self.logger.info(f"Content not changed for {filename}, skipping update")
+    def _create_publisher(self):
+        """按配置选择发布方式: GitHub API 或本地工作副本"""
+        if self.config['hexo_publish_backend'] == 'local':
+            self.logger.info(f"Publishing to local checkout {self.config['hexo_local_path']}")
+            return LocalRepoPublisher(self.config['hexo_local_path'], git_commit=self.config['hexo_local_commit'])
+        
+        github_limiter = self.limits.get('github')
+        repo = github_limiter.call(self.github.get_repo, self.config['hexo_repo'])
+        return GitHubBatchPublisher(repo, self.config['hexo_source_branch'], limiter=github_limiter)
+    
+    def _update_hexo_repo(self, filename: str, content: str, page_id: str, last_edited_time: str,
+                          image_urls: Dict[str, str]):
+        """暂存文章,在本次同步结束时与图片一起提交"""
+        # 一次扫描替换内容中的图片URL,下载失败的图片保留原链接
+        content = rewrite_urls(content, image_urls)
+        
+        # 构建文件路径
+        file_path = f"{self.config['hexo_posts_path']}/{filename}"
+        
+        # 标准化路径
+        file_path = file_path.replace(os.sep, '/')
+        
+        if self.publisher.stage(file_path, content):
+            self.logger.info(f"Staged file {file_path}")
+        else:
+            self.logger.info(f"Content identical to remote for {file_path}, skipping upload")
+        self.state.stage(page_id, last_edited_time,
+                         content_hash=hashlib.sha256(content.encode('utf-8')).hexdigest(),
+                         remote_path=file_path, blob_sha=git_blob_sha(content),
+                         image_hashes=image_hashes(image_urls), parent_id=self.crawler.parents.get(page_id))
+    
+    def _prune_stale_files(self):
+        """删除改名、移动或已删除(取消分享)的页面留下的旧文件
+        
+        旧路径来自状态中的 page_id -> 路径索引,不需要列出仓库;只有上级页面本次完整列出时,
+        没有遇到的页面才算已删除(见 SyncStateStore.prune)。
+        """
+        for path in self.state.prune(self.crawler.seen_pages, self.crawler.listed_pages):
+            if self.publisher.delete(path):
+                self.logger.info(f"Staged deletion of {path}")
+    
+    def _publish(self):
+        """把本次同步的所有文章和图片合并成一个提交"""
+        self._prune_stale_files()
+        if not self.publisher.has_changes:
+            self.logger.info("No changes to publish")
+            self._commit_sync_status()
+            if self.publisher.has_changes:
+                # 文章都与远端一致,只有仓库中的状态文件需要更新
+                self.publisher.commit("Update Notion sync state")
             return
         
         try:
-            repo = self.github.get_repo(self.config['hexo_repo'])
-            
-            # 先处理图片
-            if images:
-                for img in images:
-                    new_url = self._download_and_save_image(img['url'], img['page_title'])
-                    # 替换内容中的图片URL
-                    content = content.replace(img['url'], new_url)
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            message = f"Sync from Notion {now}: {len(self.publisher.staged)} files"
             
-            # 构建文件路径
-            file_path = f"{self.config['hexo_posts_path']}/{filename}"
+            # 状态保存在仓库中时与文章放进同一个提交,否则提交成功后再更新
+            in_repo = self.state_backend.in_repo
+            if in_repo:
+                self._commit_sync_status()
             
-            # 标准化路径
-            file_path = file_path.replace(os.sep, '/')
+            self.publisher.commit(message)
             
-            # 更新或创建文件
-            try:
-                file = repo.get_contents(file_path, ref=self.config['hexo_source_branch'])
-                repo.update_file(
-                    file_path,
-                    f"Update from Notion: {filename}",
-                    content,
-                    file.sha,
-                    branch=self.config['hexo_source_branch']
-                )
-                self.logger.info(f"Updated file {file_path}")
-            except:
-                repo.create_file(
-                    file_path,
-                    f"Create from Notion: {filename}",
-                    content,
-                    branch=self.config['hexo_source_branch']
-                )
-                self.logger.info(f"Created file {file_path}")
-            
-            # 更新同步状态
-            self.last_sync_times[page_id] = last_edited_time
-            self._save_sync_status()
+            if not in_repo:
+                self._commit_sync_status()
             
         except Exception as e:
             self.logger.error(f"Error updating Hexo repo: {str(e)}")
             raise
     
-    def _download_and_save_image(self, url: str, page_title: str) -> str:
-        """下载图片并保存到Hexo仓库"""
-        try:
-            # 下载图片
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-            
-            # 生成文件名
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            ext = url.split('.')[-1].split('?')[0]
-            if ext not in ['jpg', 'jpeg', 'png', 'gif', 'webp']:
-                ext = 'png'
-            
-            safe_title = self.converter._sanitize_filename(page_title)
-            image_filename = f"{safe_title}_{timestamp}.{ext}"
-            
-            # 构建路径
-            image_path = f"{self.config['hexo_images_path']}/{safe_title}/{image_filename}"
-            image_path = image_path.replace(os.sep, '/')
-            
-            # 检查文件是否已存在
-            repo = self.github.get_repo(self.config['hexo_repo'])
-            try:
-                repo.get_contents(image_path, ref=self.config['hexo_source_branch'])
-                self.logger.info(f"Image already exists: {image_path}")
-            except:
-                # 文件不存在，创建新文件
-                repo.create_file(
-                    image_path,
-                    f"Add image: {image_filename}",
-                    response.content,
-                    branch=self.config['hexo_source_branch']
-                )
-                self.logger.info(f"Saved image: {image_path}")
-            
-            # 返回相对路径
-            return f"/medias/featureimages/blog/{safe_title}/{image_filename}"
-            
-        except Exception as e:
-            self.logger.error(f"Error downloading image: {str(e)}")
-            return url  # 失败时返回原URL
+    def _open_state(self):
+        """从状态后端打开同步状态,首次运行时导入旧的 hexo_sync_status.json"""
+        if self.state:
+            self.state.close()
+        self.state = SyncStateStore(self.state_backend.load(self.publisher), legacy_path="hexo_sync_status.json")
+    
+    def _commit_sync_status(self):
+        """记录本次已发布(或与远端一致)的页面,在一个事务中写入并交给状态后端保存"""
+        if self.state.commit():
+            self.state_backend.save(self.state, self.publisher)
     
     def sync(self):
         """执行同步"""
         try:
-            # 获取Notion内容
-            notion_content = self._get_notion_content()
+            # 暂存所有改动,最后一次性提交到Hexo仓库
+            if self.offline:
+                os.makedirs(self.config['hexo_posts_path'], exist_ok=True)
+            else:
+                self.publisher = self._create_publisher()
+            self._open_state()
+            
+            # 转换线程把页面交给渲染进程,线程数不少于进程数才能用满所有进程
+            convert_workers = int(self.config['pipeline_convert_workers'])
+            if self.render_workers > 0:
+                self.render_pool = process_pool(max_workers=self.render_workers)
+                convert_workers = max(convert_workers, self.render_workers)
+            
+            # 页面的子树抓取完就转换,转换完就下载图片并暂存,三者同时进行
+            pipeline = Pipeline([
+                Stage('convert', self._convert_stage, workers=convert_workers),
+                Stage('publish', self._publish_stage, workers=int(self.config['pipeline_publish_workers'])),
+            ], queue_size=int(self.config['pipeline_queue_size']))
+            
+            self.logger.info(f"Fetching content from Notion page {self.config['notion_page_id']}")
+            # 并发获取所有内容,未变化的子页面只记录不抓取
+            notion_content = pipeline.run(lambda emit: self.crawler.crawl_page(
+                self.config['notion_page_id'], on_page=lambda page_data, ancestors: emit((page_data, ancestors))))
             if not notion_content:
                 self.logger.warning("No content fetched from Notion")
                 return
             
-            # 处理所有页面
-            pages = self._process_pages_recursively(notion_content)
+            if self.offline:
+                self.logger.info("Offline rebuild completed")
+                return
             
-            # 更新到Hexo仓库
-            for filename, content, page_id, last_edited_time, images in pages:
-                self._update_hexo_repo(filename, content, page_id, last_edited_time, images)
+            self._publish()
             
             self.logger.info("Sync completed successfully")
             
         except Exception as e:
             self.logger.error(f"Sync failed: {str(e)}")
             raise
+        finally:
+            if self.render_pool:
+                self.render_pool.shutdown(wait=True)
+                self.render_pool = None
+            self.image_pipeline.close()
+    
+    def close(self):
+        """关闭连接池和状态数据库"""
+        self.transport.close()
+        if self.state:
+            self.state.close()
+        self.state_backend.close()
 
 
 def main():
     parser = argparse.ArgumentParser(description='Notion to Hexo sync tool')
     parser.add_argument('--config', type=str, help='Path to config file')
+    parser.add_argument('--offline', action='store_true',
+                        help='Rebuild posts from the local block cache without calling Notion or GitHub')
+    parser.add_argument('--render-workers', type=int, metavar='N',
+                        help='Render posts in N worker processes (default: config render_workers, 0 = in-process)')
     args = parser.parse_args()
     
     try:
-        syncer = NotionToHexoSync(config_path=args.config)
-        syncer.sync()
+        syncer = NotionToHexoSync(config_path=args.config, offline=args.offline, render_workers=args.render_workers)
+        try:
+            syncer.sync()
+        finally:
+            syncer.close()
     except Exception as e:
         print(f"Error: {str(e)}")
         sys.exit(1)
@@ -0,0 +1,117 @@
+import logging
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, List
+
+# 上游结束的标记,每个工作线程收到一个
+_DONE = object()
+
+
+def process_pool(max_workers: int) -> ProcessPoolExecutor:
+    """创建渲染/转码用的进程池
+
+    进程池在工作线程已经运行时创建,默认的 fork 会把其他线程持有的锁(日志、HTTP连接池、
+    SQLite)原样复制进子进程,可能死锁。forkserver 从干净的服务进程派生子进程,
+    不支持的平台(Windows)用 spawn。任务函数都定义在模块顶层,子进程可以按名字导入。
+    """
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(method))
+
+
+class Stage:
+    """流水线中的一级
+
+    每个工作线程调用一次 make_handler() 得到自己的处理函数,有状态的对象(如转换器)
+    不会被多个线程共用。处理函数的返回值交给下一级,返回None时不再向下传递。
+    """
+
+    def __init__(self, name: str, make_handler: Callable[[], Callable[[Any], Any]], workers: int = 1):
+        self.name = name
+        self.make_handler = make_handler
+        self.workers = max(1, workers)
+
+
+class Pipeline:
+    """抓取 → 转换 → 发布 流水线
+
+    数据源在调用线程中运行,各级之间用有界队列连接: 下游处理不过来时上游在放入队列时阻塞,
+    内存中只保留队列容量内的页面,总耗时接近最慢的一级而不是各级之和。
+    任一级出错后不再处理新数据(只排空队列,避免上游阻塞),数据源的 emit 抛出该错误,
+    所有线程结束后 run 抛出第一个错误。
+    """
+
+    def __init__(self, stages: List[Stage], queue_size: int = 8):
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self.error = None
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger("Pipeline")
+
+    def run(self, source: Callable[[Callable[[Any], None]], Any]) -> Any:
+        """运行 source(emit),返回 source 的返回值"""
+        self.error = None
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        remaining = [stage.workers for stage in self.stages]
+        threads = []
+        for index, stage in enumerate(self.stages):
+            for number in range(stage.workers):
+                thread = threading.Thread(target=self._work, args=(index, queues, remaining),
+                                          name=f"{stage.name}-{number}", daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        def emit(item: Any):
+            if self.error is not None:
+                raise self.error
+            queues[0].put(item)
+
+        try:
+            result = source(emit)
+        finally:
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_DONE)
+            for thread in threads:
+                thread.join()
+
+        if self.error is not None:
+            raise self.error
+        return result
+
+    def _work(self, index: int, queues: List[queue.Queue], remaining: List[int]):
+        stage = self.stages[index]
+        next_queue = queues[index + 1] if index + 1 < len(queues) else None
+        handler = None
+        try:
+            handler = stage.make_handler()
+        except Exception as e:
+            self._fail(stage, e)
+
+        while True:
+            item = queues[index].get()
+            if item is _DONE:
+                break
+            if handler is None or self.error is not None:
+                continue
+            try:
+                result = handler(item)
+            except Exception as e:
+                self._fail(stage, e)
+                continue
+            if result is not None and next_queue is not None:
+                next_queue.put(result)
+
+        # 本级最后一个线程结束后通知下一级
+        with self.lock:
+            remaining[index] -= 1
+            last = remaining[index] == 0
+        if last and next_queue is not None:
+            for _ in range(self.stages[index + 1].workers):
+                next_queue.put(_DONE)
+
+    def _fail(self, stage: Stage, error: Exception):
+        with self.lock:
+            if self.error is None:
+                self.error = error
+        self.logger.error(f"Pipeline stage {stage.name} failed: {str(error)}")
@@ -0,0 +1,204 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+import requests
+
+# 可以重试的网络错误,httpx(notion_client使用)未安装时只识别标准库和requests的错误
+TRANSIENT_ERRORS = (ConnectionError, TimeoutError, requests.ConnectionError, requests.Timeout)
+try:
+    import httpx
+    TRANSIENT_ERRORS += (httpx.TransportError,)
+except ImportError:
+    pass
+try:
+    from notion_client.errors import RequestTimeoutError
+    TRANSIENT_ERRORS += (RequestTimeoutError,)
+except ImportError:
+    pass
+
+# 服务端临时错误
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RateLimiter:
+    """令牌桶限流器,同一服务的所有线程共享
+
+    收到限流响应时速率减半,之后每次成功请求逐步恢复到配置的速率;
+    响应头给出等待时间时,在此之前所有线程都暂停发出请求。
+    clock 和 sleep 默认使用 time.monotonic 和 time.sleep,测试中可以替换。
+    """
+
+    def __init__(self, rate: float = 3.0, burst: int = 3, min_rate: float = 0.2,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.burst = max(1, burst)
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = float(self.burst)
+        self.updated_at = clock()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """获取一个令牌,不足或暂停中时阻塞等待"""
+        while True:
+            with self.lock:
+                now = self.clock()
+                if now < self.paused_until:
+                    wait_time = self.paused_until - now
+                else:
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                    self.updated_at = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait_time = (1 - self.tokens) / self.rate
+            self.sleep(wait_time)
+
+    def pause(self, seconds: float):
+        """在指定时间内不再发放令牌"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, self.clock() + seconds)
+            self.tokens = 0.0
+
+    def throttled(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def succeeded(self):
+        if self.rate < self.max_rate:
+            with self.lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class AdaptiveLimiter:
+    """按服务限流并重试单个请求
+
+    每个请求先从令牌桶取令牌;遇到限流或临时错误时,按 Retry-After /
+    X-RateLimit-Reset 等待,没有这些头时按指数退避加随机抖动等待,只重试这一个请求。
+    成功响应的 X-RateLimit-Remaining 为0时,提前暂停到额度重置。
+    """
+
+    def __init__(self, name: str, rate: float, burst: int = None, max_retries: int = 5,
+                 base_delay: float = 1.0, max_delay: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.name = name
+        self.bucket = RateLimiter(rate, burst or max(1, int(rate)), clock=clock, sleep=sleep)
+        self.sleep = sleep
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.logger = logging.getLogger("RateLimit")
+
+    def acquire(self):
+        self.bucket.acquire()
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """限流执行 fn,可重试的错误最多重试 max_retries 次"""
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                status, headers = error_details(e)
+                if attempt >= self.max_retries or not self._is_retryable(e, status, headers):
+                    raise
+                delay = self._delay(attempt, headers)
+                if status == 429 or self._is_quota_exhausted(status, headers):
+                    self.bucket.throttled()
+                    self.bucket.pause(delay)
+                attempt += 1
+                self.logger.warning(f"{self.name} request failed ({status or type(e).__name__}), "
+                                    f"retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                self.sleep(delay)
+                continue
+
+            self.bucket.succeeded()
+            return result
+
+    def observe(self, headers):
+        """读取成功响应的额度信息,额度用完时暂停到重置"""
+        if _header(headers, 'X-RateLimit-Remaining') == '0':
+            delay = self._reset_delay(headers)
+            if delay:
+                self.logger.info(f"{self.name} rate limit exhausted, pausing {delay:.1f}s")
+                self.bucket.pause(delay)
+
+    def _is_retryable(self, error: Exception, status: Optional[int], headers) -> bool:
+        if status is None:
+            return isinstance(error, TRANSIENT_ERRORS)
+        return status in RETRY_STATUSES or self._is_quota_exhausted(status, headers)
+
+    def _is_quota_exhausted(self, status: Optional[int], headers) -> bool:
+        # GitHub的主/次级限流返回403
+        return status == 403 and (_header(headers, 'Retry-After') is not None
+                                  or _header(headers, 'X-RateLimit-Remaining') == '0')
+
+    def _delay(self, attempt: int, headers) -> float:
+        retry_after = _parse_retry_after(_header(headers, 'Retry-After'))
+        if retry_after is None:
+            retry_after = self._reset_delay(headers)
+        if retry_after is not None:
+            # 服务端指定的等待时间上加少量抖动,避免所有线程同时恢复
+            return min(self.max_delay, retry_after) + random.uniform(0, 1)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _reset_delay(self, headers) -> Optional[float]:
+        reset = _header(headers, 'X-RateLimit-Reset')
+        try:
+            return max(0.0, min(self.max_delay, float(reset) - time.time()))
+        except (TypeError, ValueError):
+            return None
+
+
+class RateLimits:
+    """各服务共享的限流器,同一服务的所有客户端和线程使用同一个令牌桶"""
+
+    def __init__(self, rates: Dict[str, float], max_retries: int = 5):
+        self.limiters = {
+            name: AdaptiveLimiter(name, rate, max_retries=max_retries)
+            for name, rate in rates.items()
+        }
+
+    def get(self, name: str) -> AdaptiveLimiter:
+        return self.limiters[name]
+
+
+def error_details(error: Exception):
+    """取出异常对应的HTTP状态码和响应头
+
+    兼容 notion_client(status/headers)、PyGithub(status/headers)和 requests(response)。
+    """
+    response = getattr(error, 'response', None)
+    if response is not None and hasattr(response, 'status_code'):
+        return response.status_code, response.headers
+    status = getattr(error, 'status', None)
+    return (status if isinstance(status, int) else None), getattr(error, 'headers', None)
+
+
+def _header(headers, name: str) -> Optional[str]:
+    if not headers:
+        return None
+    # PyGithub的响应头是小写键的普通dict
+    value = headers.get(name)
+    return value if value is not None else headers.get(name.lower())
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,239 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+from typing import Collection, Dict, List, Optional
+
+# 状态保存在目标仓库时的默认路径
+DEFAULT_REPO_STATE_PATH = '.notion-sync/state'
+
+
+class SyncStateStore:
+    """页面同步状态
+
+    每个页面一行: last_edited_time、渲染内容哈希、远端路径、远端blob SHA和引用的图片哈希。
+    打开时整表读入内存,抓取和发布中的查询都是字典查找,不访问数据库。
+    本次同步记录的状态先暂存在内存中,commit 时在一个事务中写入;进程中途退出时
+    数据库保持上一次提交的状态。数据库使用WAL模式,提交时不会重写整个文件。
+    首次打开时导入旧版的JSON状态文件({page_id: last_edited_time})。
+
+    remote_path 同时是 page_id -> 输出路径的索引: 页面改名、移动或被删除后,
+    prune 根据索引找出不再使用的旧路径,不需要列出远端仓库。parent_id 记录发布时的
+    上级页面,只有上级页面本次完整列出了子块时,没有遇到的页面才被当成已删除。
+    """
+
+    COLUMNS = ('last_edited_time', 'content_hash', 'remote_path', 'blob_sha', 'image_hashes', 'parent_id')
+
+    def __init__(self, path: str, legacy_path: str = None):
+        self.path = path
+        self.pages = {}    # page_id -> 状态
+        self.pending = {}  # 已暂存、待提交的页面
+        self.removed = set()  # 待删除的页面
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger("SyncStateStore")
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS pages (
+                page_id TEXT PRIMARY KEY,
+                last_edited_time TEXT,
+                content_hash TEXT,
+                remote_path TEXT,
+                blob_sha TEXT,
+                image_hashes TEXT NOT NULL DEFAULT '[]',
+                parent_id TEXT
+            )"""
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(pages)")}
+        if 'parent_id' not in columns:
+            self.conn.execute("ALTER TABLE pages ADD COLUMN parent_id TEXT")
+        self.conn.commit()
+        self._load()
+        if not self.pages and legacy_path:
+            self._migrate(legacy_path)
+
+    def get(self, page_id: str) -> Optional[Dict]:
+        """已提交的页面状态,没有记录时返回None"""
+        return self.pages.get(page_id)
+
+    def last_edited_time(self, page_id: str) -> Optional[str]:
+        state = self.pages.get(page_id)
+        return state['last_edited_time'] if state else None
+
+    def stage(self, page_id: str, last_edited_time: str, content_hash: str = None, remote_path: str = None,
+              blob_sha: str = None, image_hashes: List[str] = None, parent_id: str = None):
+        """记录一个已暂存发布的页面,commit 后生效"""
+        state = {
+            'last_edited_time': last_edited_time,
+            'content_hash': content_hash,
+            'remote_path': remote_path,
+            'blob_sha': blob_sha,
+            'image_hashes': sorted(set(image_hashes or [])),
+            'parent_id': parent_id,
+        }
+        with self.lock:
+            self.pending[page_id] = state
+
+    def prune(self, seen: Collection[str], listed: Collection[str]) -> List[str]:
+        """标记已删除的页面,返回不再被任何页面使用的旧路径
+
+        seen 是本次遇到的页面,listed 是本次完整列出了子块(包括容器块中嵌套的)的页面。
+        没有遇到的页面只在其上级页面完整列出、或上级页面本身被删除时标记为删除,
+        抓取没有覆盖到的部分不会被当成已删除;没有记录上级页面的旧状态只在所有遇到的
+        页面都完整列出时删除。旧路径来自被删除的页面和本次写到新路径的页面(改名或移动),
+        仍被其他页面使用的路径(例如两个页面交换了标题)不会返回。
+        """
+        with self.lock:
+            complete = all(page_id in listed for page_id in seen)
+            candidates = {page_id: state['parent_id'] for page_id, state in self.pages.items()
+                          if page_id not in seen and page_id not in self.pending}
+            # 上级页面被删除时其下的页面一起删除,直到没有新的删除
+            found = True
+            while found:
+                found = False
+                for page_id, parent_id in candidates.items():
+                    if page_id in self.removed:
+                        continue
+                    if parent_id in listed or parent_id in self.removed or (parent_id is None and complete):
+                        self.removed.add(page_id)
+                        found = True
+            current = {page_id: state for page_id, state in self.pages.items() if page_id not in self.removed}
+            current.update(self.pending)
+            in_use = {state['remote_path'] for state in current.values()}
+            old_paths = {self.pages[page_id]['remote_path'] for page_id in self.pages
+                         if page_id in self.removed or page_id in self.pending}
+        return sorted(path for path in old_paths if path and path not in in_use)
+
+    def commit(self) -> int:
+        """在一个事务中写入本次暂存和删除的所有页面,返回改动的行数"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            removed, self.removed = self.removed, set()
+        if not pending and not removed:
+            return 0
+        with self.conn:
+            self.conn.executemany("DELETE FROM pages WHERE page_id = ?", [(page_id,) for page_id in removed])
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO pages (page_id, last_edited_time, content_hash, remote_path, "
+                "blob_sha, image_hashes, parent_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(page_id, state['last_edited_time'], state['content_hash'], state['remote_path'],
+                  state['blob_sha'], json.dumps(state['image_hashes']), state['parent_id'])
+                 for page_id, state in pending.items()]
+            )
+        for page_id in removed:
+            self.pages.pop(page_id, None)
+        self.pages.update(pending)
+        self.logger.info(f"Committed sync state of {len(pending)} pages, removed {len(removed)}")
+        return len(pending) + len(removed)
+
+    def snapshot(self) -> bytes:
+        """把WAL合并回数据库文件,返回完整的数据库内容"""
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def discard(self):
+        """放弃本次暂存的状态"""
+        with self.lock:
+            self.pending = {}
+            self.removed = set()
+
+    def close(self):
+        self.conn.close()
+
+    def _load(self):
+        rows = self.conn.execute(
+            "SELECT page_id, last_edited_time, content_hash, remote_path, blob_sha, image_hashes, parent_id "
+            "FROM pages"
+        ).fetchall()
+        for page_id, *values in rows:
+            state = dict(zip(self.COLUMNS, values))
+            state['image_hashes'] = json.loads(state['image_hashes'])
+            self.pages[page_id] = state
+
+    def _migrate(self, legacy_path: str):
+        if not os.path.exists(legacy_path):
+            return
+        try:
+            with open(legacy_path, 'r') as f:
+                legacy = json.load(f)
+        except Exception as e:
+            self.logger.error(f"Error loading legacy sync status {legacy_path}: {str(e)}")
+            return
+        for page_id, last_edited_time in legacy.items():
+            self.stage(page_id, last_edited_time)
+        count = self.commit()
+        self.logger.info(f"Imported {count} pages from {legacy_path}")
+
+
+class LocalStateBackend:
+    """状态数据库保存在本地路径
+
+    也用于 Actions cache 恢复的目录: 缓存步骤在同步前恢复、同步后保存该目录。
+    """
+
+    in_repo = False
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self, publisher=None) -> str:
+        """返回本地数据库路径"""
+        return self.path
+
+    def save(self, store: SyncStateStore, publisher=None):
+        """事务提交后数据已经在本地文件中"""
+
+    def close(self):
+        pass
+
+
+class RepoStateBackend:
+    """状态数据库作为一个文件保存在发布目标仓库中
+
+    同步开始时通过发布器读取(GitHub发布复用同一次tree获取),写入临时文件后打开;
+    提交时把数据库内容暂存进与文章相同的提交,文章和状态要么一起发布,要么都不发布。
+    """
+
+    in_repo = True
+
+    def __init__(self, remote_path: str = DEFAULT_REPO_STATE_PATH):
+        self.remote_path = remote_path.strip('/')
+        self.local_path = None
+        self.logger = logging.getLogger("RepoStateBackend")
+
+    def load(self, publisher=None) -> str:
+        data = publisher.read(self.remote_path) if publisher else None
+        fd, self.local_path = tempfile.mkstemp(prefix='notion-sync-state-', suffix='.sqlite')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data or b'')
+        self.logger.info(f"Loaded sync state from {self.remote_path}" if data
+                         else f"No sync state at {self.remote_path}, starting fresh")
+        return self.local_path
+
+    def save(self, store: SyncStateStore, publisher=None):
+        if publisher is not None:
+            publisher.stage(self.remote_path, store.snapshot())
+
+    def close(self):
+        if self.local_path is None:
+            return
+        for path in (self.local_path, self.local_path + '-wal', self.local_path + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+        self.local_path = None
+
+
+def create_state_backend(backend: str, local_path: str, cache_dir: str = None,
+                         repo_path: str = DEFAULT_REPO_STATE_PATH):
+    """按配置创建状态后端: local(本地路径)、cache(Actions缓存目录)或 repo(目标仓库)"""
+    if backend == 'local':
+        return LocalStateBackend(local_path)
+    if backend == 'cache':
+        return LocalStateBackend(os.path.join(cache_dir or '.', os.path.basename(local_path)))
+    if backend == 'repo':
+        return RepoStateBackend(repo_path)
+    raise ValueError(f"Unknown state_backend: {backend}")
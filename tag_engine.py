@@ -0,0 +1,121 @@
+import re
+from typing import Dict, List, Union
+
+# 技术关键词映射,可以在配置的 hexo.tag_keywords 中增加或覆盖
+DEFAULT_TAG_KEYWORDS = {
+    'spring': ['Spring', 'Java'],
+    'react': ['React', 'Frontend'],
+    'vue': ['Vue', 'Frontend'],
+    'docker': ['Docker', 'DevOps'],
+    'kubernetes': ['Kubernetes', 'K8s', 'DevOps'],
+    'python': ['Python'],
+    'java': ['Java'],
+    'javascript': ['JavaScript', 'JS'],
+    'typescript': ['TypeScript', 'TS'],
+    'golang': ['Go', 'Golang'],
+    'rust': ['Rust'],
+    'mysql': ['MySQL', 'Database'],
+    'redis': ['Redis', 'Cache'],
+    'kafka': ['Kafka', 'MessageQueue'],
+    'rabbitmq': ['RabbitMQ', 'MessageQueue'],
+    'elasticsearch': ['Elasticsearch', 'Search'],
+    'mongodb': ['MongoDB', 'NoSQL'],
+    'git': ['Git', 'Version Control'],
+    'linux': ['Linux', 'OS'],
+    'aws': ['AWS', 'Cloud'],
+    'azure': ['Azure', 'Cloud'],
+    'langchain': ['LangChain', 'AI'],
+    'ai': ['AI', 'Artificial Intelligence'],
+    'ml': ['Machine Learning', 'ML'],
+    'rag': ['RAG', 'AI'],
+    'llm': ['LLM', 'AI'],
+}
+
+# 英文关键词两侧不能紧挨字母,'ai' 不会匹配 "maintain" 和 "LangChain";
+# 数字可以紧挨关键词("Python3"、"Redis7"),驼峰拼写的分界也算边界("SpringBoot")。
+# 中文没有词间空格,中文字符开头或结尾的一侧不加边界
+_ASCII_WORD = re.compile(r'[A-Za-z0-9]')
+# 边界部分区分大小写,否则 [a-z] 在 IGNORECASE 下也会匹配大写字母
+_LEFT_BOUNDARY = r'(?-i:(?<![A-Za-z])|(?<=[a-z])(?=[A-Z]))'
+_RIGHT_BOUNDARY = r'(?-i:(?![A-Za-z])|(?<=[a-z])(?=[A-Z]))'
+
+
+class TagEngine:
+    """按关键词词典给文章打标签
+
+    所有关键词按前缀树编译成一个正则,文本只扫描一遍,词典增大不会增加扫描次数。
+    匹配不区分大小写,标签按关键词在词典中的顺序输出,保证生成的Front Matter稳定。
+    """
+
+    def __init__(self, keywords: Dict[str, Union[str, List[str]]]):
+        self.tags = {}   # 小写关键词 -> 标签列表
+        self.order = {}  # 小写关键词 -> 在词典中的位置
+        for keyword, tags in keywords.items():
+            keyword = str(keyword).strip().lower()
+            if not keyword:
+                continue
+            self.order.setdefault(keyword, len(self.order))
+            self.tags[keyword] = [tags] if isinstance(tags, str) else list(tags or [])
+
+        # 按两侧是否需要边界分组,每组的关键词合并成前缀树形状的正则
+        groups = {}
+        for keyword in self.tags:
+            key = (bool(_ASCII_WORD.match(keyword[0])), bool(_ASCII_WORD.match(keyword[-1])))
+            groups.setdefault(key, []).append(keyword)
+        alternatives = []
+        for (left, right), group in sorted(groups.items(), reverse=True):
+            pattern = f"(?:{_trie_pattern(group)})"
+            if left:
+                pattern = _LEFT_BOUNDARY + pattern
+            if right:
+                pattern += _RIGHT_BOUNDARY
+            alternatives.append(pattern)
+        self.regex = re.compile('|'.join(alternatives), re.IGNORECASE) if alternatives else None
+        # IGNORECASE 按Unicode规则匹配("ſpring" 也能匹配 "spring"),匹配结果折叠后再找回关键词
+        self.canonical = {keyword.casefold(): keyword for keyword in self.tags}
+
+    @classmethod
+    def from_config(cls, hexo_config: Dict) -> 'TagEngine':
+        """默认词典加上 hexo.tag_keywords,关键词映射为空列表时不再打标签"""
+        keywords = dict(DEFAULT_TAG_KEYWORDS)
+        keywords.update(hexo_config.get('tag_keywords') or {})
+        return cls(keywords)
+
+    def extract(self, *texts: str) -> List[str]:
+        """在所有文本中一次扫描匹配关键词,返回去重后的标签"""
+        if self.regex is None:
+            return []
+        text = '\n'.join(t for t in texts if t)
+        matched = {self.canonical.get(match.group(0).casefold()) for match in self.regex.finditer(text)}
+        matched.discard(None)
+        tags = []
+        for keyword in sorted(matched, key=self.order.get):
+            tags.extend(self.tags[keyword])
+        # 去重并保持顺序,保证每次生成的Front Matter相同
+        return list(dict.fromkeys(tags))
+
+
+def _trie_pattern(keywords: List[str]) -> str:
+    """把关键词合并成前缀树形状的正则,共同前缀只匹配一次
+
+    可选的后缀是贪婪的,同一位置优先匹配更长的关键词("golang" 而不是 "go"),
+    边界检查失败时回退到更短的关键词。
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    return _node_pattern(trie)
+
+
+def _node_pattern(node: Dict) -> str:
+    # 递归深度等于关键词长度
+    branches = [re.escape(char) + _node_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+    pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    if '' in node:
+        pattern = f"(?:{pattern})?"
+    return pattern
@@ -0,0 +1,23 @@
+import os
+import time
+
+from main import ContentConvert
+
+
+def test_updated_time_does_not_depend_on_host_timezone(tmp_path, monkeypatch):
+    # 转换器在当前目录写 sync.log
+    monkeypatch.chdir(tmp_path)
+    converter = ContentConvert(deterministic=True, timezone='Asia/Shanghai')
+    page = {'last_edited_time': '2025-01-01T16:30:00.000Z'}
+    original = os.environ.get('TZ')
+    try:
+        for host_tz in ('UTC', 'America/New_York', 'Asia/Shanghai'):
+            os.environ['TZ'] = host_tz
+            time.tzset()
+            assert converter._format_updated_time(page) == '2025-01-02 00:30:00'
+    finally:
+        if original is None:
+            os.environ.pop('TZ', None)
+        else:
+            os.environ['TZ'] = original
+        time.tzset()
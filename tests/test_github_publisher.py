@@ -0,0 +1,151 @@
+import base64
+from types import SimpleNamespace
+
+import pytest
+
+from github_publisher import GitHubBatchPublisher, git_blob_sha
+from rate_limit import AdaptiveLimiter
+
+
+class FakeRepo:
+    """内存中的GitHub仓库,只实现发布器用到的Git Data API"""
+
+    def __init__(self, files, truncated=False):
+        self.files = {path: data.encode('utf-8') if isinstance(data, str) else data for path, data in files.items()}
+        self.truncated = truncated
+        self.trees = []    # 每次 create_git_tree 的条目
+        self.commits = []  # (message, parents)
+        self.blobs = {git_blob_sha(data): data for data in self.files.values()}
+        self.head = 'c0'
+        self.ref = SimpleNamespace(object=SimpleNamespace(sha='c0'), edit=self._edit)
+        self.tree_requests = []
+
+    def get_git_ref(self, ref):
+        assert ref == 'heads/main'
+        return self.ref
+
+    def get_git_commit(self, sha):
+        return SimpleNamespace(sha=sha, tree=SimpleNamespace(sha='tree:'))
+
+    def get_git_tree(self, sha, recursive=False):
+        self.tree_requests.append((sha, recursive))
+        prefix = sha[len('tree:'):]
+        if recursive:
+            return SimpleNamespace(raw_data={'truncated': self.truncated},
+                                   tree=[] if self.truncated else self._elements('', True))
+        return SimpleNamespace(raw_data={}, tree=self._elements(prefix, False))
+
+    def get_git_blob(self, sha):
+        return SimpleNamespace(encoding='base64', content=base64.b64encode(self.blobs[sha]).decode('ascii'))
+
+    def create_git_blob(self, content, encoding):
+        data = base64.b64decode(content)
+        self.blobs[git_blob_sha(data)] = data
+        return SimpleNamespace(sha=git_blob_sha(data))
+
+    def create_git_tree(self, elements, base_tree):
+        self.trees.append([element._identity for element in elements])
+        return SimpleNamespace(sha=f"t{len(self.trees)}")
+
+    def create_git_commit(self, message, tree, parents):
+        self.commits.append((message, [parent.sha for parent in parents]))
+        return SimpleNamespace(sha=f"c{len(self.commits)}" + '0' * 6, tree=tree)
+
+    def _edit(self, sha):
+        self.head = sha
+
+    def _elements(self, prefix, recursive):
+        """prefix 目录下的条目,recursive 时返回所有文件"""
+        elements = {}
+        for path, data in self.files.items():
+            if not path.startswith(prefix):
+                continue
+            rest = path[len(prefix):]
+            if recursive or '/' not in rest:
+                elements[rest] = SimpleNamespace(type='blob', path=rest, sha=git_blob_sha(data))
+            else:
+                directory = rest.split('/')[0]
+                elements[directory] = SimpleNamespace(type='tree', path=directory, sha=f"tree:{prefix}{directory}/")
+        return list(elements.values())
+
+
+def publisher(repo):
+    return GitHubBatchPublisher(repo, 'main', limiter=AdaptiveLimiter('github', 1000))
+
+
+@pytest.fixture
+def repo():
+    return FakeRepo({'notes/A.md': 'a', 'notes/sub/B.md': 'b', 'README.md': 'readme'})
+
+
+def test_one_commit_per_run(repo):
+    pub = publisher(repo)
+    assert pub.stage('notes/A.md', 'a2')
+    assert pub.stage('notes/C.md', 'c')
+    assert pub.stage('images/x.png', b'\x89PNG')
+    assert pub.changes() == [{'path': 'notes/A.md', 'action': 'update'},
+                             {'path': 'notes/C.md', 'action': 'create'},
+                             {'path': 'images/x.png', 'action': 'create'}]
+    sha = pub.commit('sync')
+
+    assert repo.commits == [('sync', ['c0'])]
+    assert repo.head == sha
+    # 文本内联进tree,二进制文件先创建blob
+    assert repo.trees[0] == [
+        {'path': 'notes/A.md', 'mode': '100644', 'type': 'blob', 'content': 'a2'},
+        {'path': 'notes/C.md', 'mode': '100644', 'type': 'blob', 'content': 'c'},
+        {'path': 'images/x.png', 'mode': '100644', 'type': 'blob', 'sha': git_blob_sha(b'\x89PNG')},
+    ]
+    assert not pub.has_changes
+
+
+def test_no_commit_when_nothing_changed(repo):
+    pub = publisher(repo)
+    assert not pub.stage('notes/A.md', 'a')
+    assert not pub.delete('notes/missing.md')
+    assert pub.commit('sync') is None
+    assert repo.commits == [] and repo.trees == []
+
+
+def test_unchanged_content_is_not_uploaded(repo):
+    pub = publisher(repo)
+    assert pub.stage('notes/A.md', 'a2')
+    # 之后写回与远端相同的内容时撤销暂存
+    assert not pub.stage('notes/A.md', 'a')
+    assert not pub.stage('notes/sub/B.md', b'b')
+    assert not pub.has_changes
+
+
+def test_deletions_are_null_sha_tree_entries(repo):
+    pub = publisher(repo)
+    assert pub.delete('notes/sub/B.md')
+    assert pub.stage('notes/New.md', 'new')
+    # 本次已暂存新内容的路径不删除
+    assert not pub.delete('notes/New.md')
+    assert pub.changes()[-1] == {'path': 'notes/sub/B.md', 'action': 'delete'}
+    pub.commit('sync')
+
+    assert repo.trees[0][-1] == {'path': 'notes/sub/B.md', 'mode': '100644', 'type': 'blob', 'sha': None}
+    assert not pub.exists('notes/sub/B.md')
+    assert pub.exists('notes/New.md')
+
+
+def test_snapshot_advances_after_commit(repo):
+    pub = publisher(repo)
+    pub.stage('notes/A.md', 'a2')
+    first = pub.commit('first')
+    assert not pub.stage('notes/A.md', 'a2')
+    pub.stage('notes/A.md', 'a3')
+    pub.commit('second')
+    assert repo.commits == [('first', ['c0']), ('second', [first])]
+    # 整次运行只获取一次tree
+    assert repo.tree_requests == [('tree:', True)]
+
+
+def test_truncated_tree_is_walked_by_directory():
+    repo = FakeRepo({'notes/A.md': 'a', 'notes/sub/B.md': 'b', 'README.md': 'readme'}, truncated=True)
+    pub = publisher(repo)
+    assert pub.read('notes/sub/B.md') == b'b'
+    assert sorted(pub.remote.paths()) == ['README.md', 'notes/A.md', 'notes/sub/B.md']
+    assert not pub.stage('README.md', 'readme')
+    assert ('tree:notes/sub/', False) in repo.tree_requests
@@ -0,0 +1,154 @@
+import hashlib
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import image_pipeline
+from image_pipeline import ImageCache, ImagePipeline, image_hashes, rewrite_urls
+from local_publisher import LocalRepoPublisher
+from rate_limit import AdaptiveLimiter
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'png-data'
+JPG = b'\xff\xd8\xff' + b'jpg-data'
+T0 = '2025-01-01T00:00:00.000Z'
+
+
+class FakeSession:
+    """按URL返回内容的HTTP会话,URL不在表中时返回404"""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requested = []
+
+    def get(self, url, timeout=None):
+        self.requested.append(url)
+        body = self.responses.get(url, 404)
+        status = body if isinstance(body, int) else 200
+        response = SimpleNamespace(status_code=status, headers={}, content=b'' if status != 200 else body)
+
+        def raise_for_status():
+            if status != 200:
+                raise requests.HTTPError(f"{status} error", response=response)
+        response.raise_for_status = raise_for_status
+        return response
+
+
+def image_block(block_id, url, expiry_time=None):
+    return {'id': block_id, 'type': 'image', 'last_edited_time': T0,
+            'image': {'type': 'file', 'file': {'url': url, 'expiry_time': expiry_time}}}
+
+
+def image(block_id, url, expiry_time=None):
+    return image_pipeline.image_info(image_block(block_id, url, expiry_time))
+
+
+def name(data, ext):
+    return f"/images/{hashlib.sha256(data).hexdigest()[:16]}.{ext}"
+
+
+@pytest.fixture
+def publisher(tmp_path):
+    (tmp_path / 'blog').mkdir()
+    return LocalRepoPublisher(str(tmp_path / 'blog'))
+
+
+def pipeline(session, tmp_path=None, **kwargs):
+    cache = ImageCache(str(tmp_path / 'cache')) if tmp_path else None
+    return ImagePipeline('source/images', '/images', max_workers=2, cache=cache, session=session,
+                         limiter=AdaptiveLimiter('images', 1000, max_retries=0), **kwargs)
+
+
+def test_images_are_named_by_content_hash_and_deduplicated(publisher):
+    session = FakeSession({'https://s3/a.png?sig=1': PNG, 'https://s3/b.png?sig=2': PNG, 'https://s3/c?sig=3': JPG})
+    pipe = pipeline(session)
+    url_map = pipe.process([image('a', 'https://s3/a.png?sig=1'), image('b', 'https://s3/b.png?sig=2'),
+                            image('c', 'https://s3/c?sig=3'), image('a', 'https://s3/a.png?sig=1')], publisher)
+    pipe.close()
+
+    assert url_map == {'https://s3/a.png?sig=1': name(PNG, 'png'), 'https://s3/b.png?sig=2': name(PNG, 'png'),
+                       'https://s3/c?sig=3': name(JPG, 'jpg')}
+    assert sorted(publisher.staged) == sorted(f"source{path}" for path in {name(PNG, 'png'), name(JPG, 'jpg')})
+    assert image_hashes(url_map) == sorted({hashlib.sha256(data).hexdigest()[:16] for data in (PNG, JPG)})
+    # 同一张图片在一篇文章中只下载一次
+    assert sorted(session.requested) == ['https://s3/a.png?sig=1', 'https://s3/b.png?sig=2', 'https://s3/c?sig=3']
+
+
+def test_prefetched_and_cached_images_are_not_downloaded_again(publisher, tmp_path):
+    session = FakeSession({'https://s3/a.png?sig=1': PNG})
+    pipe = pipeline(session, tmp_path)
+    pipe.prefetch(image_block('a', 'https://s3/a.png?sig=1'))
+    assert pipe.process([image('a', 'https://s3/a.png?sig=1')], publisher) == \
+        {'https://s3/a.png?sig=1': name(PNG, 'png')}
+    pipe.close()
+    assert session.requested == ['https://s3/a.png?sig=1']
+
+    # 下一次同步: 图片块未变化,签名URL已失效也直接使用缓存
+    later = FakeSession({})
+    pipe = pipeline(later, tmp_path)
+    pipe.prefetch(image_block('a', 'https://s3/a.png?sig=new'))
+    assert pipe.process([image('a', 'https://s3/a.png?sig=new')], publisher) == \
+        {'https://s3/a.png?sig=new': name(PNG, 'png')}
+    pipe.close()
+    assert later.requested == []
+
+
+@pytest.mark.parametrize('status', [400, 403])
+def test_rejected_signed_url_is_resolved_again(publisher, status):
+    session = FakeSession({'https://s3/a.png?sig=old': status, 'https://s3/a.png?sig=new': PNG})
+    resolved = []
+    pipe = pipeline(session, resolve_url=lambda block_id: resolved.append(block_id) or 'https://s3/a.png?sig=new')
+    url_map = pipe.process([image('a', 'https://s3/a.png?sig=old')], publisher)
+    pipe.close()
+
+    assert url_map == {'https://s3/a.png?sig=old': name(PNG, 'png')}
+    assert resolved == ['a']
+    assert session.requested == ['https://s3/a.png?sig=old', 'https://s3/a.png?sig=new']
+
+
+def test_expired_url_is_resolved_before_download(publisher):
+    session = FakeSession({'https://s3/a.png?sig=new': PNG})
+    pipe = pipeline(session, resolve_url=lambda block_id: 'https://s3/a.png?sig=new')
+    url_map = pipe.process([image('a', 'https://s3/a.png?sig=old', '2020-01-01T00:00:00.000Z')], publisher)
+    pipe.close()
+
+    assert url_map == {'https://s3/a.png?sig=old': name(PNG, 'png')}
+    assert session.requested == ['https://s3/a.png?sig=new']
+
+
+def test_failed_image_keeps_original_link(publisher):
+    session = FakeSession({'https://s3/a.png?sig=old': 404})
+    resolved = []
+    pipe = pipeline(session, resolve_url=resolved.append)
+    assert pipe.process([image('a', 'https://s3/a.png?sig=old')], publisher) == {}
+    pipe.close()
+    # 只有400/403才重新获取URL
+    assert resolved == []
+    assert not publisher.has_changes
+
+
+def test_rewrite_urls_replaces_longest_url_first():
+    content = '![](https://s3/a.png) ![](https://s3/a.png?sig=1) <img src="https://s3/a.png?sig=1">'
+    url_map = {
+        'https://s3/a.png': '/images/short.png',
+        'https://s3/a.png?sig=1': '/images/long.png',
+        'src="https://s3/a.png?sig=1"': 'src="/images/long.png" width="10"',
+    }
+    assert rewrite_urls(content, url_map) == \
+        '![](/images/short.png) ![](/images/long.png) <img src="/images/long.png" width="10">'
+    assert rewrite_urls(content, {}) == content
+
+
+def test_transcoding_falls_back_to_original_without_pillow(publisher, monkeypatch):
+    monkeypatch.setattr(image_pipeline, 'Image', None)
+    session = FakeSession({'https://s3/a.png?sig=1': PNG})
+    pipe = pipeline(session, image_format='webp', widths=[320])
+    assert not pipe.transcoding
+    assert pipe.process([image('a', 'https://s3/a.png?sig=1')], publisher) == \
+        {'https://s3/a.png?sig=1': name(PNG, 'png')}
+    pipe.close()
+
+
+def test_unknown_image_format_is_rejected():
+    with pytest.raises(ValueError):
+        pipeline(FakeSession({}), image_format='avif')
@@ -0,0 +1,87 @@
+import os
+import subprocess
+
+import pytest
+
+from local_publisher import LocalRepoPublisher
+
+
+def git(repo, *args):
+    return subprocess.run(['git', '-C', str(repo), *args], check=True, capture_output=True, text=True).stdout
+
+
+@pytest.fixture
+def repo(tmp_path):
+    path = tmp_path / 'blog'
+    path.mkdir()
+    git(path, 'init', '-q')
+    git(path, 'config', 'user.name', 'Test')
+    git(path, 'config', 'user.email', 'test@example.com')
+    (path / 'source' / '_posts').mkdir(parents=True)
+    (path / 'source' / '_posts' / 'old.md').write_text('old')
+    (path / 'README.md').write_text('readme')
+    git(path, 'add', '.')
+    git(path, 'commit', '-q', '-m', 'init')
+    return path
+
+
+def commit_count(repo):
+    return int(git(repo, 'rev-list', '--count', 'HEAD'))
+
+
+def test_staged_files_are_written_atomically_in_one_commit(repo):
+    pub = LocalRepoPublisher(str(repo), git_commit=True)
+    assert pub.stage('source/_posts/new.md', 'new post')
+    assert pub.stage('source/images/x.png', b'\x89PNG')
+    assert pub.changes() == [{'path': 'source/_posts/new.md', 'action': 'create'},
+                             {'path': 'source/images/x.png', 'action': 'create'}]
+    # 提交前不写盘
+    assert not (repo / 'source' / '_posts' / 'new.md').exists()
+
+    sha = pub.commit('sync')
+
+    assert (repo / 'source' / '_posts' / 'new.md').read_text() == 'new post'
+    assert (repo / 'source' / 'images' / 'x.png').read_bytes() == b'\x89PNG'
+    # 临时文件都已替换掉
+    assert not [name for _, _, names in os.walk(repo / 'source') for name in names if name.startswith('.tmp-')]
+    assert sha == git(repo, 'rev-parse', 'HEAD').strip()
+    assert commit_count(repo) == 2
+    assert git(repo, 'status', '--porcelain') == ''
+    assert not pub.has_changes
+
+
+def test_delete_is_committed_as_removal(repo):
+    pub = LocalRepoPublisher(str(repo), git_commit=True)
+    assert pub.delete('source/_posts/old.md')
+    assert not pub.delete('source/_posts/missing.md')
+    assert pub.changes() == [{'path': 'source/_posts/old.md', 'action': 'delete'}]
+    pub.commit('remove old post')
+
+    assert not (repo / 'source' / '_posts' / 'old.md').exists()
+    assert git(repo, 'show', '--name-status', '--format=', 'HEAD').split() == ['D', 'source/_posts/old.md']
+    assert git(repo, 'status', '--porcelain') == ''
+
+
+def test_staging_new_content_cancels_delete(repo):
+    pub = LocalRepoPublisher(str(repo))
+    assert pub.delete('source/_posts/old.md')
+    assert pub.stage('source/_posts/old.md', 'rewritten')
+    assert not pub.delete('source/_posts/old.md')
+    pub.commit('sync')
+    assert (repo / 'source' / '_posts' / 'old.md').read_text() == 'rewritten'
+
+
+def test_no_commit_when_nothing_changed(repo):
+    pub = LocalRepoPublisher(str(repo), git_commit=True)
+    assert not pub.stage('README.md', 'readme')
+    assert not pub.stage('source/_posts/old.md', b'old')
+    assert pub.commit('sync') is None
+    assert commit_count(repo) == 1
+
+
+def test_without_git_commit_files_are_only_written(repo):
+    pub = LocalRepoPublisher(str(repo))
+    pub.stage('README.md', 'changed')
+    assert pub.commit('sync') is None
+    assert (repo / 'README.md').read_text() == 'changed'
+    assert commit_count(repo) == 1
@@ -0,0 +1,156 @@
+import pytest
+
+from markdown_renderer import HEXO, NOTES, MarkdownRenderer
+
+
+def span(text, href=None, equation=False, **annotations):
+    return {'type': 'equation' if equation else 'text', 'plain_text': text, 'href': href,
+            'annotations': annotations}
+
+
+def rich_text(*spans):
+    return MarkdownRenderer(NOTES).rich_text(list(spans))
+
+
+def test_plain_text_is_joined():
+    assert rich_text(span('a'), span('b')) == 'ab'
+    assert rich_text() == ''
+
+
+def test_equal_annotations_are_merged():
+    assert rich_text(span('a', bold=True), span('b', bold=True)) == '**ab**'
+
+
+def test_overlapping_annotations_only_emit_differences():
+    assert rich_text(span('a', bold=True), span('b', bold=True, italic=True),
+                     span('c', bold=True)) == '**a*b*c**'
+
+
+def test_equation_inside_annotated_text():
+    assert rich_text(span('a', bold=True), span('x^2', equation=True, bold=True),
+                     span('b', bold=True)) == '**a$x^2$b**'
+    assert rich_text(span('x', equation=True), span('y', equation=True)) == '$x$$y$'
+
+
+def test_links_wrap_their_own_annotations():
+    assert rich_text(span('a'), span('b', href='u', bold=True), span('c', href='u', bold=True),
+                     span('d', href='v'), span('e')) == 'a[**bc**](u)[d](v)e'
+    assert rich_text(span('a', bold=True), span('b', href='u', bold=True)) == '**a**[**b**](u)'
+
+
+def test_code_is_the_outermost_marker():
+    assert rich_text(span('a', bold=True, code=True)) == '`**a**`'
+    assert rich_text(span('a', code=True), span('b', code=True, strikethrough=True)) == '`a~~b~~`'
+
+
+def test_dialects_share_rich_text():
+    spans = [span('a', italic=True), span('b')]
+    assert MarkdownRenderer(HEXO).rich_text(spans) == MarkdownRenderer(NOTES).rich_text(spans) == '*a*b'
+
+
+def text(content):
+    return [span(content)]
+
+
+def block(block_type, content=None, children=None, **data):
+    if content is not None:
+        data['rich_text'] = text(content)
+    result = {'id': block_type, 'type': block_type, block_type: data, 'has_children': bool(children)}
+    if children:
+        result['children'] = {'results': children}
+    return result
+
+
+# (块列表, NOTES 输出, HEXO 输出)
+# 原有块类型的期望值与改写前两个转换器的输出一致,只有提交说明中列出的修复不同
+GOLDEN = {
+    'paragraph': (
+        [block('paragraph', 'a'), block('paragraph', 'b')],
+        'a\n\n\nb\n\n',
+        'a\n\nb\n',
+    ),
+    'headings': (
+        [block('heading_1', 'H1'), block('heading_2', 'H2'), block('heading_3', 'H3'), block('paragraph', 'p')],
+        # 旧版笔记把 heading_2/3 都输出为 "#"
+        '# H1\n\n\n## H2\n\n\n### H3\n\n\np\n\n',
+        '## H1\n\n### H2\n\n#### H3\n\np\n',
+    ),
+    'nested_lists': (
+        [block('bulleted_list_item', 'a', [block('bulleted_list_item', 'a1'), block('numbered_list_item', 'n1')]),
+         block('bulleted_list_item', 'b')],
+        '- a\n    - a1\n    1. n1\n\n- b\n',
+        '- a\n  - a1\n  1. n1\n\n- b\n',
+    ),
+    'numbered_restart': (
+        [block('numbered_list_item', 'one'), block('numbered_list_item', 'two'), block('paragraph', 'break'),
+         block('numbered_list_item', 'again')],
+        '1. one\n\n2. two\n\nbreak\n\n\n1. again\n',
+        # 旧版 Hexo 在段落之后继续编号为 3
+        '1. one\n\n2. two\n\nbreak\n\n1. again\n',
+    ),
+    'numbered_nested_levels': (
+        [block('numbered_list_item', 'one', [block('numbered_list_item', 'sub'), block('numbered_list_item', 'sub')]),
+         block('numbered_list_item', 'two')],
+        '1. one\n    1. sub\n    2. sub\n\n2. two\n',
+        '1. one\n  1. sub\n  2. sub\n\n2. two\n',
+    ),
+    'to_do': (
+        [block('to_do', 'done', checked=True), block('to_do', 'open', checked=False)],
+        '- [x] done\n\n- [ ] open\n',
+        '- [x] done\n\n- [ ] open\n',
+    ),
+    'toggle': (
+        [block('toggle', 'More', [block('paragraph', 'hidden')])],
+        '<details>\n<summary>More</summary>\n\nhidden\n\n\n</details>\n\n',
+        '<details>\n<summary>More</summary>\n\nhidden\n\n</details>\n',
+    ),
+    'quote': (
+        [block('quote', 'q')],
+        '> q\n\n',
+        '> q\n',
+    ),
+    'callout': (
+        [block('callout', 'Note', icon={'type': 'emoji', 'emoji': '💡'})],
+        '> 💡 Note\n\n',
+        '> 💡 Note\n',
+    ),
+    'divider': (
+        [block('paragraph', 'a'), block('divider'), block('paragraph', 'b')],
+        'a\n\n\n---\n\n\nb\n\n',
+        'a\n\n---\n\nb\n',
+    ),
+    'bookmark': (
+        [block('bookmark', url='https://x.io', caption=text('X')), block('bookmark', url='https://y.io', caption=[])],
+        '[X](https://x.io)\n\n\n[https://y.io](https://y.io)\n\n',
+        '[X](https://x.io)\n\n[https://y.io](https://y.io)\n',
+    ),
+    'equation': (
+        [block('equation', expression='e=mc^2')],
+        '$$\ne=mc^2\n$$\n\n',
+        '$$\ne=mc^2\n$$\n',
+    ),
+    'code': (
+        [block('code', 'x = 1', language='python')],
+        '```python\nx = 1\n```\n\n',
+        '```python\nx = 1\n```\n',
+    ),
+}
+
+
+@pytest.mark.parametrize('name', GOLDEN)
+def test_golden_output(name):
+    blocks, notes, hexo = GOLDEN[name]
+    assert MarkdownRenderer(NOTES).render(blocks) == notes
+    assert MarkdownRenderer(HEXO).render(blocks) == hexo
+
+
+def test_blocks_nested_in_lists_are_indented():
+    # 列表内的块两种方言都只换一行,避免把列表断开
+    blocks = [block('bulleted_list_item', 'a', [block('quote', 'q'), block('divider')])]
+    assert MarkdownRenderer(NOTES).render(blocks) == '- a\n    > q\n    ---\n'
+    assert MarkdownRenderer(HEXO).render(blocks) == '- a\n  > q\n  ---\n'
+
+
+def test_unknown_blocks_are_skipped():
+    blocks = [block('paragraph', 'a'), block('unsupported'), block('paragraph', 'b')]
+    assert MarkdownRenderer(HEXO).render(blocks) == 'a\n\nb\n'
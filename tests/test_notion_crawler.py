@@ -0,0 +1,127 @@
+from types import SimpleNamespace
+
+from notion_crawler import NotionCrawler
+from state_store import SyncStateStore
+
+T0 = '2025-01-01T00:00:00.000Z'
+T1 = '2025-02-01T00:00:00.000Z'
+
+
+def page(page_id, title, edited=T0):
+    return {
+        'id': page_id,
+        'created_time': T0,
+        'last_edited_time': edited,
+        'properties': {'title': {'title': [{'plain_text': title}]}},
+    }
+
+
+def block(block_id, block_type='paragraph', has_children=False, edited=T0, **extra):
+    return {'id': block_id, 'type': block_type, 'has_children': has_children,
+            'last_edited_time': edited, **extra}
+
+
+def child_page(page_id, title, edited=T0):
+    return block(page_id, 'child_page', True, edited, child_page={'title': title})
+
+
+class FakeNotion:
+    """按 page_size 分页返回子块的Notion客户端"""
+
+    def __init__(self, pages, children):
+        self.page_data = pages
+        self.children = children
+        self.listed = []
+        self.pages = SimpleNamespace(retrieve=lambda page_id: self.page_data[page_id])
+        self.blocks = SimpleNamespace(children=SimpleNamespace(list=self._list))
+
+    def _list(self, block_id, page_size=100, start_cursor=None):
+        self.listed.append(block_id)
+        results = self.children.get(block_id, [])
+        start = int(start_cursor or 0)
+        end = start + page_size
+        return {'results': results[start:end], 'has_more': end < len(results),
+                'next_cursor': str(end) if end < len(results) else None}
+
+
+def nested_workspace():
+    """未变化的根页面中,子页面分别嵌套在折叠块和分栏里;折叠块中的页面有修改"""
+    pages = {
+        'root': page('root', 'Root'),
+        'toggled': page('toggled', 'Nested In Toggle', T1),
+        'columned': page('columned', 'Nested In Column'),
+    }
+    children = {
+        'root': [block('p1'), block('toggle', 'toggle', True), block('cols', 'column_list', True)],
+        'toggle': [child_page('toggled', 'Nested In Toggle', T1)],
+        'cols': [block('col', 'column', True)],
+        'col': [child_page('columned', 'Nested In Column')],
+        'toggled': [block('t-p1'), block('t-p2'), block('t-p3')],
+        'columned': [block('c-p1')],
+    }
+    published = {'root': T0, 'toggled': T0, 'columned': T0}
+    return FakeNotion(pages, children), published
+
+
+def crawl(notion, published, **kwargs):
+    emitted = {}
+    seen_blocks = []
+    crawler = NotionCrawler(
+        notion, max_workers=2, rate_limit=1000,
+        is_unchanged=lambda page_id, edited: published.get(page_id) == edited,
+        on_block=lambda b: seen_blocks.append(b['id']),
+        **kwargs
+    )
+    crawler.crawl_page('root', on_page=lambda page_data, ancestors: emitted.update(
+        {page_data['page']['id']: (page_data, ancestors)}))
+    return crawler, emitted, seen_blocks
+
+
+def test_shallow_crawl_finds_child_pages_nested_in_containers():
+    notion, published = nested_workspace()
+    crawler, emitted, _ = crawl(notion, published)
+
+    assert set(crawler.seen_pages) == {'root', 'toggled', 'columned'}
+    assert crawler.unchanged_pages == {'root', 'columned'}
+    # 只有修改过的嵌套页面需要内容
+    assert list(emitted) == ['toggled']
+    page_data, ancestors = emitted['toggled']
+    assert [b['id'] for b in page_data['blocks']] == ['t-p1', 't-p2', 't-p3']
+    assert ancestors == ['Root']
+
+
+def test_shallow_crawl_skips_content_callbacks_of_unchanged_pages():
+    notion, published = nested_workspace()
+    _, _, seen_blocks = crawl(notion, published)
+
+    assert sorted(seen_blocks) == ['t-p1', 't-p2', 't-p3']
+
+
+def test_children_are_listed_page_by_page_without_duplicates():
+    notion, published = nested_workspace()
+    _, emitted, _ = crawl(notion, published, page_size=2)
+
+    assert [b['id'] for b in emitted['toggled'][0]['blocks']] == ['t-p1', 't-p2', 't-p3']
+    assert notion.listed.count('toggled') == 2
+
+
+def test_prune_after_cold_shallow_crawl_keeps_nested_pages(tmp_path):
+    """根页面未变化且没有块缓存时,嵌套在容器中的已发布页面不会被当成已删除"""
+    notion, published = nested_workspace()
+    published['toggled'] = T1
+    store = SyncStateStore(str(tmp_path / 'sync_state.sqlite'))
+    store.stage('root', T0, remote_path='notion_sync/Root.md')
+    store.stage('toggled', T1, remote_path='notion_sync/Nested In Toggle.md', parent_id='root')
+    store.stage('columned', T0, remote_path='notion_sync/Nested In Column.md', parent_id='root')
+    store.stage('gone', T0, remote_path='notion_sync/Gone.md', parent_id='root')
+    store.commit()
+
+    crawler, emitted, _ = crawl(notion, published)
+
+    assert emitted == {}
+    assert crawler.listed_pages == {'root', 'toggled', 'columned'}
+    assert crawler.parents == {'toggled': 'root', 'columned': 'root'}
+    assert store.prune(crawler.seen_pages, crawler.listed_pages) == ['notion_sync/Gone.md']
+    store.commit()
+    assert sorted(store.pages) == ['columned', 'root', 'toggled']
+    store.close()
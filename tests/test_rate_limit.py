@@ -0,0 +1,131 @@
+import pytest
+
+from rate_limit import AdaptiveLimiter, RateLimiter, RateLimits
+
+
+class FakeClock:
+    """sleep 只推进时间并记录等待,不真正阻塞"""
+
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        # 与真实时钟一样总会前进,浮点误差留下的极小等待不会让时间停住
+        self.now += max(seconds, 1e-6)
+
+
+class StatusError(Exception):
+    """带状态码和响应头的API错误,与 notion_client/PyGithub 的异常相同"""
+
+    def __init__(self, status, headers=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.headers = headers or {}
+
+
+def flaky(*errors, result='ok'):
+    """依次抛出 errors 中的错误,之后返回 result"""
+    calls = []
+
+    def fn():
+        calls.append(len(calls))
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+    return fn, calls
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def limiter(clock, rate=10.0, **kwargs):
+    return AdaptiveLimiter('test', rate, clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def test_token_bucket_spaces_requests(clock):
+    bucket = RateLimiter(rate=2.0, burst=1, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.sleeps == [0.5, 0.5]
+
+
+def test_429_waits_for_retry_after_and_halves_rate(clock):
+    limit = limiter(clock)
+    fn, calls = flaky(StatusError(429, {'Retry-After': '2'}))
+    assert limit.call(fn) == 'ok'
+
+    assert len(calls) == 2
+    # 服务端给出的等待时间加不超过1秒的抖动
+    retry_waits = [seconds for seconds in clock.sleeps if seconds >= 2]
+    assert len(retry_waits) == 1 and 2 <= retry_waits[0] <= 3
+    # 限流时减半,重试成功后恢复一步
+    assert limit.bucket.rate == 5.5
+
+
+def test_retry_after_pauses_all_requests(clock):
+    limit = limiter(clock)
+    limit.bucket.pause(5)
+    limit.acquire()
+    assert clock.sleeps == [5]
+
+
+def test_rate_recovers_after_successes(clock):
+    limit = limiter(clock, rate=10.0)
+    limit.bucket.throttled()
+    limit.bucket.throttled()
+    assert limit.bucket.rate == 2.5
+    for _ in range(10):
+        limit.call(lambda: None)
+    assert limit.bucket.rate == 7.5
+    for _ in range(10):
+        limit.call(lambda: None)
+    assert limit.bucket.rate == 10.0
+
+
+@pytest.mark.parametrize('error', [
+    StatusError(500), StatusError(502), StatusError(503), StatusError(504), ConnectionError('reset'),
+    StatusError(403, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '0'}),
+    StatusError(403, {'retry-after': '1'}),
+])
+def test_transient_errors_are_retried(clock, error):
+    fn, calls = flaky(error)
+    assert limiter(clock).call(fn) == 'ok'
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize('error', [StatusError(400), StatusError(403), StatusError(404), ValueError('bad')])
+def test_other_errors_are_not_retried(clock, error):
+    fn, calls = flaky(error)
+    with pytest.raises(type(error)):
+        limiter(clock).call(fn)
+    assert len(calls) == 1
+    assert clock.sleeps == []
+
+
+def test_gives_up_after_max_retries(clock):
+    fn, calls = flaky(*[StatusError(503)] * 5)
+    with pytest.raises(StatusError):
+        limiter(clock, max_retries=2).call(fn)
+    assert len(calls) == 3
+
+
+def test_backoff_without_headers_is_bounded(clock):
+    fn, _ = flaky(*[StatusError(503)] * 3)
+    limiter(clock, base_delay=1.0, max_delay=3.0).call(fn)
+    waits = [seconds for seconds in clock.sleeps]
+    assert len(waits) == 3
+    assert all(0 <= wait <= bound for wait, bound in zip(waits, (1, 2, 3)))
+
+
+def test_rate_limits_share_one_limiter_per_service():
+    limits = RateLimits({'notion': 3, 'github': 10}, max_retries=1)
+    assert limits.get('notion') is limits.get('notion')
+    assert limits.get('github').bucket.max_rate == 10
+    assert limits.get('notion').max_retries == 1
@@ -0,0 +1,171 @@
+import json
+import os
+import sqlite3
+
+import pytest
+
+from state_store import SyncStateStore
+
+T0 = '2025-01-01T00:00:00.000Z'
+T1 = '2025-02-01T00:00:00.000Z'
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'state' / 'sync_state.sqlite')
+
+
+def reopen(path):
+    store = SyncStateStore(path)
+    pages = dict(store.pages)
+    store.close()
+    return pages
+
+
+class FailingConnection:
+    """在写入页面时失败的数据库连接,用于检查事务回滚"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self.conn.__exit__(*exc)
+
+    def executemany(self, sql, rows):
+        rows = list(rows)
+        if sql.startswith('INSERT'):
+            raise sqlite3.OperationalError('disk I/O error')
+        return self.conn.executemany(sql, rows)
+
+
+def test_staged_state_is_visible_only_after_commit(db_path):
+    store = SyncStateStore(db_path)
+    store.stage('a', T0, content_hash='h', remote_path='notes/A.md', image_hashes=['y', 'x', 'x'])
+    assert store.get('a') is None
+    assert store.commit() == 1
+    assert store.get('a')['remote_path'] == 'notes/A.md'
+    store.close()
+
+    assert reopen(db_path)['a'] == {'last_edited_time': T0, 'content_hash': 'h', 'remote_path': 'notes/A.md',
+                                    'blob_sha': None, 'image_hashes': ['x', 'y'], 'parent_id': None}
+
+
+def test_discard_and_uncommitted_state_are_not_persisted(db_path):
+    store = SyncStateStore(db_path)
+    store.stage('a', T0)
+    store.commit()
+    store.stage('a', T1)
+    store.stage('b', T1)
+    store.discard()
+    assert store.commit() == 0
+    store.stage('c', T1)
+    # 进程在提交前退出
+    store.close()
+
+    assert {page_id: state['last_edited_time'] for page_id, state in reopen(db_path).items()} == {'a': T0}
+
+
+def test_failed_commit_leaves_previous_state(db_path):
+    store = SyncStateStore(db_path)
+    store.stage('a', T0)
+    store.commit()
+    store.stage('a', T1)
+    store.stage('b', T1)
+    store.conn = FailingConnection(store.conn)
+    with pytest.raises(sqlite3.OperationalError):
+        store.commit()
+    assert store.last_edited_time('a') == T0
+    assert store.get('b') is None
+    store.conn = store.conn.conn
+    store.close()
+
+    assert {page_id: state['last_edited_time'] for page_id, state in reopen(db_path).items()} == {'a': T0}
+
+
+def test_legacy_json_is_imported_once(db_path, tmp_path):
+    legacy = tmp_path / 'sync_status.json'
+    legacy.write_text(json.dumps({'a': T0, 'b': T1}))
+    store = SyncStateStore(db_path, legacy_path=str(legacy))
+    assert store.last_edited_time('b') == T1
+    store.close()
+
+    legacy.write_text(json.dumps({'c': T1}))
+    store = SyncStateStore(db_path, legacy_path=str(legacy))
+    assert sorted(store.pages) == ['a', 'b']
+    store.close()
+
+
+def published(db_path, pages):
+    """pages: page_id -> (remote_path, parent_id)"""
+    store = SyncStateStore(db_path)
+    for page_id, (remote_path, parent_id) in pages.items():
+        store.stage(page_id, T0, remote_path=remote_path, parent_id=parent_id)
+    store.commit()
+    return store
+
+
+WORKSPACE = {
+    'root': ('notes/Root.md', None),
+    'redis': ('notes/Redis.md', 'root'),
+    'kafka': ('notes/Kafka.md', 'root'),
+    'deep': ('notes/Deep.md', 'redis'),
+}
+
+
+def test_prune_returns_old_path_of_renamed_page(db_path):
+    store = published(db_path, WORKSPACE)
+    store.stage('redis', T1, remote_path='notes/Redis 进阶.md', parent_id='root')
+    assert store.prune(set(WORKSPACE), set(WORKSPACE)) == ['notes/Redis.md']
+    assert store.commit() == 1
+    assert store.get('redis')['remote_path'] == 'notes/Redis 进阶.md'
+
+
+def test_prune_keeps_paths_of_swapped_titles(db_path):
+    store = published(db_path, WORKSPACE)
+    store.stage('redis', T1, remote_path='notes/Kafka.md', parent_id='root')
+    store.stage('kafka', T1, remote_path='notes/Redis.md', parent_id='root')
+    assert store.prune(set(WORKSPACE), set(WORKSPACE)) == []
+
+
+def test_prune_removes_deleted_pages_and_their_subpages(db_path):
+    store = published(db_path, WORKSPACE)
+    seen = {'root', 'kafka'}
+    assert store.prune(seen, seen) == ['notes/Deep.md', 'notes/Redis.md']
+    assert store.commit() == 2
+    store.close()
+    assert sorted(reopen(db_path)) == ['kafka', 'root']
+
+
+def test_prune_keeps_pages_whose_parent_was_not_listed(db_path):
+    store = published(db_path, {**WORKSPACE, 'nested': ('notes/Nested In Toggle.md', 'root')})
+    # 根页面的子块没有完整列出,折叠块中的页面没有遇到
+    seen = set(WORKSPACE)
+    assert store.prune(seen, seen - {'root'}) == []
+    assert store.commit() == 0
+    assert store.get('nested')['remote_path'] == 'notes/Nested In Toggle.md'
+
+
+def test_prune_removes_legacy_rows_only_after_complete_listing(db_path):
+    store = published(db_path, {'root': ('notes/Root.md', None), 'old': ('notes/Old.md', None)})
+    assert store.prune({'root'}, set()) == []
+    assert store.prune({'root'}, {'root'}) == ['notes/Old.md']
+
+
+def test_parent_column_is_added_to_existing_database(db_path):
+    os.makedirs(os.path.dirname(db_path))
+    conn = sqlite3.connect(db_path)
+    conn.execute("""CREATE TABLE pages (page_id TEXT PRIMARY KEY, last_edited_time TEXT, content_hash TEXT,
+                    remote_path TEXT, blob_sha TEXT, image_hashes TEXT NOT NULL DEFAULT '[]')""")
+    conn.execute("INSERT INTO pages (page_id, last_edited_time, remote_path) VALUES ('a', ?, 'notes/A.md')", (T0,))
+    conn.commit()
+    conn.close()
+
+    store = SyncStateStore(db_path)
+    assert store.get('a')['parent_id'] is None
+    store.stage('b', T1, remote_path='notes/B.md', parent_id='a')
+    store.commit()
+    store.close()
+    assert reopen(db_path)['b']['parent_id'] == 'a'
@@ -0,0 +1,50 @@
+import pytest
+
+from tag_engine import DEFAULT_TAG_KEYWORDS, TagEngine
+
+
+@pytest.fixture(scope='module')
+def engine():
+    return TagEngine(DEFAULT_TAG_KEYWORDS)
+
+
+@pytest.mark.parametrize('title, tags', [
+    # 关键词只是单词的一部分
+    ('How to maintain a blog', []),
+    ('digital garden', []),
+    ('MAINTAIN', []),
+    ('LangChain 入门', ['LangChain', 'AI']),
+    # 带版本号
+    ('Python3 爬虫', ['Python']),
+    ('Vue3 组件', ['Vue', 'Frontend']),
+    ('Redis7新特性', ['Redis', 'Cache']),
+    # 紧挨中文
+    ('学习Docker笔记', ['Docker', 'DevOps']),
+    ('微服务与kafka', ['Kafka', 'MessageQueue']),
+    # 大小写和驼峰拼写
+    ('SpringBoot 入门', ['Spring', 'Java']),
+    ('MYSQL 索引', ['MySQL', 'Database']),
+    ('OpenAI 接口', ['AI', 'Artificial Intelligence']),
+    ('ſpring', ['Spring', 'Java']),
+    # 同一位置优先匹配更长的关键词
+    ('JavaScript 闭包', ['JavaScript', 'JS']),
+    ('golang', ['Go', 'Golang']),
+])
+def test_title_tags(engine, title, tags):
+    assert engine.extract(title) == tags
+
+
+def test_tags_follow_keyword_order_without_duplicates(engine):
+    # 标签按词典顺序,与在文本中出现的顺序无关
+    assert engine.extract('Redis and Spring, then Java and spring again') == \
+        ['Spring', 'Java', 'Redis', 'Cache']
+    assert engine.extract('RAG with LLM', 'langchain') == ['LangChain', 'AI', 'RAG', 'LLM']
+
+
+def test_config_keywords_extend_and_override_defaults():
+    engine = TagEngine.from_config({'tag_keywords': {'hexo': 'Hexo', '博客': ['Blog'], 'python': []}})
+    assert engine.extract('用 Hexo 搭建博客,python 脚本') == ['Hexo', 'Blog']
+
+
+def test_empty_dictionary_never_tags():
+    assert TagEngine({}).extract('Python') == []
@@ -0,0 +1,41 @@
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+# pre 返回 SKIP 时不访问该节点的子节点,也不调用 post
+SKIP = object()
+_END = object()
+
+
+def walk(roots: Iterable, children: Callable[[Any], Optional[Iterable]],
+         pre: Callable[[Any, int], Any] = None, post: Callable[[Any, int, Any], None] = None):
+    """用显式栈深度优先遍历树,Python调用栈深度与树的深度无关
+
+    pre(node, depth) 在进入节点时调用,返回值原样传给 post(node, depth, state),
+    post 在节点的所有子节点处理完后调用。children(node) 只在需要进入节点时调用,
+    返回None或空时没有子节点。同级节点按原顺序访问。
+    """
+    # (节点, 深度, 未访问的子节点, pre的返回值)
+    stack = [(None, -1, iter(roots), None)]
+    while stack:
+        node, depth, pending, state = stack[-1]
+        child = next(pending, _END)
+        if child is _END:
+            stack.pop()
+            if post and stack:
+                post(node, depth, state)
+            continue
+        child_state = pre(child, depth + 1) if pre else None
+        if child_state is SKIP:
+            continue
+        stack.append((child, depth + 1, iter(children(child) or ()), child_state))
+
+
+def iter_tree(roots: Iterable, children: Callable[[Any], Optional[Iterable]]) -> Iterator:
+    """先序遍历所有节点,children 返回None或空时不再深入"""
+    stack = [iter(roots)]
+    while stack:
+        node = next(stack[-1], _END)
+        if node is _END:
+            stack.pop()
+            continue
+        yield node
+        stack.append(iter(children(node) or ()))